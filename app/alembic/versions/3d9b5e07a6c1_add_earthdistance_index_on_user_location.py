@@ -0,0 +1,37 @@
+"""add earthdistance index on user location
+
+Revision ID: 3d9b5e07a6c1
+Revises: e8a1f4b6c372
+Create Date: 2025-11-27 10:05:21.640117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d9b5e07a6c1'
+down_revision: Union[str, Sequence[str], None] = 'e8a1f4b6c372'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # earthdistance depends on cube; both ship with contrib
+    op.execute("CREATE EXTENSION IF NOT EXISTS cube")
+    op.execute("CREATE EXTENSION IF NOT EXISTS earthdistance")
+    op.create_index(
+        'idx_users_location_earth',
+        'users',
+        [sa.text('ll_to_earth(latitude, longitude)')],
+        unique=False,
+        postgresql_using='gist',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_users_location_earth', table_name='users', postgresql_using='gist')
@@ -0,0 +1,31 @@
+"""add random_key to users
+
+Revision ID: 6c0d3a8f51e2
+Revises: b41f7c2d9e15
+Create Date: 2025-11-25 09:47:03.552817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c0d3a8f51e2'
+down_revision: Union[str, Sequence[str], None] = 'b41f7c2d9e15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # volatile default → every existing row gets its own random key
+    op.add_column('users', sa.Column('random_key', sa.Float(), server_default=sa.text('random()'), nullable=False))
+    op.create_index(op.f('ix_users_random_key'), 'users', ['random_key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_random_key'), table_name='users')
+    op.drop_column('users', 'random_key')
@@ -0,0 +1,37 @@
+"""add conversation key index on messages
+
+Revision ID: a7c2e9d41b08
+Revises: 3d9b5e07a6c1
+Create Date: 2025-11-28 14:22:09.371554
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c2e9d41b08'
+down_revision: Union[str, Sequence[str], None] = '3d9b5e07a6c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'idx_messages_conversation_key',
+        'messages',
+        [
+            sa.text('least(sender_id, receiver_id)'),
+            sa.text('greatest(sender_id, receiver_id)'),
+            sa.text('created_at DESC'),
+        ],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_messages_conversation_key', table_name='messages')
@@ -0,0 +1,36 @@
+"""add hnsw index on profile embedding
+
+Revision ID: b41f7c2d9e15
+Revises: 321d9d699dea
+Create Date: 2025-11-24 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f7c2d9e15'
+down_revision: Union[str, Sequence[str], None] = '321d9d699dea'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # HNSW needs pgvector >= 0.5.0; vector_l2_ops matches the `<->` operator used by l2_distance()
+    op.create_index(
+        'idx_profiles_embedding_hnsw',
+        'profiles',
+        ['embedding'],
+        unique=False,
+        postgresql_using='hnsw',
+        postgresql_with={'m': 16, 'ef_construction': 64},
+        postgresql_ops={'embedding': 'vector_l2_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_profiles_embedding_hnsw', table_name='profiles', postgresql_using='hnsw')
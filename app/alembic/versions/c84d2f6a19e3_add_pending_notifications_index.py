@@ -0,0 +1,35 @@
+"""add pending notifications index
+
+Revision ID: c84d2f6a19e3
+Revises: f3e8b2a95d17
+Create Date: 2025-12-02 10:31:47.552806
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c84d2f6a19e3'
+down_revision: Union[str, Sequence[str], None] = 'f3e8b2a95d17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # partial: only rows still waiting for a push, so it stays small
+    op.create_index(
+        'idx_notifications_user_pending',
+        'notifications',
+        ['user_id', 'created_at', 'id'],
+        unique=False,
+        postgresql_where=sa.text('notified_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_notifications_user_pending', table_name='notifications')
@@ -0,0 +1,31 @@
+"""add content_hash to user_media
+
+Revision ID: d5a91c3e7f20
+Revises: c84d2f6a19e3
+Create Date: 2025-12-03 09:14:26.730158
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a91c3e7f20'
+down_revision: Union[str, Sequence[str], None] = 'c84d2f6a19e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NULL for rows stored before content addressing: they keep their original file
+    op.add_column('user_media', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_user_media_content_hash'), 'user_media', ['content_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_media_content_hash'), table_name='user_media')
+    op.drop_column('user_media', 'content_hash')
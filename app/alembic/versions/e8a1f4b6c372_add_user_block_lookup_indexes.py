@@ -0,0 +1,30 @@
+"""add user_blocks lookup indexes
+
+Revision ID: e8a1f4b6c372
+Revises: 6c0d3a8f51e2
+Create Date: 2025-11-26 11:12:40.218934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8a1f4b6c372'
+down_revision: Union[str, Sequence[str], None] = '6c0d3a8f51e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # both directions are probed by the recommendation anti-joins
+    op.create_index('idx_block_blocker_blocked', 'user_blocks', ['blocker_id', 'blocked_id'], unique=False)
+    op.create_index('idx_block_blocked_blocker', 'user_blocks', ['blocked_id', 'blocker_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_block_blocked_blocker', table_name='user_blocks')
+    op.drop_index('idx_block_blocker_blocked', table_name='user_blocks')
@@ -0,0 +1,103 @@
+"""add conversations table
+
+Revision ID: f3e8b2a95d17
+Revises: a7c2e9d41b08
+Create Date: 2025-11-30 16:40:12.904317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3e8b2a95d17'
+down_revision: Union[str, Sequence[str], None] = 'a7c2e9d41b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'conversations',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_a_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_b_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('last_message_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('last_message_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('unread_a', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('unread_b', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.CheckConstraint('user_a_id < user_b_id', name='ck_conversations_ordered_pair'),
+        sa.ForeignKeyConstraint(['user_a_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['user_b_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('idx_conversations_pair', 'conversations', ['user_a_id', 'user_b_id'], unique=True)
+    op.create_index('idx_conversations_b', 'conversations', ['user_b_id'], unique=False)
+
+    op.add_column('messages', sa.Column('conversation_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_foreign_key('messages_conversation_id_fkey', 'messages', 'conversations', ['conversation_id'], ['id'])
+
+    # backfill: one conversation per pair, latest message + unread counts per side
+    op.execute("""
+        INSERT INTO conversations (id, user_a_id, user_b_id, last_message_id, last_message_at, unread_a, unread_b, created_at)
+        SELECT
+            gen_random_uuid(),
+            LEAST(sender_id, receiver_id),
+            GREATEST(sender_id, receiver_id),
+            (array_agg(id ORDER BY created_at DESC, id DESC))[1],
+            max(created_at),
+            count(*) FILTER (WHERE NOT coalesce(is_read, false) AND receiver_id = LEAST(sender_id, receiver_id)),
+            count(*) FILTER (WHERE NOT coalesce(is_read, false) AND receiver_id = GREATEST(sender_id, receiver_id)),
+            min(created_at)
+        FROM messages
+        WHERE sender_id <> receiver_id
+        GROUP BY LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id)
+    """)
+    op.execute("""
+        UPDATE messages m
+        SET conversation_id = c.id
+        FROM conversations c
+        WHERE c.user_a_id = LEAST(m.sender_id, m.receiver_id)
+          AND c.user_b_id = GREATEST(m.sender_id, m.receiver_id)
+    """)
+    op.execute("""
+        UPDATE notifications n
+        SET conversation_id = c.id
+        FROM conversations c
+        WHERE n.type = 'message'
+          AND n.conversation_id IS NULL
+          AND n.actor_id IS NOT NULL
+          AND c.user_a_id = LEAST(n.user_id, n.actor_id)
+          AND c.user_b_id = GREATEST(n.user_id, n.actor_id)
+    """)
+
+    op.create_index('idx_messages_conversation_created', 'messages', ['conversation_id', 'created_at', 'id'], unique=False)
+    # superseded by conversations.last_message_id
+    op.drop_index('idx_messages_conversation_key', table_name='messages')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(
+        'idx_messages_conversation_key',
+        'messages',
+        [
+            sa.text('least(sender_id, receiver_id)'),
+            sa.text('greatest(sender_id, receiver_id)'),
+            sa.text('created_at DESC'),
+        ],
+        unique=False,
+    )
+    op.drop_index('idx_messages_conversation_created', table_name='messages')
+    op.execute("UPDATE notifications SET conversation_id = NULL WHERE type = 'message'")
+    op.drop_constraint('messages_conversation_id_fkey', 'messages', type_='foreignkey')
+    op.drop_column('messages', 'conversation_id')
+    op.drop_index('idx_conversations_b', table_name='conversations')
+    op.drop_index('idx_conversations_pair', table_name='conversations')
+    op.drop_table('conversations')
@@ -1,11 +1,12 @@
 # aureole/app/main.py
 import os
-import mimetypes, os
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from utils.config import settings
+from utils.broker import broker
+from utils.presence import presence
+from services.notification_outbox import notification_outbox
+from services.media_pipeline import media_pipeline
 from routers.auth_router import router as auth_router
 from routers.profile_router_01 import router as profile_setup_router
 from routers.profile_router_02 import router as profile_verification_router
@@ -19,10 +20,13 @@ from routers.report_router import router as report_router
 from routers.interaction_router import router as interaction_router
 from routers.coversation_router import router as conversation_router
 from routers.notification_ws import router as notification_ws_router
+from routers.realtime_router import router as realtime_router
 from routers.profile import router as profile
 from routers.insights_router import router as insight_router
 from routers.media_router import router as media_router
 from routers.rtc_router import router as rtc_router
+from routers.metrics_router import router as metrics_router
+from routers.uploads_router import router as uploads_router
 from web.signal.router import router as call_router
 
 
@@ -38,23 +42,8 @@ app = FastAPI(
 # Ensure directory exists
 os.makedirs("uploads", exist_ok=True)
 
-# Mount uploads as static files
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-
-@app.get("/uploads/chat/{filename}")
-async def serve_chat_audio(filename: str):
-    path = os.path.join("uploads/chat", filename)
-
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    # Critical fix for OPUS audio
-    if filename.endswith(".webm"):
-        return FileResponse(path, media_type="audio/webm; codecs=opus")
-
-    # Normal fallback for other media
-    mime, _ = mimetypes.guess_type(path)
-    return FileResponse(path, media_type=mime or "application/octet-stream")
+# Serve uploads (ETag / 304, Range, immutable caching for content-addressed files)
+app.include_router(uploads_router)
 
 
 
@@ -64,9 +53,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],
 )
 
 
+@app.on_event("startup")
+async def start_broker():
+    # cross-worker routing for chat, notification and call sockets
+    await broker.start()
+    await presence.start()
+    await notification_outbox.start()
+
+
+@app.on_event("shutdown")
+async def stop_broker():
+    await notification_outbox.stop()   # drain queued notifications while the broker is still up
+    await presence.stop()
+    await broker.stop()
+
+
+@app.on_event("shutdown")
+async def stop_media_pipeline():
+    await media_pipeline.stop()
+
+
 @app.get("/health")
 async def health_check():
     return {
@@ -95,8 +105,10 @@ app.include_router(profile, prefix="/api/v1")
 app.include_router(insight_router, prefix="/api/v1")
 app.include_router(media_router, prefix="/api/v1")
 app.include_router(rtc_router, prefix="/api/v1")
+app.include_router(metrics_router, prefix="/api/v1")
 
 # Include WebSocket router
 app.include_router(ws_router)
 app.include_router(notification_ws_router)
-app.include_router(call_router)
\ No newline at end of file
+app.include_router(call_router)
+app.include_router(realtime_router)
\ No newline at end of file
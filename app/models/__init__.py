@@ -3,7 +3,19 @@ from .base import Base
 from .user_model import User, VerificationAttempt, Notification
 from .profile_model import Profile
 from .match_model import Match, Swipe
-from .message_model import Message
+from .message_model import Message, Conversation
 from .block_model import UserBlock
 from .report_model import Report
 from .subscription_model import Subscription
+
+
+__all__ = [
+    "Base",
+    "User", "VerificationAttempt", "Notification",
+    "Profile",
+    "Match", "Swipe",
+    "Message", "Conversation",
+    "UserBlock",
+    "Report",
+    "Subscription",
+]
@@ -1,7 +1,7 @@
 # models/block_models.py
 
 # For blocking and hiding users
-from sqlalchemy import Column, Boolean, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, Boolean, DateTime, ForeignKey, Integer, Index
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.sql import func
 from .base import Base
@@ -13,4 +13,9 @@ class UserBlock(Base):
     blocker_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     blocked_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     hide_only = Column(Boolean, default=False)  # True = hide (user stays active), False = block
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("idx_block_blocker_blocked", "blocker_id", "blocked_id"),
+        Index("idx_block_blocked_blocker", "blocked_id", "blocker_id"),
+    )
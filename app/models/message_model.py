@@ -3,7 +3,7 @@
 import uuid
 from sqlalchemy import (
     Column, Text, Boolean, DateTime, ForeignKey, 
-    Index, Enum, JSON, Integer, String
+    Index, Enum, JSON, Integer, String, CheckConstraint
     )
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.sql import func
@@ -18,12 +18,37 @@ class MessageTypeEnum(str, enum.Enum):
     video = "video"
     system = "system"
 
+class Conversation(Base):
+    """One row per user pair; user_a_id is always the smaller UUID."""
+    __tablename__ = "conversations"
+
+    id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_a_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    user_b_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+
+    # denormalized inbox fields, kept in step by services/conversation_service.py
+    last_message_id = Column(PG_UUID(as_uuid=True), nullable=True)   # no FK: messages may be deleted
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    unread_a = Column(Integer, default=0, server_default="0", nullable=False)   # unread by user_a
+    unread_b = Column(Integer, default=0, server_default="0", nullable=False)   # unread by user_b
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+
+    __table_args__ = (
+        CheckConstraint("user_a_id < user_b_id", name="ck_conversations_ordered_pair"),
+        Index("idx_conversations_pair", "user_a_id", "user_b_id", unique=True),
+        Index("idx_conversations_b", "user_b_id"),
+    )
+
+
 class Message(Base):
     __tablename__ = "messages"
 
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     sender_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     receiver_id = Column(PG_UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    conversation_id = Column(PG_UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=True)
 
     # for backward compatibility keep content; for media messages content may be caption or empty
     content = Column(Text, nullable=True)
@@ -52,6 +77,7 @@ class Message(Base):
 # Indexes for fast conversation queries
 Index('idx_messages_conversation', Message.sender_id, Message.receiver_id, Message.created_at)
 Index('idx_messages_unread', Message.receiver_id, Message.is_read)
+Index('idx_messages_conversation_created', Message.conversation_id, Message.created_at, Message.id)
 
 
 
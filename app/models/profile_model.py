@@ -1,7 +1,7 @@
 # models/profile_model.py
 
 # AI-generated profile understanding
-from sqlalchemy import Column, Text, JSON, ForeignKey,Integer
+from sqlalchemy import Column, Text, JSON, ForeignKey, Integer, Index
 from pgvector.sqlalchemy import VECTOR # type: ignore 
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from .base import Base
@@ -21,6 +21,17 @@ class Profile(Base):
     embedding = Column(VECTOR(1536), nullable=True)  # OpenAI text-embedding-3-small
     last_edited_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=True)
 
+    __table_args__ = (
+        # ANN index for recommendation retrieval; opclass matches the `<->` (l2) operator used in scoring
+        Index(
+            "idx_profiles_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_l2_ops"},
+        ),
+    )
+
 
 class AIUsage(Base):
     __tablename__ = "ai_usage"
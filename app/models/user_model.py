@@ -49,11 +49,22 @@ class User(Base):
     last_active = Column(DateTime(timezone=True), server_default=func.now())
     token_version = Column(Integer, default=0, nullable=False)
 
+    # Discovery shuffling: uniform [0, 1) key for keyset-random sampling
+    random_key = Column(Float, nullable=False, server_default=func.random(), index=True)
+
 
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        # radius search for proximity mode (cube + earthdistance extensions)
+        Index(
+            "idx_users_location_earth",
+            func.ll_to_earth(latitude, longitude),
+            postgresql_using="gist",
+        ),
+    )
 
 
 class UserMedia(Base):
@@ -64,6 +75,7 @@ class UserMedia(Base):
     file_path = Column(String, nullable=False)
     media_type = Column(String, default="image")  # "image" or "video"
     is_verified = Column(Boolean, default=False)  # true for live/selfie verification
+    content_hash = Column(String(64), nullable=True, index=True)  # sha256 → uploads/media/<h[:2]>/<h>/ (variants)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -108,5 +120,11 @@ class Notification(Base):
 
     __table_args__ = (
         Index("idx_notifications_user_read", "user_id", "is_read"),
+        # keyset pages of a user's not-yet-pushed rows (replay on connect)
+        Index(
+            "idx_notifications_user_pending",
+            "user_id", "created_at", "id",
+            postgresql_where=notified_at.is_(None),
+        ),
     )
 
@@ -1,12 +1,13 @@
 # app/routers/conversation_router.py
 
 
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, Query, Response, status
+from typing import Optional
 from datetime import datetime, timezone
-from sqlalchemy import select, or_, and_, text
+from sqlalchemy import select, or_, and_, case, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-from models.message_model import Message,ChatMedia, MessageReaction
+from models.message_model import Message,ChatMedia, MessageReaction, Conversation
 from models.user_model import User
 from models.match_model import Match
 from db.session import get_db
@@ -16,6 +17,7 @@ from db.session import async_session
 from utils.socket_manager import manager
 
 # service functions (you saved in services/message_service.py)
+from services.conversation_service import get_conversation_between, get_message_page
 from services.message_service import (
     delete_message_service,
     upsert_reaction_service,
@@ -28,32 +30,47 @@ router = APIRouter(prefix="/session", tags=["messages"])
 @router.get("/messages/{partner_id}")
 async def get_conversation(
     partner_id: str,
+    response: Response,
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0),
+    before: Optional[str] = Query(None, description="X-Next-Cursor of a previous page → older messages"),
+    after: Optional[str] = Query(None, description="X-Prev-Cursor of a previous page → newer messages"),
+    around: Optional[UUID] = Query(None, description="message id to jump to"),
+    offset: int = Query(0, ge=0, description="deprecated, use cursors"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
+    """
+    Conversation history, oldest → newest within the page.
+    Paged on (created_at, id): X-Next-Cursor walks to older messages,
+    X-Prev-Cursor back to newer ones; both headers are absent at the ends.
+    """
     # -----------------------
-    # 1) Fetch messages + media (unchanged)
+    # 1) Fetch messages + media of this conversation
     # -----------------------
-    q = (
-        select(Message, ChatMedia)
-        .outerjoin(ChatMedia, ChatMedia.id == Message.media_id)
-        .where(
-            or_(
-                (Message.sender_id == current_user.id) &
-                (Message.receiver_id == partner_id),
-                (Message.sender_id == partner_id) &
-                (Message.receiver_id == current_user.id),
-            )
+    conversation = await get_conversation_between(db, current_user.id, partner_id)
+    if conversation is None:
+        return []
+
+    if offset and not (before or after or around):
+        # legacy OFFSET paging, kept for old clients
+        q = (
+            select(Message, ChatMedia)
+            .outerjoin(ChatMedia, ChatMedia.id == Message.media_id)
+            .where(Message.conversation_id == conversation.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(limit)
+            .offset(offset)
         )
-        .order_by(Message.created_at.desc())
-        .limit(limit)
-        .offset(offset)
-    )
+        rows = list(reversed((await db.execute(q)).all()))
+    else:
+        rows, older_cursor, newer_cursor = await get_message_page(
+            db, conversation.id, limit, before=before, after=after, around=around
+        )
+        if older_cursor:
+            response.headers["X-Next-Cursor"] = older_cursor
+        if newer_cursor:
+            response.headers["X-Prev-Cursor"] = newer_cursor
 
-    rows = (await db.execute(q)).all()
-    rows = list(reversed(rows))
     messages = [m for m, _ in rows]
     message_ids = [m.id for m in messages]
 
@@ -103,6 +120,8 @@ async def get_conversation(
             item["thumb_url"] = media.thumb_path
             item["file_type"] = media.file_type
             item["kind"] = media.kind
+            item["duration_ms"] = media.duration_ms
+            item["waveform"] = (media.meta or {}).get("waveform")
 
         output.append(item)
 
@@ -126,100 +145,84 @@ def is_recently_active(last_active_time, minutes=10):
     return (now - last_active_time).total_seconds() < (minutes * 60)
 
 
+def message_preview(message_type, content):
+    if message_type is None:
+        return None
+    if message_type == 'text':
+        return content
+    elif message_type == 'image':
+        return "📷 Photo"
+    elif message_type == 'video':
+        return "🎥 Video"
+    elif message_type == 'audio':
+        return "🎵 Audio"
+    return f"📎 {message_type.title()}"
+
+
 @router.get("/matches")
 async def get_matches(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Get all matches first
+    """
+    Conversation list in one round-trip: matches ⋈ partner users ⋈ conversations
+    (by ordered pair) ⋈ the conversation's last message by primary key.
+    """
+    partner_id = case(
+        (Match.user_id == current_user.id, Match.target_id),
+        else_=Match.user_id,
+    )
+    unread = case(
+        (Conversation.user_a_id == current_user.id, Conversation.unread_a),
+        else_=Conversation.unread_b,
+    )
+
     result = await db.execute(
-        select(Match).where(
+        select(
+            Match.id.label("match_id"),
+            Match.score,
+            User,
+            Message.content,
+            Message.message_type,
+            unread.label("unread_count"),
+        )
+        .join(User, User.id == partner_id)
+        .outerjoin(
+            Conversation,
             and_(
-                Match.is_active == True,
-                Match.is_mutual == True,
-                or_(Match.user_id == current_user.id, Match.target_id == current_user.id)
-            )
+                Conversation.user_a_id == func.least(Match.user_id, Match.target_id),
+                Conversation.user_b_id == func.greatest(Match.user_id, Match.target_id),
+            ),
+        )
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
+        .where(
+            Match.is_active == True,
+            Match.is_mutual == True,
+            or_(Match.user_id == current_user.id, Match.target_id == current_user.id),
         )
     )
-    matches = result.scalars().all()
-
-    # Get all partner IDs
-    partner_ids = []
-    for m in matches:
-        partner_id = m.target_id if m.user_id == current_user.id else m.user_id
-        partner_ids.append(partner_id)
-
-    # Fetch last messages for all conversations in one query
-    last_messages_query = text("""
-        SELECT DISTINCT ON (conversation_pair) 
-            sender_id, receiver_id, content, message_type, created_at,
-            CASE 
-                WHEN sender_id = :current_user_id THEN receiver_id
-                ELSE sender_id
-            END as other_user_id
-        FROM (
-            SELECT 
-                sender_id, receiver_id, content, message_type, created_at,
-                LEAST(sender_id, receiver_id) as min_id,
-                GREATEST(sender_id, receiver_id) as max_id,
-                CONCAT(LEAST(sender_id, receiver_id), '-', GREATEST(sender_id, receiver_id)) as conversation_pair
-            FROM messages 
-            WHERE (sender_id = :current_user_id OR receiver_id = :current_user_id)
-                AND (sender_id = ANY(:partner_ids) OR receiver_id = ANY(:partner_ids))
-            ORDER BY created_at DESC
-        ) as ordered_msgs
-        ORDER BY conversation_pair, created_at DESC
-    """)
-
-    last_messages_result = await db.execute(last_messages_query, {
-        "current_user_id": current_user.id,
-        "partner_ids": partner_ids
-    })
-    last_messages = last_messages_result.fetchall()
-
-    # Create a mapping of partner_id to last message
-    last_message_map = {}
-    for msg in last_messages:
-        other_user_id = str(msg.other_user_id)
-        last_message_map[other_user_id] = msg
 
     # Build the response
     serialized = []
-    for m in matches:
-        partner_id = m.target_id if m.user_id == current_user.id else m.user_id
-
-        partner_result = await db.execute(select(User).where(User.id == partner_id))
-        partner = partner_result.scalar_one()
-
-        # Get last message from our map
-        last_message = last_message_map.get(str(partner_id))
-        last_message_preview = None
-        if last_message:
-            if last_message.message_type == 'text':
-                last_message_preview = last_message.content
-            elif last_message.message_type == 'image':
-                last_message_preview = "📷 Photo"
-            elif last_message.message_type == 'video':
-                last_message_preview = "🎥 Video"
-            elif last_message.message_type == 'audio':
-                last_message_preview = "🎵 Audio"
-            else:
-                last_message_preview = f"📎 {last_message.message_type.title()}"
+    for row in result.all():
+        partner = row.User
+        message_type = getattr(row.message_type, "value", row.message_type)
 
         serialized.append({
-            "match_id": str(m.id),
+            "match_id": str(row.match_id),
             "partner_id": str(partner.id),
             "name": partner.full_name,
             "age": partner.age,
             "bio": partner.bio,
             "imageUrl": partner.verified_photo_path,
-            "compatibility": m.score,
+            "compatibility": row.score,
             "is_active": partner.is_active,
             "is_verified": partner.is_verified,
             "mutual_interests": [],
             "common_values": [],
             "last_active_at": str(partner.last_active) if partner.last_active else None,
-            "last_message_preview": last_message_preview,
+            "last_message_preview": message_preview(message_type, row.content),
+            "unread_count": row.unread_count or 0,
             "conversation_starters": [],
             # 🔥 FIXED: Use time-based online status instead of is_active
             "is_online": is_recently_active(partner.last_active, minutes=10),  # Online if active in last 10 minutes
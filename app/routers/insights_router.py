@@ -1,9 +1,9 @@
 # routers/insights.py
 
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import List, Optional
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from services.insights_service import (
@@ -15,6 +15,8 @@ from models.user_model import User
 from utils.deps import get_db, get_current_user  # adapt to your dependency names
 from models.profile_model import Profile  # adapt imports
 from utils.match_logic import fetch_mutual_matches
+from utils.sampling import RandomSampler
+from services.recommend_service import candidate_exclusions
 
 
 router = APIRouter(prefix="/insights", tags=["insights"])
@@ -42,10 +44,12 @@ async def starter_route(target_id: str = Query(...), db: AsyncSession = Depends(
 # 3) enriched match feed: /insights/me
 @router.get("/me")
 async def my_enriched_matches(
+    response: Response,
     limit: int = Query(20, ge=1, le=50),
     min_age: int = Query(18),
     max_age: int = Query(99),
     max_distance_km: int = Query(100),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
     current_user=Depends(get_current_user)
 ):
@@ -63,16 +67,18 @@ async def my_enriched_matches(
             User.is_profile_hidden.is_(False),
             User.age >= min_age,
             User.age <= max_age,
-            Profile.embedding.isnot(None)
+            Profile.embedding.isnot(None),
+            *candidate_exclusions(current_user.id),
         )
-        .order_by(func.random())
-        .limit(limit * 3)  # fetch extra to allow filtering
     )
-    res = await db.execute(candidates_stmt)
-    rows = res.all()
+    # keyset-random page, fetch extra to allow distance filtering
+    sampler = RandomSampler(User.random_key, cursor)
+    rows = await sampler.fetch(db, candidates_stmt, limit * 3)
 
     results = []
+    last_consumed = None
     for r in rows:
+        last_consumed = r
         # compute embedding similarity quickly using Postgres vector op if available
         try:
             sim_stmt = select( (1 - (Profile.embedding.l2_distance(profile.embedding))).label("similarity") ).where(Profile.user_id == r.id)
@@ -98,6 +104,9 @@ async def my_enriched_matches(
         if len(results) >= limit:
             break
 
+    if last_consumed is not None and (len(results) >= limit or len(rows) == limit * 3):
+        response.headers["X-Next-Cursor"] = sampler.cursor_after(last_consumed)
+
     # sort by internal heuristic: online first then by presence of compatibility text
     results.sort(key=lambda x: (not x["is_online"], 0 if x["compatibility_reason"] else 1))
     return results
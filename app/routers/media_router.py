@@ -1,28 +1,38 @@
 # routers/media_router.py
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.media_service import handle_media_upload
+from services.media_pipeline import media_pipeline, MediaQueueFull
 from models.user_model import User
 from utils.deps import get_current_user
+from utils.uploads import receive_upload, multipart_body
 from db.session import get_db
 
 
 router = APIRouter(prefix="/chat/media", tags=["chat-media"])
 
 
-@router.post("/upload")
+@router.post("/upload", openapi_extra=multipart_body())
 async def upload_chat_media(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    # Basic validation
-    if not file or not file.filename:
-        raise HTTPException(status_code=400, detail="No file uploaded")
+    # Backpressure: don't take files the worker pool can't get to
+    try:
+        media_pipeline.check_capacity()
+    except MediaQueueFull:
+        raise HTTPException(status_code=503, detail="Media processing is busy, try again shortly")
 
-    # Process and store media
-    media = await handle_media_upload(db, file)
+    # Stream the body to disk (sniffed type, size cap) – only now, after auth
+    upload = await receive_upload(request)
+
+    # Store file + row; thumbnails/metadata follow as a `media_processed` WS event
+    try:
+        media = await handle_media_upload(db, upload)
+    finally:
+        upload.discard()
 
     # Attach uploader ID (important)
     media.uploader_id = current_user.id
@@ -30,6 +40,8 @@ async def upload_chat_media(
     await db.commit()
     await db.refresh(media)
 
+    media_pipeline.submit(media)
+
     return {
         "media_id": str(media.id),
         "url": media.file_path,       # /uploads/chat/<uuid>.jpg
@@ -39,5 +51,5 @@ async def upload_chat_media(
         "width": media.width,
         "height": media.height,
         "duration_ms": media.duration_ms,
-        "processed": True,
+        "processed": media.processed,
     }
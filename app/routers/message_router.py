@@ -3,96 +3,388 @@
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketState
-from sqlalchemy import select
+from sqlalchemy import select, update, tuple_, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
 from models.message_model import Message, ChatMedia
 from moderation import schedule_post_moderation
+from services.conversation_service import encode_message_cursor, decode_message_cursor
+from services.message_service import mark_messages_read_service
 from services.ai_service import (
     generate_ai_replies_service,
     send_ai_reply_service,
     send_user_message_service,
+    mark_sent_service,
 )
+from services.notification_outbox import notification_outbox
+from services.typing_service import typing_aggregator
 from utils.socket_manager import manager
-from utils.ws_safe import safe_payload
+from utils.ws_codec import send_frame, receive_frame
 from db.session import async_session
 from datetime import datetime
 
 router = APIRouter()
 
 
-@router.websocket("/ws/chat/{user_id}")
-async def websocket_chat(websocket: WebSocket, user_id: str):
+REPLAY_WINDOW = 200   # pending messages replayed per round; the client asks for more
+REPLAY_CHUNK = 50     # messages per `messages_batch` frame
+
+
+def _message_payload(msg: Message, media: ChatMedia | None) -> dict:
+    return {
+        "type": "message",
+        "message_id": str(msg.id),
+        "sender_id": str(msg.sender_id),
+        "receiver_id": str(msg.receiver_id),
+        "content": msg.content,
+        "timestamp": msg.created_at.isoformat() if msg.created_at else None,
+        "message_type": msg.message_type.value,
+        "media_id": str(msg.media_id) if msg.media_id else None,
+        "media_url": media.file_path if media else None,
+        "thumb_url": media.thumb_path if media else None,
+        "duration_ms": media.duration_ms if media else None,
+        "waveform": (media.meta or {}).get("waveform") if media else None,
+    }
+
+
+async def replay_pending(websocket: WebSocket, user_id: str, batch: bool, cursor: str | None = None) -> str | None:
     """
-    Main WebSocket handler for chat.
+    Deliver undelivered messages (OFFLINE → ONLINE), oldest first, at most REPLAY_WINDOW per call.
+
+    - one query with media joined in, one UPDATE ... WHERE id = ANY(:ids) for delivery
+    - batch=True: `messages_batch` frames of REPLAY_CHUNK messages to this socket and one
+      `delivery_receipt` per sender; batch=False keeps the per-message frames of old clients
+    Returns the cursor of the next window if more are pending (batch clients also get it
+    as a `replay_more` event and ask for it with `fetch_pending`).
     """
+    async with async_session() as db:
+        q = (
+            select(Message, ChatMedia)
+            .outerjoin(ChatMedia, ChatMedia.id == Message.media_id)
+            .where(Message.receiver_id == user_id, Message.is_delivered == False)
+        )
+        if cursor:
+            q = q.where(tuple_(Message.created_at, Message.id) > tuple_(*decode_message_cursor(cursor)))
+        rows = (await db.execute(
+            q.order_by(Message.created_at, Message.id).limit(REPLAY_WINDOW + 1)
+        )).all()
+
+        has_more = len(rows) > REPLAY_WINDOW
+        rows = rows[:REPLAY_WINDOW]
+        delivered: list[Message] = []
+
+        if batch:
+            for start in range(0, len(rows), REPLAY_CHUNK):
+                if websocket.client_state != WebSocketState.CONNECTED:
+                    break
+                chunk = rows[start:start + REPLAY_CHUNK]
+                try:
+                    await send_frame(websocket, {
+                        "type": "messages_batch",
+                        "messages": [_message_payload(m, media) for m, media in chunk],
+                    })
+                except Exception as e:
+                    print(f"⚠️ Error delivering pending batch: {e}")
+                    break
+                delivered.extend(m for m, _ in chunk)
+        else:
+            for msg, media in rows:
+                if websocket.client_state != WebSocketState.CONNECTED:
+                    break
+                if await manager.send_personal_message(str(msg.receiver_id), _message_payload(msg, media)):
+                    delivered.append(msg)
+
+        if not delivered:
+            return None
+
+        await db.execute(
+            update(Message)
+            .where(Message.id == any_(bindparam("ids", [m.id for m in delivered], type_=ARRAY(PG_UUID(as_uuid=True)))))
+            .values(is_delivered=True)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    # 📬 Delivery receipts to senders
+    if batch:
+        by_sender: dict[str, list[str]] = {}
+        for m in delivered:
+            by_sender.setdefault(str(m.sender_id), []).append(str(m.id))
+        for sender_id, ids in by_sender.items():
+            await manager.send_personal_message(sender_id, {
+                "type": "delivery_receipt",
+                "message_ids": ids,
+                "message_id": ids[-1],   # older clients read a single id
+            })
+    else:
+        for m in delivered:
+            await manager.send_personal_message(str(m.sender_id), {
+                "type": "delivery_receipt",
+                "message_id": str(m.id),
+            })
+
+    if not has_more or len(delivered) < len(rows):
+        return None
+
+    next_cursor = encode_message_cursor(delivered[-1])
+    if batch and websocket.client_state == WebSocketState.CONNECTED:
+        await send_frame(websocket, {"type": "replay_more", "cursor": next_cursor})
+    return next_cursor
+
+
+async def replay_on_connect(websocket: WebSocket, user_id: str, batch_replay: bool) -> None:
+    try:
+        next_cursor = await replay_pending(websocket, user_id, batch_replay)
+        # old clients don't know `fetch_pending`: keep going window by window
+        while next_cursor and not batch_replay:
+            next_cursor = await replay_pending(websocket, user_id, batch_replay, next_cursor)
+    except Exception as e:
+        print(f"❌ Pending delivery error: {e}")
 
-    await manager.connect(user_id, websocket)
 
-    # -------------------------------------------------------
-    # 1️⃣ Deliver pending messages (OFFLINE → ONLINE)
-    # -------------------------------------------------------
-    async with async_session() as db:
+async def handle_chat_event(websocket: WebSocket, user_id: str, data: dict, batch_replay: bool) -> None:
+    """
+    One client → server chat event. Shared by /ws/chat and the `chat`
+    channel of /ws/connect; `websocket` only receives direct replies.
+    """
+    event_type = data.get("type")
+    if not event_type:
+        await send_frame(websocket, {"type": "error", "message": "Missing type"})
+        return
+
+    if event_type not in ("typing", "stop_typing"):
+        print(f"📥 {user_id} → {event_type}: {data}")
+
+    # ---------------------------------------------------
+    # 🎯 Send normal or media message (PATCHED SAFELY)
+    # ---------------------------------------------------
+    if event_type == "message":
         try:
-            pending_result = await db.execute(
-                select(Message)
-                .where(Message.receiver_id == user_id, Message.is_delivered == False)
-                .order_by(Message.created_at)
+            receiver_id = data["receiver_id"]
+            message_type = data.get("message_type", "text")
+            raw_content = data.get("content")
+            media_id = data.get("media_id")
+
+            if raw_content is None:
+                await send_frame(websocket, {
+                    "type": "error",
+                    "message": "Missing content field"
+                })
+                return
+
+            content = raw_content if isinstance(raw_content, str) else str(raw_content)
+
+            # -----------------------------
+            # 1️⃣ SAVE MESSAGE + NOTIFICATION (one transaction)
+            # -----------------------------
+            async with async_session() as db:
+                sent_msg = await send_user_message_service(
+                    db,
+                    sender_id=user_id,
+                    receiver_id=receiver_id,
+                    content=content,
+                    message_type=message_type,
+                    media_id=media_id,
+                )
+            new_msg = sent_msg.message
+
+            # -----------------------------
+            # 2️⃣ PUSH MESSAGE (notification goes through the outbox)
+            # -----------------------------
+            notification_outbox.add(sent_msg.notification, persisted=True)
+
+            payload = {
+                "type": "message",
+                "message_id": str(new_msg.id),
+                "sender_id": str(user_id),
+                "receiver_id": str(receiver_id),
+                "content": content,
+                "message_type": message_type,
+                "media_id": media_id,
+                "media_url": sent_msg.media_url,
+                "thumb_url": sent_msg.thumb_url,
+                "timestamp": new_msg.created_at.isoformat() if new_msg.created_at else None,
+            }
+
+            sent = await manager.send_personal_message(
+                str(receiver_id), payload
             )
-            pending_messages = pending_result.scalars().all()
 
-            delivered_count = 0
+            # -----------------------------
+            # 3️⃣ DELIVERED FLAG
+            # -----------------------------
+            if sent:
+                async with async_session() as db:
+                    await mark_sent_service(
+                        db, new_msg.id, sent_msg.notification["id"],
+                        delivered=True, notified=False,
+                    )
+                await manager.send_personal_message(str(user_id), {
+                    "type": "delivery_receipt",
+                    "message_id": str(new_msg.id),
+                })
 
-            for msg in pending_messages:
-                try:
-                    if websocket.client_state != WebSocketState.CONNECTED:
-                        break
-
-                    media_url = None
-                    thumb_url = None
-
-                    if msg.media_id:
-                        m = (
-                            await db.execute(
-                                select(ChatMedia).where(ChatMedia.id == msg.media_id)
-                            )
-                        ).scalar_one_or_none()
-                        if m:
-                            media_url = m.file_path
-                            thumb_url = m.thumb_path
-
-                    payload = safe_payload({
-                        "type": "message",
-                        "message_id": str(msg.id),
-                        "sender_id": str(msg.sender_id),
-                        "receiver_id": str(msg.receiver_id),
-                        "content": msg.content,
-                        "timestamp": msg.created_at.isoformat() if msg.created_at else None,
-                        "message_type": msg.message_type.value,
-                        "media_id": str(msg.media_id) if msg.media_id else None,
-                        "media_url": media_url,
-                        "thumb_url": thumb_url,
+            else:
+                print(f"📭 Receiver {receiver_id} offline → queued")
+
+            # -----------------------------
+            # 5️⃣ Post-delivery moderation
+            # -----------------------------
+            if message_type == "text" and content:
+                schedule_post_moderation(
+                    message_id=new_msg.id,
+                    content=content,
+                    receiver_id=receiver_id,
+                    sender_id=user_id,
+                )
+
+        except Exception as e:
+            print(f"💥 Error sending message: {e}")
+            await send_frame(websocket, {"type": "error", "message": str(e)})
+
+    # ---------------------------------------------------
+    # AI suggestions
+    # ---------------------------------------------------
+    elif event_type == "ai_request":
+        try:
+            original_msg_id = data["original_message_id"]
+            tone = data.get("tone", "flirty")
+
+            async with async_session() as db:
+                result = await db.execute(
+                    select(Message).where(Message.id == original_msg_id)
+                )
+                msg = result.scalar_one_or_none()
+
+                if not msg:
+                    await send_frame(websocket, {
+                        "type": "error",
+                        "message": "Original message not found"
                     })
+                    return
 
-                    sent = await manager.send_personal_message(
-                        str(msg.receiver_id), payload
-                    )
+                ai_response = await generate_ai_replies_service(
+                    db, user_id, msg.id, tone)
 
-                    if sent:
-                        msg.is_delivered = True
-                        delivered_count += 1
+                await send_frame(websocket, {
+                    "type": "ai_suggestions",
+                    "original_message_id": original_msg_id,
+                    "replies": ai_response.get("replies", []),
+                    "remaining_today": ai_response.get("remaining_today"),
+                })
 
-                        await manager.send_personal_message(str(msg.sender_id), {
-                            "type": "delivery_receipt",
-                            "message_id": str(msg.id),
-                        })
+        except Exception as e:
+            print(f"💥 AI request failed: {e}")
+            await send_frame(websocket, {"type": "error", "message": str(e)})
 
-                except Exception as e:
-                    print(f"⚠️ Error delivering pending message {msg.id}: {e}")
+    # ---------------------------------------------------
+    # AI reply selected
+    # ---------------------------------------------------
+    elif event_type == "ai_selected":
+        try:
+            receiver_id = data["receiver_id"]
+            content = data["content"]
+
+            async with async_session() as db:
+                new_msg = await send_ai_reply_service(
+                    db, sender_id=user_id, receiver_id=receiver_id, content=content
+                )
+
+            payload = {
+                "type": "message",
+                "message_id": str(new_msg.id),
+                "sender_id": str(user_id),
+                "receiver_id": str(receiver_id),
+                "content": content,
+                "timestamp": new_msg.created_at.isoformat() if new_msg.created_at else None,
+            }
+
+            sent = await manager.send_personal_message(str(receiver_id), payload)
+
+            if sent:
+                async with async_session() as db:
+                    msg_row = await db.get(Message, new_msg.id)
+                    msg_row.is_delivered = True
+                    await db.commit()
+
+                await manager.send_personal_message(str(user_id), {
+                    "type": "delivery_receipt",
+                    "message_id": str(new_msg.id),
+                })
 
-            if delivered_count:
-                await db.commit()
+        except Exception as e:
+            print(f"💥 AI reply failed: {e}")
+            await send_frame(websocket, {"type": "error", "message": str(e)})
+
+    # ---------------------------------------------------
+    # Next replay window (after `replay_more`)
+    # ---------------------------------------------------
+    elif event_type == "fetch_pending":
+        try:
+            await replay_pending(websocket, user_id, batch_replay, data.get("cursor"))
+        except Exception as e:
+            print(f"💥 Pending replay error: {e}")
+            await send_frame(websocket, {"type": "error", "message": "Could not fetch pending messages"})
+
+    # ---------------------------------------------------
+    # Read receipts
+    # ---------------------------------------------------
+    elif event_type == "read_receipt":
+        # {"message_ids": [...]} or watermark form {"up_to": "<message_id>"}
+        try:
+            async with async_session() as db:
+                read_by_sender = await mark_messages_read_service(
+                    db, user_id,
+                    message_ids=data.get("message_ids"),
+                    up_to=data.get("up_to"),
+                )
+
+            for sender_id, ids in read_by_sender.items():
+                await manager.send_personal_message(sender_id, {
+                    "type": "read_receipt",
+                    "message_ids": ids,
+                    "reader_id": user_id,
+                })
 
         except Exception as e:
-            print(f"❌ Pending delivery error: {e}")
+            print(f"💥 Read receipt error: {e}")
+
+    # ---------------------------------------------------
+    # Typing indicator (debounced; expires on its own)
+    # ---------------------------------------------------
+    elif event_type == "typing":
+        receiver_id = data.get("receiver_id")
+        if receiver_id:
+            await typing_aggregator.typing(user_id, receiver_id)
+
+    # ---------------------------------------------------
+    # Stop typing
+    # ---------------------------------------------------
+    elif event_type == "stop_typing":
+        receiver_id = data.get("receiver_id")
+        if receiver_id:
+            typing_aggregator.stop_typing(user_id, receiver_id)
+
+    else:
+        await send_frame(websocket, {
+            "type": "error",
+            "message": f"Unknown event type: {event_type}"
+        })
+
+
+@router.websocket("/ws/chat/{user_id}")
+async def websocket_chat(websocket: WebSocket, user_id: str, replay: str = "message"):
+    """
+    Main WebSocket handler for chat.
+    `?replay=batch` switches offline replay to chunked `messages_batch` frames.
+    """
+
+    await manager.connect(user_id, websocket, channels={"chat"})
+    batch_replay = replay == "batch"
+
+    # -------------------------------------------------------
+    # 1️⃣ Deliver pending messages (OFFLINE → ONLINE)
+    # -------------------------------------------------------
+    await replay_on_connect(websocket, user_id, batch_replay)
 
     # -------------------------------------------------------
     # 2️⃣ MAIN EVENT LOOP
@@ -101,7 +393,7 @@ async def websocket_chat(websocket: WebSocket, user_id: str):
         while websocket.client_state == WebSocketState.CONNECTED:
 
             try:
-                data = await websocket.receive_json()
+                data = await receive_frame(websocket)
             except WebSocketDisconnect:
                 break
             except Exception:
@@ -110,244 +402,7 @@ async def websocket_chat(websocket: WebSocket, user_id: str):
             if not isinstance(data, dict):
                 continue
 
-            event_type = data.get("type")
-            if not event_type:
-                await websocket.send_json({"type": "error", "message": "Missing type"})
-                continue
-
-            print(f"📥 {user_id} → {event_type}: {data}")
-
-            # ---------------------------------------------------
-            # 🎯 Send normal or media message (PATCHED SAFELY)
-            # ---------------------------------------------------
-            if event_type == "message":
-                try:
-                    receiver_id = data["receiver_id"]
-                    message_type = data.get("message_type", "text")
-                    raw_content = data.get("content")
-                    media_id = data.get("media_id")
-
-                    if raw_content is None:
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": "Missing content field"
-                        })
-                        continue
-
-                    content = raw_content if isinstance(raw_content, str) else str(raw_content)
-
-                    # -----------------------------
-                    # 1️⃣ SAVE MESSAGE (DB ONLY)
-                    # -----------------------------
-                    async with async_session() as db:
-                        new_msg = await send_user_message_service(
-                            db,
-                            sender_id=user_id,
-                            receiver_id=receiver_id,
-                            content=content,
-                            message_type=message_type,
-                            media_id=media_id,
-                        )
-
-                    # -----------------------------
-                    # 2️⃣ FETCH MEDIA (NO DB WRITE)
-                    # -----------------------------
-                    media_url = None
-                    thumb_url = None
-
-                    if media_id:
-                        async with async_session() as db:
-                            m = (
-                                await db.execute(
-                                    select(ChatMedia).where(ChatMedia.id == media_id)
-                                )
-                            ).scalar_one_or_none()
-                            if m:
-                                media_url = m.file_path
-                                thumb_url = m.thumb_path
-
-                    # -----------------------------
-                    # 3️⃣ WS PAYLOAD OUTSIDE DB
-                    # -----------------------------
-                    payload = safe_payload({
-                        "type": "message",
-                        "message_id": str(new_msg.id),
-                        "sender_id": str(user_id),
-                        "receiver_id": str(receiver_id),
-                        "content": content,
-                        "message_type": message_type,
-                        "media_id": media_id,
-                        "media_url": media_url,
-                        "thumb_url": thumb_url,
-                        "timestamp": new_msg.created_at.isoformat() if new_msg.created_at else None,
-                    })
-
-                    sent = await manager.send_personal_message(
-                        str(receiver_id), payload
-                    )
-
-                    # -----------------------------
-                    # 4️⃣ UPDATE DELIVERY STATUS
-                    # -----------------------------
-                    if sent:
-                        async with async_session() as db:
-                            msg_row = await db.get(Message, new_msg.id)
-                            msg_row.is_delivered = True
-                            await db.commit()
-
-                        await manager.send_personal_message(str(user_id), {
-                            "type": "delivery_receipt",
-                            "message_id": str(new_msg.id),
-                        })
-
-                    else:
-                        print(f"📭 Receiver {receiver_id} offline → queued")
-
-                    # -----------------------------
-                    # 5️⃣ Post-delivery moderation
-                    # -----------------------------
-                    if message_type == "text" and content:
-                        schedule_post_moderation(
-                            message_id=new_msg.id,
-                            content=content,
-                            receiver_id=receiver_id,
-                            sender_id=user_id,
-                        )
-
-                except Exception as e:
-                    print(f"💥 Error sending message: {e}")
-                    await websocket.send_json({"type": "error", "message": str(e)})
-
-            # ---------------------------------------------------
-            # AI suggestions
-            # ---------------------------------------------------
-            elif event_type == "ai_request":
-                try:
-                    original_msg_id = data["original_message_id"]
-                    tone = data.get("tone", "flirty")
-
-                    async with async_session() as db:
-                        result = await db.execute(
-                            select(Message).where(Message.id == original_msg_id)
-                        )
-                        msg = result.scalar_one_or_none()
-
-                        if not msg:
-                            await websocket.send_json({
-                                "type": "error",
-                                "message": "Original message not found"
-                            })
-                            continue
-
-                        ai_response = await generate_ai_replies_service(
-                            db, user_id, msg.id, tone)
-
-                        await websocket.send_json({
-                            "type": "ai_suggestions",
-                            "original_message_id": original_msg_id,
-                            "replies": ai_response.get("replies", []),
-                            "remaining_today": ai_response.get("remaining_today"),
-                        })
-
-                except Exception as e:
-                    print(f"💥 AI request failed: {e}")
-                    await websocket.send_json({"type": "error", "message": str(e)})
-
-            # ---------------------------------------------------
-            # AI reply selected
-            # ---------------------------------------------------
-            elif event_type == "ai_selected":
-                try:
-                    receiver_id = data["receiver_id"]
-                    content = data["content"]
-
-                    async with async_session() as db:
-                        new_msg = await send_ai_reply_service(
-                            db, sender_id=user_id, receiver_id=receiver_id, content=content
-                        )
-
-                    payload = safe_payload({
-                        "type": "message",
-                        "message_id": str(new_msg.id),
-                        "sender_id": str(user_id),
-                        "receiver_id": str(receiver_id),
-                        "content": content,
-                        "timestamp": new_msg.created_at.isoformat() if new_msg.created_at else None,
-                    })
-
-                    sent = await manager.send_personal_message(str(receiver_id), payload)
-
-                    if sent:
-                        async with async_session() as db:
-                            msg_row = await db.get(Message, new_msg.id)
-                            msg_row.is_delivered = True
-                            await db.commit()
-
-                        await manager.send_personal_message(str(user_id), {
-                            "type": "delivery_receipt",
-                            "message_id": str(new_msg.id),
-                        })
-
-                except Exception as e:
-                    print(f"💥 AI reply failed: {e}")
-                    await websocket.send_json({"type": "error", "message": str(e)})
-
-            # ---------------------------------------------------
-            # Read receipts
-            # ---------------------------------------------------
-            elif event_type == "read_receipt":
-                try:
-                    ids = data.get("message_ids", [])
-                    async with async_session() as db:
-                        updated = 0
-                        for msg_id in ids:
-                            result = await db.execute(
-                                select(Message).where(Message.id == msg_id)
-                            )
-                            msg = result.scalar_one_or_none()
-
-                            if msg and msg.receiver_id == user_id and not msg.is_read:
-                                msg.is_read = True
-                                updated += 1
-
-                                await manager.send_personal_message(str(msg.sender_id), {
-                                    "type": "read_receipt",
-                                    "message_ids": [str(msg.id)],
-                                })
-
-                        if updated:
-                            await db.commit()
-
-                except Exception as e:
-                    print(f"💥 Read receipt error: {e}")
-
-            # ---------------------------------------------------
-            # Typing indicator
-            # ---------------------------------------------------
-            elif event_type == "typing":
-                receiver_id = data.get("receiver_id")
-                if receiver_id:
-                    await manager.send_personal_message(
-                        str(receiver_id),
-                        {"type": "typing", "from": user_id}
-                    )
-
-            # ---------------------------------------------------
-            # Stop typing
-            # ---------------------------------------------------
-            elif event_type == "stop_typing":
-                receiver_id = data.get("receiver_id")
-                if receiver_id:
-                    await manager.send_personal_message(
-                        str(receiver_id),
-                        {"type": "stop_typing", "from": user_id}
-                    )
-
-            else:
-                await websocket.send_json({
-                    "type": "error",
-                    "message": f"Unknown event type: {event_type}"
-                })
+            await handle_chat_event(websocket, user_id, data, batch_replay)
 
     # -------------------------------------------------------
     # 3️⃣ Cleanup
@@ -357,4 +412,6 @@ async def websocket_chat(websocket: WebSocket, user_id: str):
 
     finally:
         print("🔥 ROUTER FINALLY REACHED FOR:", user_id)
-        await manager.disconnect(user_id, websocket)
\ No newline at end of file
+        await manager.disconnect(user_id, websocket)
+        if user_id not in manager.online_users:
+            typing_aggregator.forget_sender(user_id)
\ No newline at end of file
@@ -0,0 +1,30 @@
+# routers/metrics_router.py
+
+
+from fastapi import APIRouter, Depends
+from utils.deps import get_current_user
+from utils.socket_manager import manager
+from services.typing_service import typing_aggregator
+from services.candidate_queue import candidate_queue
+from services.notification_outbox import notification_outbox
+from services.media_pipeline import media_pipeline
+from services.media_files import media_files
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+# In-process counters of this worker; each worker reports its own.
+@router.get("/realtime")
+async def realtime_metrics(current_user=Depends(get_current_user)):
+    return {
+        "sockets": {
+            "users": len(manager.active_connections),
+            "connections": sum(len(c) for c in manager.active_connections.values()),
+        },
+        "typing": typing_aggregator.stats(),
+        "candidate_queue": candidate_queue.stats(),
+        "notification_outbox": notification_outbox.stats(),
+        "media_pipeline": media_pipeline.stats(),
+        "media_files": media_files.stats(),
+    }
@@ -2,89 +2,227 @@
 
 from starlette.websockets import WebSocketState
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from utils.socket_manager import manager
-from utils.ws_safe import safe_payload
-from sqlalchemy import select
+from utils.socket_manager import manager, NOTIFICATIONS
+from utils.ws_codec import send_frame, JSON
+from sqlalchemy import select, update, func, tuple_, any_, bindparam, String
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID, aggregate_order_by
 from datetime import datetime, timezone
+from typing import Iterable, Optional, Set
 from db.session import async_session
 from models.user_model import Notification
+from services.notification_service import notification_event
 
 router = APIRouter(prefix="/ws", tags=["WebSocket"])
 
 
-@router.websocket("/notifications/{user_id}")
-async def websocket_notifications(websocket: WebSocket, user_id: str, token: str = Query(None)):
-
-    # 1️⃣ Accept + register socket
-    await manager.connect(user_id, websocket)
-    print(f"✅ [WS] Notification channel established for {user_id}")
-
-    # 2️⃣ Replay queued notifications with SAFE serialization
+NOTIFICATION_REPLAY_CAP = 200     # rows replayed per round; the rest is summarised
+NOTIFICATION_REPLAY_PAGE = 50     # rows per keyset page, notified_at committed per page
+GROUP_PREVIEW_ACTORS = 3          # names shown in a collapsed group
+
+# `?collapse=view,like` turns a type's pending rows into one notification_group frame
+GROUP_PREVIEW = {
+    "view": "{actors} people viewed you",
+    "like": "{actors} people liked you",
+    "swipe_like": "{actors} people right-swiped you",
+    "message": "{count} new messages",
+    "message_reaction": "{count} new reactions",
+}
+
+
+def parse_collapse(value: Optional[str]) -> Set[str]:
+    return {t.strip() for t in (value or "").split(",") if t.strip()}
+
+
+def _pending(user_id: str):
+    return (Notification.user_id == user_id, Notification.notified_at.is_(None))
+
+
+def is_fetch_request(msg) -> bool:
+    """{"type": "fetch_notifications"} asks for the next replay round; anything else is a ping."""
+    if isinstance(msg, str):
+        try:
+            msg = JSON.decode(msg)
+        except Exception:
+            return False
+    return isinstance(msg, dict) and msg.get("type") == "fetch_notifications"
+
+
+async def _mark_notified(db, ids) -> None:
+    await db.execute(
+        update(Notification)
+        .where(Notification.id == any_(bindparam("ids", list(ids), type_=ARRAY(PG_UUID(as_uuid=True)))))
+        .values(notified_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+async def _replay_groups(websocket: WebSocket, db, user_id: str, types: Set[str]) -> Set[str]:
+    """One notification_group frame per collapsible type with 2+ pending rows; returns the types sent."""
+    newest_first = Notification.created_at.desc()
+    groups = (await db.execute(
+        select(
+            Notification.type,
+            func.count().label("count"),
+            func.count(Notification.actor_id.distinct()).label("actors"),
+            func.max(Notification.created_at).label("latest"),
+            func.array_agg(aggregate_order_by(Notification.actor_id, newest_first))[1:GROUP_PREVIEW_ACTORS].label("actor_ids"),
+            func.array_agg(aggregate_order_by(Notification.actor_name, newest_first))[1:GROUP_PREVIEW_ACTORS].label("actor_names"),
+        )
+        .where(*_pending(user_id), Notification.type == any_(bindparam("types", list(types), type_=ARRAY(String))))
+        .group_by(Notification.type)
+        .having(func.count() > 1)
+    )).all()
+
+    sent: Set[str] = set()
+    for g in groups:
+        if websocket.client_state != WebSocketState.CONNECTED:
+            break
+        preview = GROUP_PREVIEW.get(g.type, "{count} new notifications")
+        try:
+            await send_frame(websocket, {
+                "event": "notification_group",
+                "data": {
+                    "type": g.type,
+                    "count": g.count,
+                    "actor_count": g.actors,
+                    "actor_ids": [str(a) for a in g.actor_ids if a],
+                    "actor_names": [n for n in g.actor_names if n],
+                    "message_preview": preview.format(count=g.count, actors=g.actors or g.count),
+                    "timestamp": g.latest.isoformat(),
+                },
+            })
+        except Exception as e:
+            print(f"⚠️ Failed group replay for {user_id}: {e}")
+            break
+
+        # rows that arrive after the query are pushed live by the outbox
+        await db.execute(
+            update(Notification)
+            .where(*_pending(user_id), Notification.type == g.type, Notification.created_at <= g.latest)
+            .values(notified_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        sent.add(g.type)
+    return sent
+
+
+async def replay_notifications(websocket: WebSocket, user_id: str, collapse: Iterable[str] = ()) -> None:
+    """
+    Push notifications that never reached a socket. Shared with /ws/connect.
+
+    - keyset pages of NOTIFICATION_REPLAY_PAGE over idx_notifications_user_pending,
+      oldest first; notified_at is committed after every page, so a dropped
+      socket only replays what was not sent yet
+    - at most NOTIFICATION_REPLAY_CAP rows per round; anything left gets one
+      `notification_summary` frame ("and 340 more") and stays pending – the
+      client asks for the next round with {"type": "fetch_notifications"}
+    - types in `collapse` are sent as one `notification_group` frame each
+    """
+    collapse = set(collapse)
     try:
         async with async_session() as db:
-
-            result = await db.execute(
-                select(Notification).where(
-                    Notification.user_id == user_id,
-                    Notification.notified_at.is_(None)
-                )
-            )
-
-            pending = result.scalars().all()
-
-            if pending:
-                print(f"📬 Replaying {len(pending)} pending notifications for {user_id}")
-                now = datetime.now(timezone.utc)
-
-                for notif in pending:
-
-                    # --- FIX: convert UUIDs + datetimes to str ---
-                    safe_data = safe_payload({
-                        "id": str(notif.id),
-                        "type": notif.type,
-                        "actor_id": str(notif.actor_id) if notif.actor_id else None,
-                        "actor_name": notif.actor_name,
-                        "target_id": str(notif.target_id) if notif.target_id else None,
-                        "conversation_id": str(notif.conversation_id) if notif.conversation_id else None,
-                        "message_preview": notif.message_preview,
-                        "timestamp": notif.created_at.isoformat(),
-                        "payload": notif.payload,   # already JSON-safe from insert
-                    })
-
+            grouped = await _replay_groups(websocket, db, user_id, collapse) if collapse else set()
+
+            base = select(Notification).where(*_pending(user_id))
+            if grouped:
+                base = base.where(Notification.type.notin_(grouped))
+
+            sent, cursor = 0, None
+            while sent < NOTIFICATION_REPLAY_CAP:
+                q = base
+                if cursor:
+                    q = q.where(tuple_(Notification.created_at, Notification.id) > tuple_(*cursor))
+                limit = min(NOTIFICATION_REPLAY_PAGE, NOTIFICATION_REPLAY_CAP - sent)
+                page = (await db.execute(
+                    q.order_by(Notification.created_at, Notification.id).limit(limit)
+                )).scalars().all()
+                if not page:
+                    break
+
+                delivered = []
+                for notif in page:
+                    if websocket.client_state != WebSocketState.CONNECTED:
+                        break
                     try:
-                        await websocket.send_json({
-                            "event": "notification",
-                            "data": safe_data
-                        })
-
-                        # mark delivered
-                        notif.notified_at = now
-                        db.add(notif)
-
+                        await send_frame(websocket, notification_event(notif))
                     except Exception as e:
                         print(f"⚠️ Failed replay for {user_id}: {e}")
-
-                await db.commit()
+                        break
+                    delivered.append(notif.id)
+
+                if delivered:
+                    await _mark_notified(db, delivered)
+                sent += len(delivered)
+                if len(delivered) < len(page):
+                    return      # socket went away; the rest stays pending
+                if len(page) < limit:
+                    break
+                cursor = (page[-1].created_at, page[-1].id)
+
+            if sent:
+                print(f"📬 Replayed {sent} pending notifications for {user_id}")
+            if sent < NOTIFICATION_REPLAY_CAP or not cursor:
+                return
+
+            # ➕ "and N more"
+            remaining = (await db.execute(
+                base.with_only_columns(Notification.type, func.count())
+                .where(tuple_(Notification.created_at, Notification.id) > tuple_(*cursor))
+                .group_by(Notification.type)
+            )).all()
+            if remaining and websocket.client_state == WebSocketState.CONNECTED:
+                await send_frame(websocket, {
+                    "event": "notification_summary",
+                    "data": {
+                        "remaining": sum(n for _, n in remaining),
+                        "by_type": {t: n for t, n in remaining},
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                    },
+                })
 
     except Exception as e:
         print(f"⚠️ Replay error for {user_id}: {e}")
 
-    # 3️⃣ Heartbeat loop
+
+@router.websocket("/notifications/{user_id}")
+async def websocket_notifications(
+    websocket: WebSocket,
+    user_id: str,
+    token: str = Query(None),
+    collapse: str = Query(None),
+):
+    collapse_types = parse_collapse(collapse)
+
+    # 1️⃣ Accept + register socket
+    await manager.connect(user_id, websocket, channels={NOTIFICATIONS})
+    print(f"✅ [WS] Notification channel established for {user_id}")
+
+    # 2️⃣ Replay queued notifications (paged, capped)
+    await replay_notifications(websocket, user_id, collapse_types)
+
+    # 3️⃣ Heartbeat loop (+ next replay round on request)
     try:
         while True:
             msg = await websocket.receive_text()
+
+            if is_fetch_request(msg):
+                await replay_notifications(websocket, user_id, collapse_types)
+                continue
+
             print(f"🔄 [WS] Ping from {user_id}: {msg}")
 
             if websocket.application_state == WebSocketState.CONNECTED:
-                await websocket.send_json({
+                await send_frame(websocket, {
                     "event": "heartbeat",
                     "timestamp": datetime.utcnow().isoformat()
                 })
 
     except WebSocketDisconnect:
-        manager.disconnect(user_id, websocket)
+        await manager.disconnect(user_id, websocket)
         print(f"❌ [WS] Notification channel closed for {user_id}")
 
     except Exception as e:
-        manager.disconnect(user_id, websocket)
-        print(f"⚠️ [WS] Error for {user_id}: {e}")
\ No newline at end of file
+        await manager.disconnect(user_id, websocket)
+        print(f"⚠️ [WS] Error for {user_id}: {e}")
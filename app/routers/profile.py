@@ -1,18 +1,20 @@
 # routers/profile.py
 
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, Depends, Request, HTTPException, Form
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from uuid import UUID
 from datetime import datetime
-import os, shutil
+import os
 
 from models.user_model import User, UserMedia
 from models.profile_model import Profile
 from schemas.profile_schema import UserProfileOut, ProfileUpdate, MediaOut
 from utils.deps import get_current_user
 from db.session import get_db
+from services.profile_media_service import receive_profile_media, save_profile_media, release_content
+from utils.uploads import multipart_body
 
 router = APIRouter(prefix="/getprofile", tags=["Get Profile"])
 
@@ -120,39 +122,18 @@ async def set_avatar(
 
 
 # 🟣 3. POST /profile/media
-@router.post("/media", response_model=MediaOut)
+@router.post("/media", response_model=MediaOut, openapi_extra=multipart_body())
 async def upload_media(
-    file: UploadFile = File(...),
+    request: Request,
     media_type: str = "image",
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    allowed_types = ["image/jpeg", "image/png", "video/mp4"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="Only JPEG, PNG, or MP4 allowed")
+    # Streamed in after auth, then content-addressed + WebP/AVIF ladder
+    # (media_type follows the file's magic bytes)
+    upload = await receive_profile_media(request)
+    media_entry, _ = await save_profile_media(db, current_user.id, upload)
 
-    upload_dir = "uploads/"
-    os.makedirs(upload_dir, exist_ok=True)
-
-    # Save file to disk
-    file_name = f"{current_user.id}_{file.filename}"
-    file_path = os.path.join(upload_dir, file_name)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # ✅ Construct a public URL for frontend access
-    base_url = "http://127.0.0.1:8000"
-    file_url = f"{base_url}/uploads/{file_name}"
-
-    # Store the public URL instead of a relative path
-    media_entry = UserMedia(
-        user_id=current_user.id,
-        file_path=file_url,
-        media_type=media_type,
-    )
-
-    db.add(media_entry)
     await db.commit()
     await db.refresh(media_entry)
 
@@ -176,14 +157,16 @@ async def delete_media(
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
 
-    # remove file
-    try:
-        os.remove(media.file_path)
-    except FileNotFoundError:
-        pass
+    # remove file (content-addressed files may be shared by another row)
+    if not media.content_hash:
+        try:
+            os.remove(media.file_path)
+        except FileNotFoundError:
+            pass
 
     await db.delete(media)
     await db.commit()
+    await release_content(db, media.content_hash)
     return {"status": "ok", "deleted_id": str(media_id)}
 
 
@@ -9,6 +9,7 @@ from db.session import get_db
 from models.profile_model import Profile
 from utils.config import settings
 from utils.deps import get_current_user  # returns User object
+from services.candidate_queue import candidate_queue
 
 router = APIRouter(prefix="/profile", tags=["Profile AI Processing"])
 
@@ -79,6 +80,7 @@ async def run_ai_profile_process(db: AsyncSession, user):
     profile.embedding = emb_response.data[0].embedding
 
     await db.commit()
+    await candidate_queue.invalidate(user.id)
     return {"summary": summary, "preferences": preferences}
 
 
@@ -11,6 +11,7 @@ from sqlalchemy import select
 from db.session import get_db
 from models.user_model import User
 from utils.deps import get_current_user
+from services.candidate_queue import candidate_queue
 
 router = APIRouter(prefix="/profile", tags=["Profile Location"])
 
@@ -39,6 +40,7 @@ async def update_location(
         user.latitude = None
         user.longitude = None
         await db.commit()
+        await candidate_queue.invalidate(user_id)
         return {"msg": "Location sharing disabled"}
 
     # --- Update if coords provided ---
@@ -46,6 +48,7 @@ async def update_location(
         user.latitude = payload.latitude
         user.longitude = payload.longitude
         await db.commit()
+        await candidate_queue.invalidate(user_id)
         return {
             "msg": "Location updated successfully",
             "latitude": user.latitude,
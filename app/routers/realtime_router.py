@@ -0,0 +1,167 @@
+# routers/realtime_router.py
+
+
+from datetime import datetime
+from typing import Any, Dict, Set
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
+from utils.socket_manager import manager, CHAT, NOTIFICATIONS
+from utils.ws_codec import send_frame, receive_frame
+from services.typing_service import typing_aggregator
+from routers.message_router import handle_chat_event, replay_on_connect
+from routers.notification_ws import replay_notifications, parse_collapse, is_fetch_request
+from web.signal.manager import call_signal_manager
+from web.signal.router import authenticate_websocket, handle_call_message, send_call_init
+from web.services.call_service import call_service
+
+
+router = APIRouter(prefix="/ws", tags=["WebSocket"])
+
+CALL = "call"
+CHANNELS = (CHAT, NOTIFICATIONS, CALL)
+
+
+class ChannelSocket:
+    """
+    One channel's view of the multiplexed socket: direct replies written by the
+    shared handlers (utils.ws_codec.send_frame) get tagged with the channel.
+    """
+
+    def __init__(self, websocket: WebSocket, channel: str) -> None:
+        self.websocket = websocket
+        self.channel = channel
+
+    @property
+    def client_state(self):
+        return self.websocket.client_state
+
+    @property
+    def application_state(self):
+        return self.websocket.application_state
+
+
+class _Session:
+    """Channel bookkeeping of one /ws/connect connection."""
+
+    def __init__(self, websocket: WebSocket, user_id: str, batch_replay: bool, collapse: Set[str]) -> None:
+        self.websocket = websocket
+        self.user_id = user_id
+        self.batch_replay = batch_replay
+        self.collapse = collapse
+        self.views = {ch: ChannelSocket(websocket, ch) for ch in CHANNELS}
+        self.channels: Set[str] = set()
+
+    async def subscribe(self, channels) -> None:
+        for ch in [c for c in channels if c in CHANNELS and c not in self.channels]:
+            self.channels.add(ch)
+            if ch == CALL:
+                await call_signal_manager.register_connection(self.user_id, self.views[CALL])
+                await send_call_init(self.user_id)
+                continue
+
+            manager.subscribe(self.websocket, {ch})
+            if ch == CHAT:
+                await replay_on_connect(self.views[CHAT], self.user_id, self.batch_replay)
+            else:
+                await replay_notifications(self.views[NOTIFICATIONS], self.user_id, self.collapse)
+
+    async def unsubscribe(self, channels) -> None:
+        for ch in [c for c in channels if c in self.channels]:
+            self.channels.discard(ch)
+            if ch == CALL:
+                await call_signal_manager.unregister_connection(self.user_id, self.views[CALL])
+                await call_service.handle_disconnect(self.user_id)
+            else:
+                manager.unsubscribe(self.websocket, {ch})
+
+    async def dispatch(self, data: Dict[str, Any]) -> None:
+        channel = data.get("channel")
+
+        if channel is None:
+            await self.control(data)
+        elif channel not in self.channels:
+            await send_frame(self.websocket, {"type": "error", "message": f"Not subscribed to '{channel}'"})
+        elif channel == CHAT:
+            await handle_chat_event(self.views[CHAT], self.user_id, data, self.batch_replay)
+        elif channel == CALL:
+            await handle_call_message(self.views[CALL], self.user_id, data)
+        elif is_fetch_request(data):
+            await replay_notifications(self.views[NOTIFICATIONS], self.user_id, self.collapse)
+        else:
+            # otherwise the notification channel is push-only; anything from the client is a ping
+            await send_frame(self.views[NOTIFICATIONS], {
+                "event": "heartbeat",
+                "timestamp": datetime.utcnow().isoformat(),
+            })
+
+    async def control(self, data: Dict[str, Any]) -> None:
+        kind = data.get("type")
+        if kind == "subscribe":
+            await self.subscribe(data.get("channels") or [])
+        elif kind == "unsubscribe":
+            await self.unsubscribe(data.get("channels") or [])
+        elif kind == "ping":
+            await send_frame(self.websocket, {"type": "pong"})
+            return
+        else:
+            await send_frame(self.websocket, {"type": "error", "message": f"Unknown control type: {kind}"})
+            return
+        await send_frame(self.websocket, {"type": "subscribed", "channels": sorted(self.channels)})
+
+    async def close(self) -> None:
+        if CALL in self.channels:
+            await call_signal_manager.unregister_connection(self.user_id, self.views[CALL])
+            await call_service.handle_disconnect(self.user_id)
+        await manager.disconnect(self.user_id, self.websocket)
+        if self.user_id not in manager.online_users:
+            typing_aggregator.forget_sender(self.user_id)
+
+
+@router.websocket("/connect")
+async def websocket_connect(
+    websocket: WebSocket,
+    channels: str = ",".join(CHANNELS),
+    replay: str = "message",
+    collapse: str = None,
+):
+    """
+    One socket for chat, notifications and call signaling.
+
+    Auth once with `?token=` (or the token as subprotocol), pick channels with
+    `?channels=chat,notifications,call` and change them later with
+    {"type": "subscribe" | "unsubscribe", "channels": [...]}.
+    `?collapse=view,like` groups those notification types on replay.
+    Client frames carry "channel"; every server frame is tagged with its channel,
+    and events are only sent for subscribed channels.
+    """
+    user, err = await authenticate_websocket(websocket)
+    if err or not user:
+        await websocket.close(code=1008, reason=err or "Unauthorized")
+        return
+
+    user_id = str(user.id)
+    subprotocol = None if websocket.query_params.get("token") else websocket.scope["subprotocols"][0]
+
+    await manager.connect(user_id, websocket, channels=(), subprotocol=subprotocol)
+    session = _Session(websocket, user_id, batch_replay=replay == "batch", collapse=parse_collapse(collapse))
+
+    try:
+        await session.subscribe([c.strip() for c in channels.split(",")])
+        await send_frame(websocket, {"type": "subscribed", "channels": sorted(session.channels)})
+
+        while websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                data = await receive_frame(websocket)
+            except WebSocketDisconnect:
+                break
+            except Exception:
+                continue
+
+            if isinstance(data, dict):
+                await session.dispatch(data)
+
+    except WebSocketDisconnect:
+        pass
+
+    finally:
+        await session.close()
@@ -0,0 +1,31 @@
+# routers/uploads_router.py
+
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from services.media_files import media_files
+
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+# Replaces the StaticFiles mount: same URLs, plus ETag / 304, long-lived
+# Cache-Control and per-file Content-Type (see services/media_files.py)
+@router.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_upload(path: str, request: Request):
+    file = media_files.resolve(path, request.headers.get("accept", ""))
+    if file is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # 1️⃣ Conditional GET: the cached copy is still good
+    if media_files.not_modified(file, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=file.headers)
+
+    # 2️⃣ Full body or Range (206 / 416, If-Range against our ETag)
+    media_files.record(ranged="range" in request.headers)
+    return FileResponse(
+        file.path,
+        media_type=await media_files.content_type(file),
+        headers=file.headers,
+        stat_result=file.stat,
+    )
@@ -1,14 +1,15 @@
 # schemas/match_schema.py
 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class MatchFilters(BaseModel):
     max_distance_km: float = 50.0
     min_age: int = 18
     max_age: int = 100
-    limit: int = 20
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = None   # opaque, from X-Next-Cursor
 
 class MatchResponse(BaseModel):
     user_id: str
@@ -17,4 +18,4 @@ class MatchResponse(BaseModel):
     bio: str
     match_score: int  # 0-100
     distance_km: Optional[float] = None
-    photos: List[str] = []     # new
\ No newline at end of file
+    photos: List[str] = []     # WebP variant URLs: "card" (480px) in single-photo feeds, "gallery" (1080px) otherwise
\ No newline at end of file
@@ -2,18 +2,24 @@
 
 import json
 import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
 from fastapi import HTTPException
 from datetime import datetime, timezone
 from db.session import client
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert, update, literal, cast, func, String, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from models.profile_model import Profile, AIUsage
 from utils.premium_utils import is_premium_user
-from models.message_model import Message
+from models.message_model import Message, ChatMedia
 from models.user_model import Notification, User
 from utils.config import settings
 from utils.prompts import AI_PROFILE_SYSTEM_PROMPT, make_compatibility_user_prompt, make_single_user_prompt
-from services.notification_service import create_and_push_notification, assert_can_send
+from services.notification_service import (
+    create_and_push_notification, notification_row, block_state_columns, raise_if_blocked,
+)
+from services.conversation_service import record_message, conversation_upsert
 
 
 
@@ -90,6 +96,10 @@ async def run_ai_profile_process(db: AsyncSession, user):
 
     await db.commit()
 
+    # New embedding → precomputed candidate queues are stale
+    from services.candidate_queue import candidate_queue
+    await candidate_queue.invalidate(user.id)
+
     return {
         "summary": summary,
         "mini_traits": mini_traits,
@@ -171,6 +181,7 @@ async def send_ai_reply_service(
         is_delivered=False,
         is_read=False
     )
+    conversation_id = await record_message(db, new_msg)
     db.add(new_msg)
     await db.commit()
     await db.refresh(new_msg)
@@ -181,6 +192,7 @@ async def send_ai_reply_service(
         recipient_id=receiver_id,
         notif_type="message",
         actor_id=sender_id,
+        conversation_id=conversation_id,
         message_preview=content,
     )
 
@@ -218,6 +230,22 @@ async def get_ai_usage_service(db: AsyncSession, user_id: str):
 # ---------------------------------------------
 # NORMAL USER MESSAGE SERVICE
 # ---------------------------------------------
+PREVIEW_MAP = {
+    "image": "📷 Photo",
+    "video": "🎥 Video",
+    "audio": "🎵 Audio",
+    "file":  "📄 File",
+}
+
+
+@dataclass
+class SentMessage:
+    message: Message                 # detached row (id, created_at, conversation_id filled)
+    notification: Dict[str, Any]     # column values of the message notification
+    media_url: Optional[str] = None
+    thumb_url: Optional[str] = None
+
+
 async def send_user_message_service(
     db: AsyncSession,
     sender_id: str,
@@ -225,44 +253,123 @@ async def send_user_message_service(
     content: str,
     message_type: str = "text",
     media_id: str = None
-):
-    print("SERVICE INPUT content =", repr(content))
-
-    await assert_can_send(db, sender_id, receiver_id)
+) -> SentMessage:
+    """
+    Store a chat message in one transaction and two round-trips:
+
+    1. one SELECT: both block directions, sender name, media urls
+    2. one statement: conversation upsert → message INSERT → notification INSERT
+       (data-modifying CTEs), RETURNING the message timestamp; then commit
+
+    Pushing and the delivered/notified flags are left to the caller (mark_sent_service).
+    """
+    # 1️⃣ Everything we need to know before writing
+    media_cols = []
+    if media_id:
+        media_cols = [
+            select(ChatMedia.file_path).where(ChatMedia.id == media_id).scalar_subquery().label("media_url"),
+            select(ChatMedia.thumb_path).where(ChatMedia.id == media_id).scalar_subquery().label("thumb_url"),
+        ]
+    lookup = (await db.execute(
+        select(
+            *block_state_columns(sender_id, receiver_id),
+            select(User.full_name).where(User.id == sender_id).scalar_subquery().label("actor_name"),
+            *media_cols,
+        )
+    )).one()
+    raise_if_blocked(lookup)
+
+    # 2️⃣ Conversation, message and notification in one statement
+    message_id = uuid.uuid4()
+    conv = conversation_upsert(sender_id, receiver_id, message_id).cte("conv")
+
+    message_values = {
+        "id": message_id,
+        "sender_id": sender_id,
+        "receiver_id": receiver_id,
+        "content": content,
+        "message_type": message_type,
+        "media_id": media_id,
+        "is_delivered": False,
+        "is_read": False,
+    }
+    msg = (
+        insert(Message)
+        .from_select(
+            [*message_values, "conversation_id"],
+            select(*_typed_literals(Message, message_values), conv.c.id),
+        )
+        .returning(Message.created_at, Message.conversation_id)
+        .cte("msg")
+    )
 
-    new_msg = Message(
-        id=uuid.uuid4(),
-        sender_id=sender_id,
-        receiver_id=receiver_id,
-        content=content,
-        message_type=message_type,
-        media_id=media_id,
-        is_delivered=False,
-        is_read=False
+    notification = notification_row(
+        receiver_id, "message",
+        actor_id=sender_id,
+        actor_name=lookup.actor_name,
+        message_preview=PREVIEW_MAP.get(message_type, content),
+    )
+    notification_values = {k: v for k, v in notification.items() if k not in ("conversation_id", "payload")}
+    # payload snapshot gets the conversation id once the upsert has produced it
+    payload = cast(
+        cast(literal(notification["payload"], JSON), JSONB).op("||")(
+            func.jsonb_build_object("conversation_id", cast(msg.c.conversation_id, String))
+        ),
+        JSON,
+    )
+    notif = (
+        insert(Notification)
+        .from_select(
+            [*notification_values, "payload", "conversation_id"],
+            select(*_typed_literals(Notification, notification_values), payload, msg.c.conversation_id),
+        )
+        .cte("notif")
     )
 
-    db.add(new_msg)
+    row = (await db.execute(
+        select(msg.c.created_at, msg.c.conversation_id).add_cte(notif)
+    )).one()
     await db.commit()
-    await db.refresh(new_msg)
 
-    preview_map = {
-        "text": content,
-        "image": "📷 Photo",
-        "video": "🎥 Video",
-        "audio": "🎵 Audio",
-        "file":  "📄 File",
-    }
+    notification["conversation_id"] = row.conversation_id
+    notification["payload"]["conversation_id"] = str(row.conversation_id)
 
-    preview = preview_map.get(message_type, content)
+    return SentMessage(
+        message=Message(**message_values, conversation_id=row.conversation_id, created_at=row.created_at),
+        notification=notification,
+        media_url=getattr(lookup, "media_url", None),
+        thumb_url=getattr(lookup, "thumb_url", None),
+    )
 
-    await create_and_push_notification(
-        db=db,
-        recipient_id=receiver_id,
-        notif_type="message",
-        actor_id=sender_id,
-        message_preview=preview,
+
+def _typed_literals(model, values: Dict[str, Any]) -> list:
+    """Bind `values` with the column types of `model` (enums, JSON, UUIDs)."""
+    return [literal(v, model.__table__.c[k].type).label(k) for k, v in values.items()]
+
+
+async def mark_sent_service(
+    db: AsyncSession,
+    message_id,
+    notification_id,
+    delivered: bool,
+    notified: bool,
+) -> None:
+    """Flip messages.is_delivered and notifications.notified_at in a single statement."""
+    set_delivered = update(Message).where(Message.id == message_id).values(is_delivered=True)
+    set_notified = (
+        update(Notification)
+        .where(Notification.id == notification_id)
+        .values(notified_at=datetime.now(timezone.utc))
     )
 
-    print("SERVICE AFTER SAVE new_msg.content =", repr(new_msg.content))
+    if delivered and notified:
+        stmt = set_notified.add_cte(set_delivered.returning(Message.id).cte("delivered"))
+    elif delivered:
+        stmt = set_delivered
+    elif notified:
+        stmt = set_notified
+    else:
+        return
 
-    return new_msg
+    await db.execute(stmt)
+    await db.commit()
@@ -0,0 +1,207 @@
+# services/candidate_queue.py
+
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import async_session
+from utils.broker import broker
+from models.user_model import User
+from schemas.match_schema import MatchFilters, MatchResponse
+from services.recommend_service import (
+    get_proximity_first, get_compatibility_first_recommendations,
+    get_boosted_tier_recommendations, get_age_filtered_recommendations,
+    get_discovery_window, rank_discovery_page,
+)
+
+
+QUEUE_DEPTH = 100            # ranked candidates precomputed per (user, mode)
+QUEUE_LOW_WATER = 25         # refill in the background below this many
+QUEUE_TTL_SECONDS = 600      # rebuild even without invalidation after this
+MAX_QUEUED_KEYS = 5000       # LRU bound on (user, mode, params) entries
+
+
+class _Slot(NamedTuple):
+    match: MatchResponse
+    score: float
+    cursor: Optional[str] = None     # discovery only: resumes after this candidate
+
+
+def _ranked(matches: List[MatchResponse]) -> List[_Slot]:
+    return [_Slot(m, m.match_score) for m in matches]
+
+
+# -------------------------------
+# Builders: same service functions the endpoints used,
+# so scores and ordering are identical to a fresh computation.
+# -------------------------------
+async def _build_discovery(db, user, depth, **p):
+    # kept in sampled order; each page is ranked on the way out (see serve)
+    entries = await get_discovery_window(db, user, MatchFilters(limit=depth, **p))
+    return [_Slot(e.match, e.score, e.cursor) for e in entries]
+
+async def _build_proximity(db, user, depth, **p):
+    return _ranked(await get_proximity_first(db, user, limit=depth, **p))
+
+async def _build_compatibility(db, user, depth, **p):
+    return _ranked(await get_compatibility_first_recommendations(db, user, limit=depth))
+
+async def _build_boosted(db, user, depth, **p):
+    return _ranked(await get_boosted_tier_recommendations(db, user, limit=depth))
+
+async def _build_filtered(db, user, depth, **p):
+    return _ranked(await get_age_filtered_recommendations(db, user, limit=depth, **p))
+
+
+BUILDERS = {
+    "discovery": _build_discovery,
+    "proximity": _build_proximity,
+    "compatibility": _build_compatibility,
+    "boosted": _build_boosted,
+    "filtered": _build_filtered,
+}
+
+
+QueueKey = Tuple[str, str, tuple]
+
+
+@dataclass
+class _Queue:
+    items: List[_Slot]
+    built_at: float
+    exhausted: bool              # the build came back short: nothing more to fetch
+    refreshing: bool = False
+    dropped: Set[str] = field(default_factory=set)   # discarded since built; kept out of the next refresh
+
+
+class CandidateQueue:
+    """
+    In-process cache of ranked candidates per active user and mode.
+
+    - serve() answers from the queue in O(limit); a miss builds it inline once.
+    - Swipes drop a single candidate; location / embedding changes drop the
+      user's queues; anything else ages out after QUEUE_TTL_SECONDS. Both are
+      published to the other workers, which hold queues of their own.
+    - Queues running low are rebuilt in the background on their own session,
+      unless the last build already returned everything there was.
+    - Discovery keeps its sampled order, so a queued page still comes with
+      the cursor a fresh request would have returned.
+    """
+
+    def __init__(self) -> None:
+        self._queues: "OrderedDict[QueueKey, _Queue]" = OrderedDict()
+        self._tasks: set = set()
+        self._counters = {"hits": 0, "builds": 0, "refreshes": 0, "refresh_failures": 0, "refreshes_dropped": 0}
+
+        broker.on("candidate.discard", self._discard_remote)
+        broker.on("candidate.invalidate", self._invalidate_remote)
+
+    @staticmethod
+    def _key(user_id, mode: str, params: Dict) -> QueueKey:
+        frozen = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in params.items()))
+        return (str(user_id), mode, frozen)
+
+    # ───────────── Serving ─────────────
+
+    async def serve(
+        self,
+        db: AsyncSession,
+        user: User,
+        mode: str,
+        limit: int,
+        **params,
+    ) -> Tuple[List[MatchResponse], Optional[str]]:
+        """Returns (page, next_cursor); the cursor is only set for discovery."""
+        key = self._key(user.id, mode, params)
+        queue = self._queues.get(key)
+
+        if queue is None or time.monotonic() - queue.built_at > QUEUE_TTL_SECONDS:
+            self._counters["builds"] += 1
+            items = await BUILDERS[mode](db, user, QUEUE_DEPTH, **params)
+            queue = self._store(key, items)
+        else:
+            self._counters["hits"] += 1
+            self._queues.move_to_end(key)
+
+        if len(queue.items) < QUEUE_LOW_WATER and not queue.exhausted and not queue.refreshing:
+            queue.refreshing = True
+            task = asyncio.create_task(self._refresh(key, queue, user, mode, params))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        page = queue.items[:limit]
+        if mode != "discovery":
+            return [s.match for s in page], None
+
+        # resume after the last candidate served, unless nothing is left beyond it
+        more = len(page) == limit or not queue.exhausted
+        return rank_discovery_page(page), (page[-1].cursor if page and more else None)
+
+    def _store(self, key: QueueKey, items: List[_Slot]) -> _Queue:
+        queue = _Queue(items=list(items), built_at=time.monotonic(), exhausted=len(items) < QUEUE_DEPTH)
+        self._queues[key] = queue
+        self._queues.move_to_end(key)
+        while len(self._queues) > MAX_QUEUED_KEYS:
+            self._queues.popitem(last=False)
+        return queue
+
+    async def _refresh(self, key: QueueKey, queue: _Queue, user: User, mode: str, params: Dict) -> None:
+        self._counters["refreshes"] += 1
+        try:
+            async with async_session() as db:
+                items = await BUILDERS[mode](db, user, QUEUE_DEPTH, **params)
+            # skip if invalidated or rebuilt meanwhile — the next request rebuilds with fresh state
+            if self._queues.get(key) is not queue:
+                self._counters["refreshes_dropped"] += 1
+                return
+            # the snapshot may predate swipes / blocks discarded while it was built
+            self._store(key, [s for s in items if s.match.user_id not in queue.dropped])
+        except Exception as e:
+            self._counters["refresh_failures"] += 1
+            print(f"⚠️ Candidate queue refresh failed for {key[0]} ({mode}): {e!r}")
+            queue.refreshing = False
+
+    # ───────────── Invalidation ─────────────
+
+    async def discard(self, user_id, candidate_id) -> None:
+        """Drop one candidate from every queue of `user_id` on every worker (after a swipe / block)."""
+        uid, cid = str(user_id), str(candidate_id)
+        self._discard(uid, cid)
+        await broker.publish("candidate.discard", {"user_id": uid, "candidate_id": cid})
+
+    async def invalidate(self, user_id) -> None:
+        """Drop all queues of `user_id` on every worker (location, embedding or swipe-history change)."""
+        uid = str(user_id)
+        self._invalidate(uid)
+        await broker.publish("candidate.invalidate", {"user_id": uid})
+
+    def _discard(self, uid: str, cid: str) -> None:
+        for key, queue in list(self._queues.items()):
+            if key[0] == uid:
+                queue.items = [s for s in queue.items if s.match.user_id != cid]
+                queue.dropped.add(cid)
+
+    def _invalidate(self, uid: str) -> None:
+        for key in [k for k in self._queues if k[0] == uid]:
+            self._queues.pop(key, None)
+
+    async def _discard_remote(self, data: Dict[str, Any], src: str) -> None:
+        self._discard(data["user_id"], data["candidate_id"])
+
+    async def _invalidate_remote(self, data: Dict[str, Any], src: str) -> None:
+        self._invalidate(data["user_id"])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self._counters,
+            "queues": len(self._queues),
+            "users": len({k[0] for k in self._queues}),
+            "candidates": sum(len(q.items) for q in self._queues.values()),
+            "refreshing": len(self._tasks),
+        }
+
+
+candidate_queue = CandidateQueue()
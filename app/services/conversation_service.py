@@ -0,0 +1,217 @@
+# services/conversation_service.py
+
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.message_model import Conversation, Message, ChatMedia
+
+
+# Every write here runs in the caller's transaction (no commit), so the
+# conversation row changes atomically with the message it describes.
+
+
+def ordered_pair(user_x, user_y) -> Tuple[UUID, UUID]:
+    """(user_a_id, user_b_id) for a pair — uuid ordering matches Postgres."""
+    x, y = UUID(str(user_x)), UUID(str(user_y))
+    return (x, y) if x < y else (y, x)
+
+
+# ------------- LOOKUPS -----------------
+
+async def get_conversation_between(db: AsyncSession, user_x, user_y) -> Optional[Conversation]:
+    a, b = ordered_pair(user_x, user_y)
+    return await db.scalar(
+        select(Conversation).where(Conversation.user_a_id == a, Conversation.user_b_id == b)
+    )
+
+
+async def get_last_message_between(db: AsyncSession, user_x, user_y) -> Optional[Message]:
+    """Latest message of a pair via conversations.last_message_id (one indexed read)."""
+    a, b = ordered_pair(user_x, user_y)
+    return await db.scalar(
+        select(Message)
+        .join(Conversation, Conversation.last_message_id == Message.id)
+        .where(Conversation.user_a_id == a, Conversation.user_b_id == b)
+    )
+
+
+# ------------- WRITES -----------------
+
+def conversation_upsert(sender_id, receiver_id, message_id):
+    """
+    INSERT .. ON CONFLICT that makes `message_id` the pair's latest message and bumps
+    the receiver's unread counter. RETURNING conversations.id; usable as a CTE.
+    """
+    a, b = ordered_pair(sender_id, receiver_id)
+    to_a = 1 if UUID(str(receiver_id)) == a else 0
+
+    stmt = insert(Conversation).values(
+        user_a_id=a,
+        user_b_id=b,
+        last_message_id=message_id,
+        last_message_at=func.now(),
+        unread_a=to_a,
+        unread_b=1 - to_a,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Conversation.user_a_id, Conversation.user_b_id],
+        set_={
+            "last_message_id": stmt.excluded.last_message_id,
+            "last_message_at": stmt.excluded.last_message_at,
+            "unread_a": Conversation.unread_a + stmt.excluded.unread_a,
+            "unread_b": Conversation.unread_b + stmt.excluded.unread_b,
+            "updated_at": func.now(),
+        },
+    ).returning(Conversation.id)
+
+
+async def record_message(db: AsyncSession, msg: Message) -> UUID:
+    """
+    Upsert the pair's conversation with `msg` as its latest message and bump the
+    receiver's unread counter, then attach msg.conversation_id. Does not commit.
+    """
+    stmt = conversation_upsert(msg.sender_id, msg.receiver_id, msg.id)
+    conversation_id = (await db.execute(stmt)).scalar_one()
+    msg.conversation_id = conversation_id
+    return conversation_id
+
+
+async def mark_read(db: AsyncSession, reader_id, partner_id, count: int) -> None:
+    """`count` messages from partner were just read by reader. Does not commit."""
+    if count <= 0:
+        return
+    a, b = ordered_pair(reader_id, partner_id)
+    unread = Conversation.unread_a if UUID(str(reader_id)) == a else Conversation.unread_b
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.user_a_id == a, Conversation.user_b_id == b)
+        .values({unread: func.greatest(unread - count, 0)})
+    )
+
+
+async def forget_message(db: AsyncSession, msg: Message) -> None:
+    """
+    Call before deleting `msg`: drops it from the unread counter and, if it was
+    the latest message, moves last_message_* to the previous one. Does not commit.
+    """
+    if msg.conversation_id is None:
+        return
+
+    conv = await db.get(Conversation, msg.conversation_id, with_for_update=True)
+    if conv is None:
+        return
+
+    if not msg.is_read:
+        if UUID(str(msg.receiver_id)) == conv.user_a_id:
+            conv.unread_a = max(0, conv.unread_a - 1)
+        else:
+            conv.unread_b = max(0, conv.unread_b - 1)
+
+    if conv.last_message_id == msg.id:
+        previous = (await db.execute(
+            select(Message.id, Message.created_at)
+            .where(Message.conversation_id == conv.id, Message.id != msg.id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+        )).first()
+        conv.last_message_id = previous.id if previous else None
+        conv.last_message_at = previous.created_at if previous else None
+
+
+# ------------- HISTORY PAGING -----------------
+
+def encode_message_cursor(msg: Message) -> str:
+    raw = f"{msg.created_at.isoformat()}|{msg.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(message_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _page(db: AsyncSession, conversation_id, limit: int, older_than=None, newer_than=None, inclusive=False):
+    """
+    One keyset slice over idx_messages_conversation_created. Returns (rows oldest→newest, has_more).
+    Walks backwards from `older_than` (or from the newest message) unless `newer_than` is given.
+    """
+    key = tuple_(Message.created_at, Message.id)
+    q = (
+        select(Message, ChatMedia)
+        .outerjoin(ChatMedia, ChatMedia.id == Message.media_id)
+        .where(Message.conversation_id == conversation_id)
+    )
+
+    if newer_than is not None:
+        q = q.where(key >= tuple_(*newer_than) if inclusive else key > tuple_(*newer_than))
+        q = q.order_by(Message.created_at.asc(), Message.id.asc())
+    else:
+        if older_than is not None:
+            q = q.where(key <= tuple_(*older_than) if inclusive else key < tuple_(*older_than))
+        q = q.order_by(Message.created_at.desc(), Message.id.desc())
+
+    rows = (await db.execute(q.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if newer_than is None:
+        rows.reverse()
+    return rows, has_more
+
+
+async def get_message_page(
+    db: AsyncSession,
+    conversation_id,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    around: Optional[UUID] = None,
+):
+    """
+    Keyset page of a conversation on (created_at, id). Cost depends only on `limit`, not depth.
+
+    - default: newest `limit` messages
+    - before: the page older than the cursor (infinite scroll up)
+    - after: the page newer than the cursor (scrolling back down)
+    - around: page centred on a message id (jump to message)
+
+    Returns (rows oldest→newest as (Message, ChatMedia), older_cursor, newer_cursor);
+    a cursor is None when there is nothing further in that direction.
+    """
+    has_newer = False
+
+    if around is not None:
+        anchor = await db.scalar(
+            select(Message).where(Message.id == around, Message.conversation_id == conversation_id)
+        )
+        if anchor is None:
+            raise HTTPException(status_code=404, detail="Message not found")
+        anchor_key = (anchor.created_at, anchor.id)
+        older, has_older = await _page(db, conversation_id, limit - limit // 2, older_than=anchor_key, inclusive=True)
+        newer, has_newer = await _page(db, conversation_id, limit // 2, newer_than=anchor_key)
+        rows = older + newer
+    elif after is not None:
+        rows, has_newer = await _page(db, conversation_id, limit, newer_than=decode_message_cursor(after))
+        has_older = True   # everything up to the cursor lies behind
+    else:
+        rows, has_older = await _page(
+            db, conversation_id, limit, older_than=decode_message_cursor(before) if before else None
+        )
+        has_newer = before is not None
+
+    if not rows:
+        return [], None, None
+
+    older_cursor = encode_message_cursor(rows[0][0]) if has_older else None
+    newer_cursor = encode_message_cursor(rows[-1][0]) if has_newer else None
+    return rows, older_cursor, newer_cursor
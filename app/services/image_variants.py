@@ -0,0 +1,121 @@
+# services/image_variants.py
+
+
+import hashlib
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional
+from PIL import Image, ImageOps, features
+
+
+# Content-addressed profile media:
+#
+#   uploads/media/<h[:2]>/<sha256>/original.<ext>
+#                                 /160.webp  480.webp  1080.webp   (+ .avif)
+#
+# Identical uploads hash to the same directory, so a duplicate costs one
+# sha256 and no new files. Everything here is plain Pillow + stdlib because
+# store_content_addressed() runs inside a media worker process.
+
+MEDIA_ROOT = "uploads/media"
+BASE_URL = "http://127.0.0.1:8000"
+
+VARIANT_WIDTHS = (1080, 480, 160)    # largest first: each is resized from the previous
+PHOTO_SIZES = {"thumb": 160, "card": 480, "gallery": 1080}
+
+ENCODERS = {
+    "webp": {"format": "WEBP", "quality": 80, "method": 4},
+    "avif": {"format": "AVIF", "quality": 55, "speed": 8},
+}
+VARIANT_FORMATS = [fmt for fmt in ENCODERS if features.check(fmt)]
+
+
+def content_dir(content_hash: str) -> str:
+    return os.path.join(MEDIA_ROOT, content_hash[:2], content_hash)
+
+
+def variant_url(content_hash: str, size: str = "card", fmt: str = "webp") -> str:
+    return f"{BASE_URL}/{content_dir(content_hash)}/{PHOTO_SIZES[size]}.{fmt}"
+
+
+def photo_url(file_path: str, content_hash: Optional[str], size: str = "card") -> str:
+    """Display URL of a UserMedia image: the variant for `size` when it has one, else the stored file."""
+    if content_hash:
+        return variant_url(content_hash, size)
+    return file_path if file_path.startswith("http") else f"{BASE_URL}/{file_path.lstrip('/')}"
+
+
+# ───────────── Worker side ─────────────
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_atomic(img: Image.Image, path: str, fmt: str) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    options = dict(ENCODERS[fmt])
+    img.save(tmp, options.pop("format"), **options)
+    os.replace(tmp, path)
+
+
+def _write_variants(directory: str, original: str) -> Dict[str, Any]:
+    with Image.open(original) as src:
+        width, height = src.size
+        missing = [
+            (w, fmt) for w in VARIANT_WIDTHS for fmt in VARIANT_FORMATS
+            if not os.path.exists(os.path.join(directory, f"{w}.{fmt}"))
+        ]
+        if missing:
+            # JPEG: let libjpeg decode at the smallest scale still ≥ the top rung
+            src.draft("RGB", (VARIANT_WIDTHS[0], VARIANT_WIDTHS[0] * height // max(width, 1)))
+            img = ImageOps.exif_transpose(src)   # phone photos; EXIF (GPS…) is not carried over
+            if img.mode not in ("RGB", "RGBA"):
+                has_alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+                img = img.convert("RGBA" if has_alpha else "RGB")
+
+            for w in VARIANT_WIDTHS:
+                if img.width > w:
+                    img = img.resize((w, max(1, round(img.height * w / img.width))), Image.LANCZOS)
+                for fmt in VARIANT_FORMATS:
+                    if (w, fmt) in missing:
+                        _save_atomic(img, os.path.join(directory, f"{w}.{fmt}"), fmt)
+
+    return {"width": width, "height": height, "variants_written": len(missing)}
+
+
+def store_content_addressed(
+    tmp_path: str, ext: str, make_variants: bool, content_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Move an upload into its content directory and make sure its variant
+    ladder exists. Blocking: runs in a media worker (services/media_pipeline.py).
+    `content_hash` skips re-reading a file hashed while it streamed in.
+    """
+    started = time.perf_counter()
+    content_hash = content_hash or _sha256(tmp_path)
+    directory = content_dir(content_hash)
+    os.makedirs(directory, exist_ok=True)
+
+    original = os.path.join(directory, f"original{ext}")
+    duplicate = os.path.exists(original)
+    if duplicate:
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, original)
+
+    result = {"hash": content_hash, "original": original, "duplicate": duplicate, "width": None, "height": None}
+    if make_variants:
+        try:
+            result.update(_write_variants(directory, original))
+        except Exception:
+            if not duplicate:
+                shutil.rmtree(directory, ignore_errors=True)   # not an image we can read
+            raise
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
@@ -10,7 +10,7 @@ from utils.prompts import (
     STARTER_SYSTEM_PROMPT, make_starter_user_prompt
 )
 from models.profile_model import Profile
-from models.message_model import Message
+from services.conversation_service import get_last_message_between
 from models.user_model import User, UserMedia # adjust imports to your project layout
 from db.session import client  # your OpenAI client wrapper used earlier
 from utils.socket_manager import manager  # if you expose online status; adjust import
@@ -36,16 +36,7 @@ async def _fetch_avatar(db: AsyncSession, user_id: str) -> Optional[str]:
     return row[0] if row else None
 
 async def _fetch_last_message(db: AsyncSession, user_a: str, user_b: str) -> Optional[Dict[str, Any]]:
-    res = await db.execute(
-        select(Message)
-        .where(
-            ((Message.sender_id == user_a) & (Message.receiver_id == user_b)) |
-            ((Message.sender_id == user_b) & (Message.receiver_id == user_a))
-        )
-        .order_by(Message.created_at.desc())
-        .limit(1)
-    )
-    msg = res.scalar_one_or_none()
+    msg = await get_last_message_between(db, user_a, user_b)
     if not msg:
         return None
     return {
@@ -228,7 +219,7 @@ async def build_enriched_match_item(db: AsyncSession, current_user_id: str, cand
 
     # online status (if you have manager)
     try:
-        is_online = bool(manager.active_connections.get(target_id))
+        is_online = manager.is_online(target_id)
     except Exception:
         is_online = False
 
@@ -6,13 +6,12 @@ from typing import List, Dict
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import select, and_, or_, delete, func, desc
-from services.ai_service import run_ai_profile_process
+from sqlalchemy import select, and_, or_, delete, func, desc, case
 from utils.match_logic import create_notification, generate_conversation_starters
 from sqlalchemy.future import select
 from utils.socket_manager import manager
 from models.user_model import User, Notification, UserMedia
-from models.message_model import Message
+from models.message_model import Message, Conversation
 from models.profile_model import Profile
 from models.match_model import View, Match, Like, Swipe
 
@@ -22,6 +21,11 @@ from models.match_model import View, Match, Like, Swipe
 # Get Matched users
 # -----------------------------
 async def get_user_matches(db: AsyncSession, user_id: str) -> List[Dict]:
+    """
+    Enriched match list in a constant number of queries (5), however many matches exist:
+    matches → users → first image per user → profiles → conversations' last messages.
+    Users without AI preferences simply get no mutual interests; the AI is never called here.
+    """
     # 1️⃣ Fetch all mutual matches for the user
     result = await db.execute(
         select(Match).where(
@@ -32,66 +36,61 @@ async def get_user_matches(db: AsyncSession, user_id: str) -> List[Dict]:
     matches = result.scalars().all()
 
     # Deduplicate matches by the other user
-    seen_user_ids = set()
-    enriched_matches = []
-
+    by_user: Dict = {}
     for match in matches:
         match_user_id = match.target_id if match.user_id == user_id else match.user_id
-        if match_user_id in seen_user_ids:
-            continue
-        seen_user_ids.add(match_user_id)
+        by_user.setdefault(match_user_id, match)
+
+    if not by_user:
+        return []
+    match_user_ids = list(by_user)
+
+    # 2️⃣ Matched users
+    users_res = await db.execute(select(User).where(User.id.in_(match_user_ids)))
+    users = {u.id: u for u in users_res.scalars().all()}
+
+    # 3️⃣ One image per user (first verified, fallback to oldest)
+    media_res = await db.execute(
+        select(UserMedia.user_id, UserMedia.file_path)
+        .where(UserMedia.user_id.in_(match_user_ids), UserMedia.media_type == "image")
+        .distinct(UserMedia.user_id)
+        .order_by(UserMedia.user_id, UserMedia.is_verified.desc(), UserMedia.created_at.asc())
+    )
+    images = {uid: path for uid, path in media_res.all()}
 
-        # Fetch matched user's info
-        user_res = await db.execute(select(User).where(User.id == match_user_id))
-        match_user = user_res.scalar_one_or_none()
-        if not match_user:
-            continue
+    # 4️⃣ Profiles of matched users and of the current user together
+    profile_res = await db.execute(
+        select(Profile.user_id, Profile.preferences)
+        .where(Profile.user_id.in_(match_user_ids + [user_id]))
+    )
+    preferences = {uid: prefs or {} for uid, prefs in profile_res.all()}
 
-        # Fetch verified image (first verified, fallback to any)
-        media_res = await db.execute(
-            select(UserMedia)
-            .where(UserMedia.user_id == match_user_id, UserMedia.media_type == "image")
-            .order_by(UserMedia.is_verified.desc(), UserMedia.created_at.asc())
+    # 5️⃣ Last message per conversation (conversations.last_message_id → messages by PK)
+    other_id = case((Conversation.user_a_id == user_id, Conversation.user_b_id), else_=Conversation.user_a_id)
+    msg_res = await db.execute(
+        select(other_id, Message.content)
+        .join(Message, Message.id == Conversation.last_message_id)
+        .where(
+            ((Conversation.user_a_id == user_id) & (Conversation.user_b_id.in_(match_user_ids))) |
+            ((Conversation.user_b_id == user_id) & (Conversation.user_a_id.in_(match_user_ids)))
         )
-        images = media_res.scalars().all()
-        image_url = images[0].file_path if images else None
-
-        # Fetch or generate profile preferences
-        profile_res = await db.execute(select(Profile).where(Profile.user_id == match_user_id))
-        profile = profile_res.scalar_one_or_none()
-
-        if profile and profile.preferences:
-            interests = profile.preferences.get("interests", [])
-            values = profile.preferences.get("values", [])
-        else:
-            try:
-                ai_data = await run_ai_profile_process(db, match_user)
-                interests = ai_data["preferences"].get("interests", [])
-                values = ai_data["preferences"].get("values", [])
-            except Exception:
-                interests, values = [], []
+    )
+    last_messages = {oid: content for oid, content in msg_res.all()}
+
+    user_prefs = preferences.get(user_id, {})
+    user_interests = set(user_prefs.get("interests", []))
+    user_values = set(user_prefs.get("values", []))
+
+    enriched_matches = []
+    for match_user_id, match in by_user.items():
+        match_user = users.get(match_user_id)
+        if not match_user:
+            continue
 
         # Compute mutual interests and values with current user
-        mutual_interests, common_values = [], []
-        user_profile_res = await db.execute(select(Profile).where(Profile.user_id == user_id))
-        user_profile = user_profile_res.scalar_one_or_none()
-        if user_profile and user_profile.preferences:
-            user_interests = user_profile.preferences.get("interests", [])
-            user_values = user_profile.preferences.get("values", [])
-            mutual_interests = list(set(interests) & set(user_interests))
-            common_values = list(set(values) & set(user_values))
-
-        # Fetch last message preview
-        msg_res = await db.execute(
-            select(Message)
-            .where(
-                ((Message.sender_id == user_id) & (Message.receiver_id == match_user_id)) |
-                ((Message.sender_id == match_user_id) & (Message.receiver_id == user_id))
-            )
-            .order_by(Message.created_at.desc())
-        )
-        last_msg = msg_res.scalars().first()
-        last_message_preview = last_msg.content if last_msg else None
+        prefs = preferences.get(match_user_id, {})
+        mutual_interests = list(set(prefs.get("interests", [])) & user_interests)
+        common_values = list(set(prefs.get("values", [])) & user_values)
 
         enriched_matches.append({
             "match_id": str(match.id),
@@ -99,15 +98,15 @@ async def get_user_matches(db: AsyncSession, user_id: str) -> List[Dict]:
             "name": match_user.full_name or "",
             "age": match_user.age or 0,
             "bio": match_user.bio or "",
-            "imageUrl": image_url,
+            "imageUrl": images.get(match_user_id),
             "compatibility": round(match.score or 0.5, 2),
             "matched_at": match.matched_at or match.created_at,
-            "is_active": str(match_user.id) in manager.online_users,
+            "is_active": manager.is_online(match_user.id),
             "is_verified": match_user.is_verified,
             "mutual_interests": mutual_interests,
             "common_values": common_values,
             "last_active_at": match_user.last_active,
-            "last_message_preview": last_message_preview,
+            "last_message_preview": last_messages.get(match_user_id),
             "conversation_starters": generate_conversation_starters(mutual_interests, common_values)[:5]
         })
 
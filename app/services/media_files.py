@@ -0,0 +1,176 @@
+# services/media_files.py
+
+
+import mimetypes
+import os
+import posixpath
+import re
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+from sqlalchemy import select
+from db.session import async_session
+from models.message_model import ChatMedia
+from utils.uploads import UPLOAD_TMP_DIR, EXTENSIONS
+
+
+UPLOAD_ROOT = "uploads"
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"            # content-addressed
+CACHE_PRIVATE_IMMUTABLE = "private, max-age=31536000, immutable"   # chat media: write-once uuid names
+CACHE_REVALIDATE = "no-cache"                                       # anything else: ETag round trip
+CHAT_TYPE_CACHE_SIZE = 10_000
+
+# media/<h[:2]>/<sha256>/<name>, see services/image_variants.py
+_CONTENT_ADDRESSED = re.compile(r"^media/[0-9a-f]{2}/([0-9a-f]{64})/([\w.]+)$")
+_NEGOTIATED = (".webp",)          # variants that may have an .avif sibling
+
+# extension → Content-Type, built once; chat media use ChatMedia.file_type instead
+CONTENT_TYPES: Dict[str, str] = {
+    **mimetypes.types_map,
+    **{ext: mime for mime, ext in EXTENSIONS.items()},   # .webm → audio/webm (voice notes)
+}
+
+_ROOT = os.path.realpath(UPLOAD_ROOT)
+_HIDDEN = (os.path.realpath(UPLOAD_TMP_DIR), os.path.realpath(os.path.join(UPLOAD_ROOT, "media", "tmp")))
+
+
+@dataclass
+class MediaFile:
+    path: str
+    stat: os.stat_result
+    etag: str
+    cache_control: str
+    media_id: Optional[uuid.UUID] = None     # chat upload: Content-Type comes from its row
+    vary: Optional[str] = None
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control}
+        if self.vary:
+            headers["Vary"] = self.vary
+        return headers
+
+
+def _stat_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _chat_media_id(name: str) -> Optional[uuid.UUID]:
+    # uploads/chat/<media_id><ext> or <media_id>.voice.webm (transcoded);
+    # thumbnails (<media_id><ext>_thumb.jpg) have no row of their own
+    if name.endswith("_thumb.jpg"):
+        return None
+    try:
+        return uuid.UUID(name.split(".", 1)[0])
+    except ValueError:
+        return None
+
+
+class MediaFiles:
+    """
+    Everything under /uploads, served with cache validators:
+
+    - content-addressed profile media: strong ETag "<sha256>-<name>",
+      `immutable` for a year, .webp variants negotiated to .avif by Accept
+    - chat uploads: never rewritten (uuid names) → private + immutable,
+      Content-Type from ChatMedia.file_type (codecs included), cached here
+    - anything else: mtime/size ETag, revalidated every time (304)
+
+    Ranges (206 / 416, If-Range) are handled by FileResponse against these
+    ETags; uploads/tmp is never served.
+    """
+
+    def __init__(self) -> None:
+        self._chat_types: "OrderedDict[str, Optional[str]]" = OrderedDict()   # file name → type
+        self._counters = {
+            "served": 0, "not_modified": 0, "range_requests": 0,
+            "avif_negotiated": 0, "not_found": 0, "type_lookups": 0,
+        }
+
+    def resolve(self, rel_path: str, accept: str = "") -> Optional[MediaFile]:
+        rel = posixpath.normpath("/" + rel_path).lstrip("/")
+        path = os.path.realpath(os.path.join(UPLOAD_ROOT, rel))
+        if not path.startswith(_ROOT + os.sep) or any(path.startswith(h + os.sep) for h in _HIDDEN):
+            self._counters["not_found"] += 1
+            return None
+
+        etag = cache_control = vary = media_id = None
+        match = _CONTENT_ADDRESSED.match(rel)
+        if match:
+            content_hash, name = match.groups()
+            if name.endswith(_NEGOTIATED):
+                vary = "Accept"
+                avif = f"{os.path.splitext(path)[0]}.avif"
+                if "image/avif" in accept and os.path.exists(avif):
+                    path, name = avif, os.path.basename(avif)
+                    self._counters["avif_negotiated"] += 1
+            etag = f'"{content_hash}-{name}"'
+            cache_control = CACHE_IMMUTABLE
+        elif rel.startswith("chat/"):
+            media_id = _chat_media_id(os.path.basename(rel))
+            cache_control = CACHE_PRIVATE_IMMUTABLE
+        else:
+            cache_control = CACHE_REVALIDATE
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is None or not os.path.isfile(path):
+            self._counters["not_found"] += 1
+            return None
+
+        return MediaFile(
+            path=path,
+            stat=st,
+            etag=etag or _stat_etag(st),
+            cache_control=cache_control,
+            media_id=media_id,
+            vary=vary,
+        )
+
+    def not_modified(self, file: MediaFile, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or file.etag in tags:
+            self._counters["not_modified"] += 1
+            return True
+        return False
+
+    async def content_type(self, file: MediaFile) -> str:
+        if file.media_id is not None:
+            mime = await self._chat_type(file.media_id, os.path.basename(file.path))
+            if mime:
+                return mime
+        return CONTENT_TYPES.get(os.path.splitext(file.path)[1].lower(), "application/octet-stream")
+
+    async def _chat_type(self, media_id: uuid.UUID, name: str) -> Optional[str]:
+        if name in self._chat_types:
+            self._chat_types.move_to_end(name)
+            return self._chat_types[name]
+
+        self._counters["type_lookups"] += 1
+        async with async_session() as db:
+            row = (await db.execute(
+                select(ChatMedia.file_path, ChatMedia.file_type).where(ChatMedia.id == media_id)
+            )).first()
+        # the row's type belongs to the file it points at (not the pre-transcode upload)
+        mime = row.file_type if row and row.file_path.endswith(f"/{name}") else None
+        self._chat_types[name] = mime
+        if len(self._chat_types) > CHAT_TYPE_CACHE_SIZE:
+            self._chat_types.popitem(last=False)
+        return mime
+
+    def record(self, ranged: bool) -> None:
+        self._counters["served"] += 1
+        if ranged:
+            self._counters["range_requests"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._counters, "cached_chat_types": len(self._chat_types)}
+
+
+media_files = MediaFiles()
@@ -0,0 +1,289 @@
+# services/media_pipeline.py
+
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional
+from sqlalchemy import select, update
+from db.session import async_session
+from models.message_model import ChatMedia, Message
+from services.media_service import process_media, public_url, storage_path
+from utils.config import settings
+from utils.socket_manager import manager
+
+
+MEDIA_MAX_QUEUE = 200              # jobs waiting for a worker before uploads get a 503
+MEDIA_JOB_TIMEOUT_SECONDS = 120    # per job, queueing excluded (ffmpeg runs have their own, see media_service)
+ORIGINAL_GRACE_SECONDS = 600       # a replaced voice-note upload stays this long for clients still holding its URL
+
+
+class MediaQueueFull(Exception):
+    pass
+
+
+class MediaPipeline:
+    """
+    Media work (Pillow / ffmpeg) off the event loop.
+
+    Jobs run in a bounded process pool (settings.MEDIA_WORKERS); at most that
+    many are in flight, the rest wait here in FIFO order. A job that times out
+    keeps its slot until its worker is really done with it, so the pool never
+    takes on more than it can run.
+    - call(): await a job's result (profile photo variants)
+    - submit(): chat uploads – when the job finishes the ChatMedia row is
+      filled in (processed=True) and a `media_processed` event goes to the
+      uploader and to whoever already received a message carrying the media;
+      voice notes come back transcoded, the row then points at the new file
+      and the original upload is only removed after ORIGINAL_GRACE_SECONDS
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.workers)
+        self._tasks: set = set()
+        self._waiting = 0
+        self._running = 0
+        self._overrunning = 0           # timed out / abandoned, worker still on it
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "timed_out": 0, "rejected": 0}
+        self._timings: Dict[str, Dict[str, float]] = {}    # kind → aggregated job timings
+        self._transcodes = {"files": 0, "in_bytes": 0, "out_bytes": 0, "total_ms": 0.0}
+
+    # ───────────── Producer side ─────────────
+
+    def check_capacity(self) -> None:
+        """Raise before accepting an upload the pool can't get to in reasonable time."""
+        if self._waiting >= MEDIA_MAX_QUEUE:
+            self._counters["rejected"] += 1
+            raise MediaQueueFull(f"{self._waiting} media jobs waiting")
+
+    def submit(self, media: ChatMedia) -> None:
+        """Chat upload: process in the background, announce with `media_processed`."""
+        task = asyncio.create_task(
+            self._run(media.id, media.uploader_id, media.kind, storage_path(media.file_path), media.meta)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def call(self, kind: str, fn, *args):
+        """
+        Run fn(*args) in a worker process once one is free and return its result.
+        Timings are recorded under `kind`; raises TimeoutError after MEDIA_JOB_TIMEOUT_SECONDS.
+        """
+        self._counters["submitted"] += 1
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        started = time.perf_counter()
+        job = asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        try:
+            # shielded: cancelling the wrapper would not stop the worker, only hide it
+            result = await asyncio.wait_for(asyncio.shield(job), MEDIA_JOB_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self._counters["timed_out"] += 1
+            # we stop waiting, but the slot stays taken until the worker is done with it
+            self._overrunning += 1
+            job.add_done_callback(self._overrun_done)
+            raise
+        except Exception:
+            self._counters["failed"] += 1
+            self._release()
+            raise
+
+        self._release()
+        self._counters["completed"] += 1
+        self._record(kind, wait_ms=(started - queued_at) * 1000, run_ms=(time.perf_counter() - started) * 1000)
+        return result
+
+    def _release(self) -> None:
+        self._running -= 1
+        self._slots.release()
+
+    def _overrun_done(self, job: asyncio.Future) -> None:
+        self._overrunning -= 1
+        if not job.cancelled():
+            job.exception()      # retrieved: nobody awaits it any more
+        self._release()
+
+    # ───────────── Lifecycle ─────────────
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that holds an event loop and DB connections
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    # ───────────── Jobs ─────────────
+
+    async def _run(self, media_id, uploader_id, kind: str, path: str, meta: Optional[dict] = None) -> None:
+        result, error = None, None
+        try:
+            result = await self.call(kind, process_media, path, kind)
+        except asyncio.TimeoutError:
+            error = "processing timed out"
+        except Exception as e:
+            error = str(e)[:200]
+            print(f"⚠️ Media processing failed for {media_id}: {e}")
+        await self._finish(media_id, uploader_id, kind, result=result, error=error, meta=meta, source_path=path)
+
+    async def _finish(
+        self, media_id, uploader_id, kind: str,
+        result: Dict[str, Any] = None, error: str = None, meta: Optional[dict] = None, source_path: str = None,
+    ) -> None:
+        replaced = None
+        if result is not None:
+            values = {
+                "width": result["width"],
+                "height": result["height"],
+                "duration_ms": result["duration_ms"],
+                "thumb_path": public_url(result["thumb_path"]) if result["thumb_path"] else None,
+                "processed": True,
+            }
+            if result.get("file_path"):
+                # transcoded voice note: the row moves to the new file
+                values.update(
+                    file_path=public_url(result["file_path"]),
+                    file_type=result["file_type"],
+                    size_bytes=result["size_bytes"],
+                    meta={**(meta or {}), "waveform": result["waveform"], "transcode": result["transcode"]},
+                )
+                replaced = source_path
+                self._record_transcode(media_id, result["transcode"])
+            elif result.get("transcode_error"):
+                values["meta"] = {**(meta or {}), "transcode_error": result["transcode_error"]}
+        else:
+            values = {"meta": {**(meta or {}), "processing_error": error}}
+
+        try:
+            async with async_session() as db:
+                await db.execute(update(ChatMedia).where(ChatMedia.id == media_id).values(**values))
+                await db.commit()
+                receivers = (await db.execute(
+                    select(Message.receiver_id).where(Message.media_id == media_id).distinct()
+                )).scalars().all()
+        except Exception as e:
+            print(f"⚠️ Could not store media result for {media_id}: {e}")
+            if result and result.get("file_path"):
+                self._remove(result["file_path"])
+            return
+
+        event = {
+            "type": "media_processed",
+            "media_id": str(media_id),
+            "kind": kind,
+            "processed": result is not None,
+            "thumb_url": values.get("thumb_path"),
+            "width": values.get("width"),
+            "height": values.get("height"),
+            "duration_ms": values.get("duration_ms"),
+        }
+        if "file_path" in values:
+            event.update(
+                media_url=values["file_path"],
+                file_type=values["file_type"],
+                waveform=values["meta"]["waveform"],
+            )
+        if error:
+            event["error"] = error
+        notified = {str(uploader_id), *(str(r) for r in receivers)}
+        for user_id in notified:
+            await manager.send_personal_message(user_id, event)
+
+        if replaced:
+            task = asyncio.create_task(self._retire(media_id, replaced, event, notified))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _retire(self, media_id, path: str, event: Dict[str, Any], notified: set) -> None:
+        """
+        Remove a replaced upload once nobody should still be fetching it: a
+        receiver may be mid-playback (Range requests) on the old URL. Messages
+        that were sent with the old URL but stored after _finish looked up the
+        receivers get their `media_processed` now. Left on disk if the app
+        stops first.
+        """
+        await asyncio.sleep(ORIGINAL_GRACE_SECONDS)
+        try:
+            async with async_session() as db:
+                receivers = (await db.execute(
+                    select(Message.receiver_id).where(Message.media_id == media_id).distinct()
+                )).scalars().all()
+            for user_id in {str(r) for r in receivers} - notified:
+                await manager.send_personal_message(user_id, event)
+        except Exception as e:
+            print(f"⚠️ Could not notify late receivers of {media_id}: {e}")
+        self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ───────────── Stats ─────────────
+
+    def _record_transcode(self, media_id, report: Dict[str, Any]) -> None:
+        t = self._transcodes
+        t["files"] += 1
+        t["in_bytes"] += report["in_bytes"]
+        t["out_bytes"] += report["out_bytes"]
+        t["total_ms"] += report["elapsed_ms"]
+        print(
+            f"🎙️ Voice note {media_id}: {report['in_bytes'] / 1024:.1f} KB → {report['out_bytes'] / 1024:.1f} KB "
+            f"({report['ratio']}x) in {report['elapsed_ms']:.0f} ms"
+        )
+
+    def _record(self, kind: str, wait_ms: float, run_ms: float) -> None:
+        t = self._timings.setdefault(kind, {"jobs": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "total_wait_ms": 0.0})
+        t["jobs"] += 1
+        t["total_ms"] += run_ms
+        t["total_wait_ms"] += wait_ms
+        t["max_ms"] = max(t["max_ms"], run_ms)
+        t["last_ms"] = run_ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counters,
+            "workers": self.workers,
+            "queue_depth": self._waiting,
+            "running": self._running,
+            "overrunning": self._overrunning,
+            "timings": {
+                kind: {
+                    "jobs": t["jobs"],
+                    "avg_ms": round(t["total_ms"] / t["jobs"], 1),
+                    "max_ms": round(t["max_ms"], 1),
+                    "last_ms": round(t["last_ms"], 1),
+                    "avg_wait_ms": round(t["total_wait_ms"] / t["jobs"], 1),
+                }
+                for kind, t in self._timings.items()
+            },
+            "voice_notes": {
+                "files": self._transcodes["files"],
+                "in_bytes": self._transcodes["in_bytes"],
+                "out_bytes": self._transcodes["out_bytes"],
+                "ratio": round(self._transcodes["in_bytes"] / max(self._transcodes["out_bytes"], 1), 2),
+                "avg_ms": round(self._transcodes["total_ms"] / max(self._transcodes["files"], 1), 1),
+            },
+        }
+
+
+media_pipeline = MediaPipeline(settings.MEDIA_WORKERS)
@@ -3,32 +3,38 @@
 
 import uuid
 import os
-import aiofiles
+import json
+import subprocess
+import time
 import ffmpeg
+import numpy as np
 from PIL import Image
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.message_model import ChatMedia
-from fastapi import UploadFile
 from utils.config import settings
+from utils.uploads import StoredUpload
 
 UPLOAD_DIR = "uploads/chat"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Voice notes are re-encoded to one profile: mono Opus (VoIP tuning) in WebM
+VOICE_FILE_TYPE = "audio/webm;codecs=opus"
+VOICE_BITRATE = "24k"
+VOICE_SAMPLE_RATE = 48000
+VOICE_SILENCE_THRESHOLD = "-50dB"     # quieter than this at either end is cut…
+VOICE_SILENCE_KEEP = 0.25             # …leaving this many seconds
+VOICE_LOUDNESS = {"I": -16, "TP": -1.5, "LRA": 11}    # EBU R128 loudnorm target
+WAVEFORM_PEAKS = 64                   # bars in ChatMedia.meta["waveform"], 0–100 % of full scale
+WAVEFORM_RATE = 8000                  # Hz of the PCM the peaks are taken from
+FFMPEG_TIMEOUT_SECONDS = 25           # per ffmpeg / ffprobe run; a job makes at most 4 encode/decode runs
 
-async def save_upload_file(file: UploadFile) -> str:
-    """
-    Saves uploaded file to /uploads/chat/<uuid>.<ext>
-    Returns the full path.
-    """
-    ext = os.path.splitext(file.filename)[1] or ""
-    media_id = str(uuid.uuid4())
-    file_path = os.path.join(UPLOAD_DIR, f"{media_id}{ext}")
 
-    async with aiofiles.open(file_path, "wb") as out:
-        while chunk := await file.read(1024 * 1024):
-            await out.write(chunk)
+def public_url(path: str) -> str:
+    return path.replace("uploads", "/uploads", 1)
 
-    return file_path, media_id, ext
+
+def storage_path(url: str) -> str:
+    return url.replace("/uploads", "uploads", 1)
 
 
 def get_media_kind(mime: str) -> str:
@@ -41,6 +47,31 @@ def get_media_kind(mime: str) -> str:
     return "file"
 
 
+def _ffmpeg(stream, capture_stdout: bool = False) -> bytes:
+    """stream.run(quiet=True) with a hard timeout: a hung ffmpeg is killed, not left holding the worker."""
+    process = stream.run_async(pipe_stdout=capture_stdout, quiet=True)
+    try:
+        out, err = process.communicate(timeout=FFMPEG_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    if process.returncode:
+        raise ffmpeg.Error("ffmpeg", out, err)
+    return out
+
+
+def _probe(path: str) -> dict:
+    """ffmpeg.probe() with the same timeout."""
+    proc = subprocess.run(
+        ["ffprobe", "-show_format", "-show_streams", "-of", "json", path],
+        capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+    if proc.returncode:
+        raise ffmpeg.Error("ffprobe", proc.stdout, proc.stderr)
+    return json.loads(proc.stdout.decode("utf-8"))
+
+
 def extract_image_metadata(path: str):
     with Image.open(path) as img:
         return img.width, img.height
@@ -48,7 +79,7 @@ def extract_image_metadata(path: str):
 
 def extract_video_metadata(path: str):
     try:
-        probe = ffmpeg.probe(path)
+        probe = _probe(path)
         v = next(s for s in probe["streams"] if s["codec_type"] == "video")
         width = int(v["width"])
         height = int(v["height"])
@@ -60,12 +91,11 @@ def extract_video_metadata(path: str):
 
 def generate_video_thumbnail(path: str, thumb_path: str):
     try:
-        (
+        _ffmpeg(
             ffmpeg
             .input(path, ss=0)
             .filter("scale", 320, -1)
             .output(thumb_path, vframes=1)
-            .run(quiet=True)
         )
         return True
     except Exception:
@@ -83,52 +113,150 @@ def generate_image_thumbnail(path: str, thumb_path: str):
 
 
 
-async def handle_media_upload(db: AsyncSession, file: UploadFile) -> ChatMedia:
-    file_path, media_id, ext = await save_upload_file(file)
+def extract_audio_duration(path: str):
+    try:
+        probe = _probe(path)
+        return int(float(probe["format"]["duration"]) * 1000)
+    except Exception:
+        return None
+
+
+def _encode_voice(path: str, out_path: str, trim: bool) -> None:
+    audio = ffmpeg.input(path).audio
+    if trim:
+        # leading silence, then trailing silence on the reversed clip
+        for _ in range(2):
+            audio = audio.filter(
+                "silenceremove", start_periods=1,
+                start_threshold=VOICE_SILENCE_THRESHOLD, start_silence=VOICE_SILENCE_KEEP,
+            ).filter("areverse")
+    audio = audio.filter("loudnorm", **VOICE_LOUDNESS)
+    _ffmpeg(
+        ffmpeg
+        .output(
+            audio, out_path, format="webm", acodec="libopus", audio_bitrate=VOICE_BITRATE,
+            ac=1, ar=VOICE_SAMPLE_RATE, application="voip",
+        )
+        .overwrite_output()
+    )
+
+
+def _decode_pcm(path: str) -> np.ndarray:
+    pcm = _ffmpeg(
+        ffmpeg
+        .input(path)
+        .output("pipe:", format="s16le", acodec="pcm_s16le", ac=1, ar=WAVEFORM_RATE),
+        capture_stdout=True,
+    )
+    return np.frombuffer(pcm, dtype=np.int16)
 
-    # FIX: Preserve full MIME including codecs (important for audio)
-    mime = file.headers.get("content-type") or file.content_type
 
-    kind = get_media_kind(mime)
+def waveform_peaks(samples: np.ndarray, bars: int = WAVEFORM_PEAKS) -> list:
+    """Peak level per bar in % of full scale (loudnorm already evened out the level)."""
+    if not len(samples):
+        return [0] * bars
+    levels = np.abs(samples.astype(np.int32))
+    return [
+        int(round(chunk.max() * 100 / 32768)) if len(chunk) else 0
+        for chunk in np.array_split(levels, bars)
+    ]
 
-    thumb_path = None
-    width = None
-    height = None
-    duration_ms = None
+
+def transcode_voice_note(path: str) -> dict:
+    """
+    Silence-trimmed, loudness-normalised Opus copy of a voice note next to
+    the upload (<media_id>.voice.webm) plus its duration and waveform, read
+    back from the encoded file. Blocking: media worker only.
+    """
+    started = time.perf_counter()
+    out_path = f"{os.path.splitext(path)[0]}.voice.webm"
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+
+    try:
+        try:
+            _encode_voice(path, tmp_path, trim=True)
+            samples = _decode_pcm(tmp_path)
+        except ffmpeg.Error:
+            samples = None
+        if samples is None or not len(samples):
+            _encode_voice(path, tmp_path, trim=False)    # nothing but silence: keep it as is
+            samples = _decode_pcm(tmp_path)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    in_bytes, out_bytes = os.path.getsize(path), os.path.getsize(out_path)
+    return {
+        "file_path": out_path,
+        "file_type": VOICE_FILE_TYPE,
+        "size_bytes": out_bytes,
+        "duration_ms": len(samples) * 1000 // WAVEFORM_RATE,
+        "waveform": waveform_peaks(samples),
+        "transcode": {
+            "in_bytes": in_bytes,
+            "out_bytes": out_bytes,
+            "ratio": round(in_bytes / max(out_bytes, 1), 2),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+    }
+
+
+def process_media(path: str, kind: str) -> dict:
+    """
+    Thumbnail + metadata of a stored upload (audio: transcoded voice note,
+    see transcode_voice_note). Blocking (Pillow / ffmpeg): only ever called
+    inside a media worker process, see services/media_pipeline.py.
+    """
+    started = time.perf_counter()
+    result = {"width": None, "height": None, "duration_ms": None, "thumb_path": None}
+    thumb_path = f"{path}_thumb.jpg"
 
     if kind == "image":
-        width, height = extract_image_metadata(file_path)
-        thumb_path = f"{file_path}_thumb.jpg"
-        generate_image_thumbnail(file_path, thumb_path)
+        result["width"], result["height"] = extract_image_metadata(path)
+        if generate_image_thumbnail(path, thumb_path):
+            result["thumb_path"] = thumb_path
 
     elif kind == "video":
-        width, height, duration_ms = extract_video_metadata(file_path)
-        thumb_path = f"{file_path}_thumb.jpg"
-        generate_video_thumbnail(file_path, thumb_path)
+        result["width"], result["height"], result["duration_ms"] = extract_video_metadata(path)
+        if generate_video_thumbnail(path, thumb_path):
+            result["thumb_path"] = thumb_path
 
     elif kind == "audio":
         try:
-            probe = ffmpeg.probe(file_path)
-            duration_sec = float(probe["format"]["duration"])
-            duration_ms = int(duration_sec * 1000)
-        except Exception:
-            duration_ms = None
+            result.update(transcode_voice_note(path))
+        except Exception as e:
+            # keep serving the upload as it came in
+            result["duration_ms"] = extract_audio_duration(path)
+            result["transcode_error"] = str(e)[:200]
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def handle_media_upload(db: AsyncSession, upload: StoredUpload) -> ChatMedia:
+    """
+    Moves a streamed upload to /uploads/chat/<uuid>.<ext> and adds its
+    ChatMedia row (processed=False) without touching the file: thumbnails and
+    metadata come later from media_pipeline.submit().
+    """
+    media_id = str(uuid.uuid4())
+    file_path = upload.commit(os.path.join(UPLOAD_DIR, f"{media_id}{upload.ext}"))
+
+    # Sniffed type; webm/mp4/ogg keep the client's codecs parameter (voice notes)
+    mime = upload.content_type
 
     # Build ChatMedia row
     media = ChatMedia(
         id=media_id,
         uploader_id=None,
-        file_path=file_path.replace("uploads", "/uploads"),
-        file_name=file.filename,
-        file_type=mime,   # FIXED – now includes codecs
-        kind=kind,
-        size_bytes=os.path.getsize(file_path),
-        width=width,
-        height=height,
-        duration_ms=duration_ms,
-        thumb_path=thumb_path.replace("uploads", "/uploads") if thumb_path else None,
-        processed=True,
+        file_path=public_url(file_path),
+        file_name=upload.filename,
+        file_type=mime,
+        kind=get_media_kind(mime),
+        size_bytes=upload.size,
+        processed=False,
     )
 
     db.add(media)
-    return media
\ No newline at end of file
+    return media
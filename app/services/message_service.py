@@ -1,15 +1,17 @@
 # services/message_service.py
 
 
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 from uuid import UUID
 
 from fastapi import HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, tuple_, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
 
 from models.message_model import Message, MessageReaction
 from services.notification_service import create_and_push_notification  # ← adjust path if different
+from services.conversation_service import forget_message, mark_read
 
 
 # ------------- DELETE MESSAGE -----------------
@@ -36,6 +38,9 @@ async def delete_message_service(
         )
     )
 
+    # Keep the conversation's last message / unread count in step
+    await forget_message(db, msg)
+
     # Now delete the message
     await db.delete(msg)
     await db.commit()
@@ -44,6 +49,69 @@ async def delete_message_service(
 
 
 
+# ------------- READ RECEIPTS -----------------
+
+async def mark_messages_read_service(
+    db: AsyncSession,
+    reader_id: str,
+    message_ids: Optional[List[str]] = None,
+    up_to: Optional[str] = None,
+) -> Dict[str, List[str]]:
+    """
+    Mark messages received by `reader_id` as read in a single UPDATE ... RETURNING.
+
+    - message_ids: explicit ids (ids not addressed to the reader or already read are ignored)
+    - up_to: watermark — everything in that message's conversation up to and including it
+
+    Returns {sender_id: [newly read message ids]} so callers can send one receipt per sender.
+    """
+    conditions = [Message.receiver_id == reader_id, Message.is_read.isnot(True)]
+
+    if up_to is not None:
+        anchor = (await db.execute(
+            select(Message.conversation_id, Message.created_at, Message.id)
+            .where(Message.id == _as_uuid(up_to), Message.receiver_id == reader_id)
+        )).first()
+        if anchor is None:
+            return {}
+        conditions += [
+            Message.conversation_id == anchor.conversation_id,
+            tuple_(Message.created_at, Message.id) <= tuple_(anchor.created_at, anchor.id),
+        ]
+    else:
+        ids = [u for u in map(_as_uuid, message_ids or []) if u is not None]
+        if not ids:
+            return {}
+        conditions.append(Message.id == any_(bindparam("ids", ids, type_=ARRAY(PG_UUID(as_uuid=True)))))
+
+    rows = (await db.execute(
+        update(Message)
+        .where(*conditions)
+        .values(is_read=True)
+        .returning(Message.id, Message.sender_id)
+        .execution_options(synchronize_session=False)
+    )).all()
+
+    by_sender: Dict[str, List[str]] = {}
+    for message_id, sender_id in rows:
+        by_sender.setdefault(str(sender_id), []).append(str(message_id))
+
+    for sender_id, ids in by_sender.items():
+        await mark_read(db, reader_id, sender_id, len(ids))
+
+    if rows:
+        await db.commit()
+    return by_sender
+
+
+def _as_uuid(value) -> Optional[UUID]:
+    try:
+        return UUID(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+
 # ------------- REACTIONS -----------------
 
 async def upsert_reaction_service(
@@ -0,0 +1,250 @@
+# services/notification_outbox.py
+
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from uuid import UUID
+from sqlalchemy import select, update, insert, any_, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PG_UUID
+from db.session import async_session
+from models.user_model import User, Notification
+from utils.socket_manager import manager, NOTIFICATIONS
+
+
+OUTBOX_BATCH = 200                # rows per INSERT / push round
+OUTBOX_FLUSH_SECONDS = 0.05       # how long a round waits to fill up
+OUTBOX_MAX_ATTEMPTS = 3           # live pushes before leaving it to replay
+OUTBOX_RETRY_SECONDS = (1, 5)     # delay before the 2nd / 3rd attempt
+
+
+def _ids(values):
+    return bindparam("ids", list(values), type_=ARRAY(PG_UUID(as_uuid=True)))
+
+
+def _as_uuid(value) -> UUID:
+    return value if isinstance(value, UUID) else UUID(str(value))
+
+
+@dataclass
+class _Entry:
+    row: Dict[str, Any]           # notification_row() dict
+    persisted: bool = False       # already INSERTed by the caller's transaction
+    attempts: int = 0
+
+
+_STOP = object()                  # queued by stop(): finish what is ahead of it, then exit
+
+
+class NotificationOutbox:
+    """
+    Background writer + pusher for notifications.
+
+    Request handlers only enqueue a notification_row(); a single dispatcher
+    drains the queue in rounds: one multi-row INSERT (actor names resolved in
+    one SELECT), then hands the round's rows to a delivery task: pushes
+    coalesced per recipient, and one
+    UPDATE ... SET notified_at WHERE id = ANY(:ids) for what got through.
+    Rounds never wait on pushes, so a slow recipient only delays their own
+    notifications. Pushes that fail for online users are retried; a failed
+    notified_at UPDATE is retried on its own (no second push). Offline users
+    get the rows on their next connect via replay, exactly as before.
+
+    The queue lives in process memory: rows still queued when the process
+    dies are lost, so stop() drains it on shutdown, in-flight round included.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self._stopping = False
+        self._deliveries: set = set()
+        self._counters = {
+            "queued": 0, "inserted": 0, "pushed": 0, "retried": 0, "failed": 0, "rounds": 0,
+            "mark_retried": 0, "mark_failed": 0,
+        }
+
+    # ───────────── Producer side ─────────────
+
+    def add(self, row: Dict[str, Any], persisted: bool = False) -> None:
+        self._counters["queued"] += 1
+        self._queue.put_nowait(_Entry(row=row, persisted=persisted))
+        self._ensure_running()
+
+    # ───────────── Lifecycle ─────────────
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def start(self) -> None:
+        self._ensure_running()
+
+    async def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._queue.put_nowait(_STOP)
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while not self._queue.empty():
+            await self._round(self._take(OUTBOX_BATCH))
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+
+    # ───────────── Dispatcher ─────────────
+
+    def _take(self, limit: int) -> List[_Entry]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is _STOP:
+                self._stopping = True
+                continue
+            batch.append(entry)
+        return batch
+
+    async def _run(self) -> None:
+        batch: List[_Entry] = []
+        try:
+            while not self._stopping:
+                first = await self._queue.get()
+                if first is _STOP:
+                    return
+                batch = [first]
+                await asyncio.sleep(OUTBOX_FLUSH_SECONDS)
+                batch += self._take(OUTBOX_BATCH - 1)
+                await self._round(batch)
+                batch = []
+        except asyncio.CancelledError:
+            # hand the in-flight round back; stop() drains the queue
+            for entry in batch:
+                self._queue.put_nowait(entry)
+            raise
+
+    async def _round(self, batch: List[_Entry]) -> None:
+        if not batch:
+            return
+        self._counters["rounds"] += 1
+        try:
+            fresh = [e for e in batch if not e.persisted]
+            if fresh:
+                async with async_session() as db:
+                    await self._fill_actor_names(db, fresh)
+                    await self._insert(db, fresh)
+        except Exception as e:
+            print(f"⚠️ Notification outbox round failed ({len(batch)} rows): {e}")
+            for entry in batch:
+                self._retry(entry)
+            return
+
+        ready = [e for e in batch if e.persisted]
+        if ready:
+            task = asyncio.create_task(self._deliver(ready))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, entries: List[_Entry]) -> None:
+        delivered = await self._push(entries)
+        if delivered:
+            await self._mark_notified(delivered)
+
+    async def _mark_notified(self, ids: List) -> None:
+        """notified_at for rows that went out; only this step is retried, never the push."""
+        for attempt in range(OUTBOX_MAX_ATTEMPTS):
+            try:
+                async with async_session() as db:
+                    await db.execute(
+                        update(Notification)
+                        .where(Notification.id == any_(_ids(ids)))
+                        .values(notified_at=datetime.now(timezone.utc))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+                return
+            except Exception as e:
+                print(f"⚠️ Marking {len(ids)} notifications as sent failed: {e}")
+                if attempt + 1 == OUTBOX_MAX_ATTEMPTS:
+                    self._counters["mark_failed"] += len(ids)   # stay NULL → replayed once more
+                    return
+                self._counters["mark_retried"] += 1
+                await asyncio.sleep(OUTBOX_RETRY_SECONDS[min(attempt, len(OUTBOX_RETRY_SECONDS) - 1)])
+
+    async def _fill_actor_names(self, db, entries: List[_Entry]) -> None:
+        unnamed = [e for e in entries if e.row["actor_id"] and not e.row["actor_name"]]
+        if not unnamed:
+            return
+        missing = {_as_uuid(e.row["actor_id"]) for e in unnamed}
+        names = dict((await db.execute(
+            select(User.id, User.full_name).where(User.id == any_(_ids(missing)))
+        )).all())
+        for e in unnamed:
+            name = names.get(_as_uuid(e.row["actor_id"]))
+            e.row["actor_name"] = name
+            e.row["payload"]["actor_name"] = name
+
+    async def _insert(self, db, entries: List[_Entry]) -> None:
+        try:
+            await db.execute(insert(Notification), [e.row for e in entries])
+            await db.commit()
+        except Exception as e:
+            # one bad row (e.g. recipient deleted meanwhile) must not sink the batch
+            await db.rollback()
+            print(f"⚠️ Outbox batch insert failed, retrying row by row: {e}")
+            for entry in entries:
+                try:
+                    await db.execute(insert(Notification), [entry.row])
+                    await db.commit()
+                except Exception as row_error:
+                    await db.rollback()
+                    self._counters["failed"] += 1
+                    print(f"⚠️ Dropping notification {entry.row['id']}: {row_error}")
+                    continue
+                entry.persisted = True
+            self._counters["inserted"] += sum(e.persisted for e in entries)
+            return
+
+        for entry in entries:
+            entry.persisted = True
+        self._counters["inserted"] += len(entries)
+
+    async def _push(self, entries: List[_Entry]) -> List:
+        """One send per recipient (all their rows in order); returns ids that went out."""
+        from services.notification_service import notification_event
+
+        by_recipient: "OrderedDict[str, List[_Entry]]" = OrderedDict()
+        for entry in entries:
+            by_recipient.setdefault(str(entry.row["user_id"]), []).append(entry)
+
+        async def push(recipient_id: str, group: List[_Entry]):
+            if not manager.is_online(recipient_id):
+                return []   # replayed on connect
+            sent = await manager.send_personal_messages(
+                recipient_id, [notification_event(e.row) for e in group], channel=NOTIFICATIONS
+            )
+            if sent:
+                return [e.row["id"] for e in group]
+            for entry in group:
+                self._retry(entry)
+            return []
+
+        results = await asyncio.gather(*(push(r, g) for r, g in by_recipient.items()))
+        delivered = [notif_id for ids in results for notif_id in ids]
+        self._counters["pushed"] += len(delivered)
+        return delivered
+
+    def _retry(self, entry: _Entry) -> None:
+        entry.attempts += 1
+        if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+            if not entry.persisted:
+                self._counters["failed"] += 1
+            return   # persisted rows keep notified_at NULL → replay
+        self._counters["retried"] += 1
+        delay = OUTBOX_RETRY_SECONDS[min(entry.attempts, len(OUTBOX_RETRY_SECONDS)) - 1]
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, entry)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._counters, "pending": self._queue.qsize(), "delivering": len(self._deliveries)}
+
+
+notification_outbox = NotificationOutbox()
@@ -5,10 +5,10 @@ from fastapi import HTTPException
 from typing import Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import select, and_, func, delete, or_, update, any_
+from sqlalchemy import select, and_, func, delete, or_, update, any_, exists
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.match_model import View, Swipe, Like, Match
-from models.user_model import User, Notification, UserMedia
+from models.user_model import User, UserMedia
 from models.message_model import Message
 from models.block_model import UserBlock
 
@@ -21,6 +21,7 @@ UNDO_COOLDOWN_MINUTES = 5     # undo must happen within 5 minutes
 UNDO_DAILY_LIMIT = 3          # max 3 undos per day
 MAX_MATCHES_PER_DAY = 15
 BASE_URL = "http://127.0.0.1:8000"
+MESSAGE_PREVIEW_MAX = 255     # notifications.message_preview is VARCHAR(255)
 
 
 
@@ -92,6 +93,10 @@ async def record_swipe(
         await db.commit()
         await db.refresh(swipe_obj)
 
+    # 📦 Swiped profile leaves the swiper's precomputed queues
+    from services.candidate_queue import candidate_queue
+    await candidate_queue.discard(swiper_id, swiped_id)
+
     # 5️⃣ Left swipe → nothing else
     if not liked:
         return {"created": True, "is_mutual": False, "swipe_id": str(swipe_obj.id)}
@@ -298,6 +303,10 @@ async def undo_last_swipe(db: AsyncSession, user_id: str):
     await db.commit()
     await db.refresh(last_swipe)
 
+    # Rewound profile becomes eligible again → rebuild queues
+    from services.candidate_queue import candidate_queue
+    await candidate_queue.invalidate(user_id)
+
     # 6️⃣ If it was a right swipe, deactivate match silently
     if last_swipe.liked:
         match = await db.scalar(
@@ -471,6 +480,10 @@ async def unmatch_user(db: AsyncSession, user_id: str, target_id: str):
 
     await db.commit()
 
+    from services.candidate_queue import candidate_queue
+    await candidate_queue.discard(user_id, target_id)
+    await candidate_queue.discard(target_id, user_id)
+
     # 5) Notify self only
     await create_and_push_notification(
         db=db,
@@ -627,30 +640,21 @@ async def mark_message_delivered_in_db(db: AsyncSession, message_id: str):
 
 
 
-async def create_and_push_notification(
-    db: AsyncSession,
-    recipient_id: str,                   # who receives it
-    notif_type: str,                     # "like" | "view" | "match" | ...
-    actor_id: Optional[str] = None,      # who triggered it
-    actor_name: Optional[str] = None,    # optional friendly name
-    target_id: Optional[str] = None,     # secondary user reference (match partner, etc.)
+def notification_row(
+    recipient_id: str,
+    notif_type: str,
+    actor_id: Optional[str] = None,
+    actor_name: Optional[str] = None,
+    target_id: Optional[str] = None,
     conversation_id: Optional[str] = None,
     message_preview: Optional[str] = None,
     meta: Optional[Dict[str, Any]] = None,
-):
-    """
-    Creates a Notification row and immediately sends it in real time over WebSocket.
-    If user is offline, the record is left with notified_at=None for replay later.
-    """
-    from utils.socket_manager import manager
-
+) -> Dict[str, Any]:
+    """Column values of a new Notification (not yet notified), payload included."""
     notif_id = uuid.uuid4()
     now = datetime.now(timezone.utc)
-
-    # 🧩 Resolve actor_name if not provided
-    if actor_id and not actor_name:
-        result = await db.execute(select(User.full_name).where(User.id == actor_id))
-        actor_name = result.scalar_one_or_none()
+    if message_preview and len(message_preview) > MESSAGE_PREVIEW_MAX:
+        message_preview = message_preview[:MESSAGE_PREVIEW_MAX - 1] + "…"
 
     # 🧱 Build payload
     payload = {
@@ -665,71 +669,87 @@ async def create_and_push_notification(
         "created_at": now.isoformat(),
     }
 
-    # 🗃️ Create the DB row first (not yet marked notified)
-    notif = Notification(
-        id=notif_id,
-        user_id=recipient_id,
-        type=notif_type,
+    return {
+        "id": notif_id,
+        "user_id": recipient_id,
+        "type": notif_type,
+        "actor_id": actor_id,
+        "actor_name": actor_name,
+        "target_id": target_id,
+        "conversation_id": conversation_id,
+        "message_preview": message_preview,
+        "payload": payload,
+        "is_read": False,
+        "created_at": now,
+        "notified_at": None,   # 👈 important: means "not yet pushed"
+    }
+
+
+def notification_event(row) -> Dict[str, Any]:
+    """WebSocket frame for a notification (row = Notification or notification_row() dict)."""
+    get = row.get if isinstance(row, dict) else (lambda k: getattr(row, k))
+    return {
+        "event": "notification",
+        "data": {
+               "id": str(get("id")),
+               "type": get("type"),
+               "actor_id": get("actor_id"),
+               "actor_name": get("actor_name"),
+               "target_id": get("target_id"),
+               "conversation_id": get("conversation_id"),
+               "message_preview": get("message_preview"),
+               "timestamp": get("created_at").isoformat(),
+               "payload": get("payload"),    # keep the old structure EXACTLY as-is
+               }
+    }
+
+
+async def create_and_push_notification(
+    db: AsyncSession,
+    recipient_id: str,                   # who receives it
+    notif_type: str,                     # "like" | "view" | "match" | ...
+    actor_id: Optional[str] = None,      # who triggered it
+    actor_name: Optional[str] = None,    # optional friendly name
+    target_id: Optional[str] = None,     # secondary user reference (match partner, etc.)
+    conversation_id: Optional[str] = None,
+    message_preview: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+):
+    """
+    Queues a Notification for the background outbox and returns its row right away.
+    The outbox inserts it (batched), pushes it over WebSocket if the user is
+    online and stamps notified_at; offline users get it on replay as before.
+    `db` is kept for callers' convenience – no query runs on it anymore.
+    """
+    from services.notification_outbox import notification_outbox
+
+    row = notification_row(
+        recipient_id, notif_type,
         actor_id=actor_id,
-        actor_name=actor_name,
+        actor_name=actor_name,          # resolved in bulk by the outbox when missing
         target_id=target_id,
         conversation_id=conversation_id,
         message_preview=message_preview,
-        payload=payload,
-        is_read=False,
-        created_at=now,
-        notified_at=None,   # 👈 important: means "not yet pushed"
+        meta=meta,
     )
+    notification_outbox.add(row)
+    return row
 
-    db.add(notif)
-    await db.commit()
-    await db.refresh(notif)
-
-    # 📡 Try to push in real-time
-    try:
-        success = await manager.send_personal_message(recipient_id, {
-            "event": "notification",
-            "data": {
-                   "id": str(notif.id),
-                   "type": notif.type,
-                   "actor_id": notif.actor_id,
-                   "actor_name": notif.actor_name,
-                   "target_id": notif.target_id,
-                   "conversation_id": notif.conversation_id,
-                   "message_preview": notif.message_preview,
-                   "timestamp": notif.created_at.isoformat(),
-                   "payload": notif.payload,    # keep the old structure EXACTLY as-is
-                   }
-
-        })
-
-        if success:
-            # ✅ Mark as notified
-            notif.notified_at = datetime.now(timezone.utc)
-            db.add(notif)
-            await db.commit()
-            print(f"✅ Notification {notif_id} delivered live to {recipient_id}")
-        else:
-            print(f"📨 Stored offline notification for {recipient_id}")
-
-    except Exception as e:
-        # 🧩 If failed (user offline or WS closed)
-        print(f"⚠️ Failed to send notification {notif_id} to {recipient_id}: {e}")
-
-    return notif
 
-
-async def fetch_user_media_map(db, user_ids: list[str]):
+async def fetch_user_media_map(db, user_ids: list[str], size: str = "card"):
     """
     Returns dict -> { user_id: [photo_urls...] }
     Always sorted by created_at.
-    Always normalized to full URLs.
+    Always normalized to full URLs, at the `size` variant ("thumb" | "card" | "gallery")
+    for content-addressed photos.
     """
+    from services.image_variants import photo_url
+
     if not user_ids:
         return {}
 
     stmt = (
-        select(UserMedia.user_id, UserMedia.file_path)
+        select(UserMedia.user_id, UserMedia.file_path, UserMedia.content_hash)
         .where(
             UserMedia.user_id.in_(user_ids),
             UserMedia.media_type == "image"
@@ -742,38 +762,35 @@ async def fetch_user_media_map(db, user_ids: list[str]):
 
     media_map = {}
 
-    for uid, path in rows:
-        uid = str(uid)
+    for uid, path, content_hash in rows:
+        media_map.setdefault(str(uid), []).append(photo_url(path, content_hash, size))
 
-        # Normalize URL
-        url = (
-            path if path.startswith("http")
-            else f"{BASE_URL}/{path.lstrip('/')}"
-        )
+    return media_map
 
-        media_map.setdefault(uid, []).append(url)
 
-    return media_map
 
+def block_state_columns(sender_id, receiver_id) -> list:
+    """Both block directions as labelled EXISTS columns, for one-query send checks."""
+    return [
+        exists().where(
+            (UserBlock.blocker_id == receiver_id) & (UserBlock.blocked_id == sender_id)
+        ).label("blocked_by_receiver"),
+        exists().where(
+            (UserBlock.blocker_id == sender_id) & (UserBlock.blocked_id == receiver_id)
+        ).label("sender_has_blocked"),
+    ]
 
 
-async def assert_can_send(db, sender_id, receiver_id):
+def raise_if_blocked(row) -> None:
     # Case 1: receiver blocked sender → sender cannot message
-    blocked_by_receiver = await db.scalar(
-        select(UserBlock).where(
-            (UserBlock.blocker_id == receiver_id) &
-            (UserBlock.blocked_id == sender_id)
-        )
-    )
-    if blocked_by_receiver:
+    if row.blocked_by_receiver:
         raise HTTPException(403, "You cannot message this user. They have blocked you.")
 
     # Case 2: sender blocked receiver → sender cannot message either
-    sender_has_blocked = await db.scalar(
-        select(UserBlock).where(
-            (UserBlock.blocker_id == sender_id) &
-            (UserBlock.blocked_id == receiver_id)
-        )
-    )
-    if sender_has_blocked:
+    if row.sender_has_blocked:
         raise HTTPException(403, "You have blocked this user.")
+
+
+async def assert_can_send(db, sender_id, receiver_id):
+    row = (await db.execute(select(*block_state_columns(sender_id, receiver_id)))).one()
+    raise_if_blocked(row)
@@ -0,0 +1,108 @@
+# services/profile_media_service.py
+
+
+import asyncio
+import shutil
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.user_model import UserMedia
+from services.media_pipeline import media_pipeline, MediaQueueFull
+from services.image_variants import BASE_URL, content_dir, variant_url, store_content_addressed
+from utils.uploads import StoredUpload, receive_upload
+
+
+PROFILE_MEDIA_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "video/mp4": ".mp4"}
+
+
+def _lock_content(content_hash: str):
+    """
+    Transaction-scoped advisory lock on one content directory, held until
+    commit / rollback: storing (files + row) and releasing (count + rmtree)
+    the same hash never interleave.
+    """
+    return select(func.pg_advisory_xact_lock(func.hashtext(content_hash)))
+
+
+async def receive_profile_media(request: Request) -> StoredUpload:
+    """Stream a profile upload in: JPEG / PNG / MP4 by magic bytes, settings.MAX_UPLOAD_MB."""
+    try:
+        media_pipeline.check_capacity()
+    except MediaQueueFull:
+        raise HTTPException(status_code=503, detail="Media processing is busy, try again shortly")
+    try:
+        return await receive_upload(request, allowed=PROFILE_MEDIA_TYPES, digest=True)   # content-addressed
+    except HTTPException as e:
+        if e.status_code == 415:
+            raise HTTPException(status_code=400, detail="Only JPEG, PNG, or MP4 allowed")
+        raise
+
+
+async def save_profile_media(
+    db: AsyncSession,
+    user_id,
+    upload: StoredUpload,
+    is_verified: bool = False,
+) -> Tuple[UserMedia, str]:
+    """
+    Store a profile photo / video content-addressed, with the WebP (+AVIF)
+    ladder for images built in the media worker pool.
+
+    Returns (row, original_url). The row's file_path is the 1080px WebP for
+    images (what galleries and avatars show) and the file itself for videos.
+    The same user uploading the same bytes again gets their existing row back.
+    Caller commits.
+    """
+    ext = PROFILE_MEDIA_TYPES[upload.mime]
+    media_type = "video" if upload.mime.startswith("video/") else "image"
+
+    # until the caller commits, so release_content() sees the new row before it counts
+    await db.execute(_lock_content(upload.sha256))
+    try:
+        stored = await media_pipeline.call(
+            f"profile_{media_type}", store_content_addressed,
+            upload.path, ext, media_type == "image", upload.sha256,
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail="Media processing timed out")
+    except Exception as e:
+        print(f"⚠️ Profile media rejected: {e}")
+        raise HTTPException(status_code=400, detail="Could not read the uploaded image")
+    finally:
+        upload.discard()
+
+    content_hash = stored["hash"]
+    original_url = f"{BASE_URL}/{stored['original']}"
+
+    existing = await db.scalar(
+        select(UserMedia).where(UserMedia.user_id == user_id, UserMedia.content_hash == content_hash)
+    )
+    if existing:
+        existing.is_verified = existing.is_verified or is_verified
+        return existing, original_url
+
+    media = UserMedia(
+        user_id=user_id,
+        file_path=variant_url(content_hash, "gallery") if media_type == "image" else original_url,
+        media_type=media_type,
+        is_verified=is_verified,
+        content_hash=content_hash,
+    )
+    db.add(media)
+    return media, original_url
+
+
+async def release_content(db: AsyncSession, content_hash: Optional[str]) -> None:
+    """Remove a content directory once no UserMedia row points at it anymore (after commit)."""
+    if not content_hash:
+        return
+    await db.execute(_lock_content(content_hash))
+    try:
+        still_used = await db.scalar(
+            select(func.count()).select_from(UserMedia).where(UserMedia.content_hash == content_hash)
+        )
+        if not still_used:
+            await asyncio.to_thread(shutil.rmtree, content_dir(content_hash), True)
+    finally:
+        await db.commit()   # releases the lock
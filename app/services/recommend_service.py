@@ -1,15 +1,68 @@
 # services/recommend_service.py
 
-from typing import List, Optional
-import math
+from typing import List, NamedTuple, Optional, Tuple
 from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
-from utils.location import haversine_distance
+from sqlalchemy import select, exists
+from utils.location import earth_point, earth_distance_km, within_radius
 from models.user_model import User
 from models.profile_model import Profile
-from schemas.match_schema import MatchResponse
-from utils.match_logic import compute_compatibility_score
+from models.match_model import Match, Swipe
+from models.block_model import UserBlock
+from schemas.match_schema import MatchFilters, MatchResponse
+from utils.scoring import (
+    column, timestamps_us, clamp01, proximity_score, recency_score,
+    premium_boost, match_scores, compatibility_scores, top_k,
+)
+from utils.vector_search import ann_search
+from utils.sampling import RandomSampler
+
+
+MAX_PROXIMITY_CANDIDATES = 2000   # nearest users scored per request; farther ones are cut first
+MAX_GALLERY_PHOTOS = 6            # gallery feeds; single-card feeds send one "card" size photo
+
+
+# -------------------------------
+# 🔹 Shared exclusion layer
+# -------------------------------
+def candidate_exclusions(current_user_id) -> list:
+    """
+    WHERE conditions that drop users the viewer must not be shown again:
+    already right-swiped, active match in either direction, blocked / hidden
+    in either direction.
+
+    Written as correlated NOT EXISTS so Postgres plans them as anti-joins on
+    the (swiper_id, swiped_id), (user_id, target_id) and (blocker_id, blocked_id)
+    indexes — the candidate LIMIT then already counts only eligible users.
+    """
+    return [
+        ~exists().where(
+            Swipe.swiper_id == current_user_id,
+            Swipe.swiped_id == User.id,
+            Swipe.liked.is_(True),
+            Swipe.undone.is_(False),
+        ),
+        # one probe per direction keeps each lookup on idx_match_user_target
+        ~exists().where(
+            Match.user_id == current_user_id,
+            Match.target_id == User.id,
+            Match.is_active.is_(True),
+        ),
+        ~exists().where(
+            Match.user_id == User.id,
+            Match.target_id == current_user_id,
+            Match.is_active.is_(True),
+        ),
+        ~exists().where(
+            UserBlock.blocker_id == current_user_id,
+            UserBlock.blocked_id == User.id,
+        ),
+        ~exists().where(
+            UserBlock.blocker_id == User.id,
+            UserBlock.blocked_id == current_user_id,
+        ),
+    ]
 
 
 async def get_proximity_first(
@@ -21,7 +74,7 @@ async def get_proximity_first(
 
     from services.notification_service import fetch_user_media_map
 
-    if not (current_user.latitude and current_user.longitude):
+    if current_user.latitude is None or current_user.longitude is None:
         return []
 
     current_profile = await db.scalar(
@@ -30,10 +83,10 @@ async def get_proximity_first(
     if not current_profile or current_profile.embedding is None:
         return []
 
-    lat, lon = current_user.latitude, current_user.longitude
-
-    lat_range = radius_km / 111
-    lon_range = radius_km / (111 * math.cos(lat * math.pi / 180))
+    # 🌍 Radius search on the GiST earth index, nearest first
+    origin = earth_point(current_user.latitude, current_user.longitude)
+    target = earth_point(User.latitude, User.longitude)
+    distance = earth_distance_km(origin, target)
 
     stmt = (
         select(
@@ -41,10 +94,9 @@ async def get_proximity_first(
             User.full_name,
             User.age,
             User.bio,
-            User.latitude,
-            User.longitude,
             User.last_active,
             User.premium_tier,
+            distance.label("distance_km"),
             (1 - Profile.embedding.l2_distance(current_profile.embedding)).label("similarity"),
         )
         .join(Profile, Profile.user_id == User.id)
@@ -52,11 +104,12 @@ async def get_proximity_first(
             User.id != current_user.id,
             User.is_active.is_(True),
             User.is_profile_hidden.is_(False),
-            User.latitude.between(lat - lat_range, lat + lat_range),
-            User.longitude.between(lon - lon_range, lon + lon_range),
+            *within_radius(origin, target, radius_km),
             Profile.embedding.isnot(None),
+            *candidate_exclusions(current_user.id),
         )
-        .limit(500)
+        .order_by(distance)
+        .limit(MAX_PROXIMITY_CANDIDATES)
     )
 
     result = await db.execute(stmt)
@@ -64,30 +117,27 @@ async def get_proximity_first(
     if not candidates:
         return []
 
-    # 🔥 Bulk media lookup
-    candidate_ids = [str(c.id) for c in candidates]
-    media_map = await fetch_user_media_map(db, candidate_ids)
-
-    matches = []
+    # 🧮 Score every candidate in one vectorized pass
     now = datetime.now(timezone.utc)
+    distance_km = column(c.distance_km for c in candidates)
+    embedding_score = clamp01(column(c.similarity for c in candidates))
+    recency = recency_score(timestamps_us(c.last_active for c in candidates), now)
+
+    base_score = (0.5 * proximity_score(distance_km, radius_km)) + (0.4 * embedding_score) + (0.1 * recency)
+    final_score = premium_boost(
+        base_score,
+        candidate_tier=column(c.premium_tier for c in candidates),
+        current_tier=current_user.premium_tier,
+    )
+    scores = match_scores(final_score)
+    best = top_k(scores, limit)
 
-    for c in candidates:
-        distance_km = haversine_distance(lat, lon, c.latitude, c.longitude)
-        if distance_km > radius_km:
-            continue
-
-        proximity_score = max(0, 1 - (distance_km / radius_km))
-        embedding_score = max(0, min(1, c.similarity))
-        recency_hours = (now - c.last_active).total_seconds() / 3600
-        recency_score = max(0.5, min(1.0, 1 - recency_hours / 24))
-
-        base_score = (0.5 * proximity_score) + (0.4 * embedding_score) + (0.1 * recency_score)
-        final_score = apply_premium_boost(
-            base_score,
-            candidate_tier=c.premium_tier,
-            current_tier=current_user.premium_tier,
-        )
+    # 🔥 Bulk media lookup (winners only)
+    media_map = await fetch_user_media_map(db, [str(candidates[i].id) for i in best])
 
+    matches = []
+    for i in best:
+        c = candidates[i]
         uid = str(c.id)
         photos = media_map.get(uid, [])
 
@@ -97,14 +147,13 @@ async def get_proximity_first(
                 full_name=c.full_name or "",
                 age=c.age or 0,
                 bio=c.bio or "",
-                match_score=int(final_score * 100),
-                distance_km=round(distance_km, 2),
+                match_score=int(scores[i]),
+                distance_km=round(c.distance_km, 2),
                 photos=photos[:1],
             )
         )
 
-    matches.sort(key=lambda x: x.match_score, reverse=True)
-    return matches[:limit]
+    return matches
 
 
 
@@ -146,7 +195,8 @@ def compute_preference_alignment(current_user: User, candidate: User) -> float:
 async def get_compatibility_first_recommendations(
     db: AsyncSession,
     current_user: User,
-    limit: int = 20
+    limit: int = 20,
+    ef_search: Optional[int] = None,
 ) -> list[MatchResponse]:
 
     from services.notification_service import fetch_user_media_map
@@ -157,40 +207,46 @@ async def get_compatibility_first_recommendations(
     if not current_profile or current_profile.embedding is None:
         return []
 
-    stmt = (
-        select(
-            User.id,
-            User.full_name,
-            User.age,
-            User.gender,
-            User.preference,
-            User.bio,
-            (1 - Profile.embedding.l2_distance(current_profile.embedding)).label("similarity"),
-        )
-        .join(Profile, Profile.user_id == User.id)
-        .where(
-            User.id != current_user.id,
-            User.is_active.is_(True),
-            User.is_profile_hidden.is_(False),
-            Profile.embedding.isnot(None),
+    # 🔎 ANN retrieval (HNSW) → post-filter on user flags
+    def build(nn):
+        return (
+            select(
+                User.id,
+                User.full_name,
+                User.age,
+                User.gender,
+                User.preference,
+                User.bio,
+                (1 - nn.c.distance).label("similarity"),
+            )
+            .join(nn, nn.c.user_id == User.id)
+            .where(
+                User.id != current_user.id,
+                User.is_active.is_(True),
+                User.is_profile_hidden.is_(False),
+                *candidate_exclusions(current_user.id),
+            )
+            .order_by(nn.c.distance)
+            .limit(limit * 3)
         )
-        .order_by(desc("similarity"))
-        .limit(limit * 3)
+
+    candidates = await ann_search(
+        db, current_profile.embedding, "compatibility", limit, build,
+        wanted=limit, ef_search=ef_search,
     )
 
-    result = await db.execute(stmt)
-    candidates = result.all()
+    # 🧮 Vectorized scoring (preference alignment stays per-row: string matching)
+    pref_score = column(compute_preference_alignment(current_user, c) for c in candidates)
+    embedding_score = clamp01(column(c.similarity for c in candidates))
+    scores = match_scores((0.7 * embedding_score) + (0.3 * pref_score))
+    best = top_k(scores, limit)
 
-    # 🔥 Bulk media lookup
-    candidate_ids = [str(c.id) for c in candidates]
-    media_map = await fetch_user_media_map(db, candidate_ids)
+    # 🔥 Bulk media lookup (winners only)
+    media_map = await fetch_user_media_map(db, [str(candidates[i].id) for i in best])
 
     matches = []
-    for c in candidates:
-        pref_score = compute_preference_alignment(current_user, c)
-        embedding_score = max(0, min(1, c.similarity))
-        final_score = (0.7 * embedding_score) + (0.3 * pref_score)
-
+    for i in best:
+        c = candidates[i]
         uid = str(c.id)
         photos = media_map.get(uid, [])
 
@@ -200,14 +256,13 @@ async def get_compatibility_first_recommendations(
                 full_name=c.full_name or "",
                 age=c.age or 0,
                 bio=c.bio or "",
-                match_score=int(final_score * 100),
+                match_score=int(scores[i]),
                 distance_km=None,
                 photos=photos[:1],
             )
         )
 
-    matches.sort(key=lambda x: x.match_score, reverse=True)
-    return matches[:limit]
+    return matches
 
 
 # -------------------------------
@@ -217,7 +272,8 @@ async def get_fresh_faces_recommendations(
     db: AsyncSession,
     current_user: User,
     limit: int = 20,
-) -> list[MatchResponse]:
+    cursor: Optional[str] = None,
+) -> Tuple[list[MatchResponse], Optional[str]]:
 
     from services.notification_service import fetch_user_media_map
 
@@ -236,13 +292,14 @@ async def get_fresh_faces_recommendations(
             User.is_active.is_(True),
             User.is_profile_hidden.is_(False),
             User.last_active >= cutoff_time,
+            *candidate_exclusions(current_user.id),
         )
-        .order_by(func.random())
-        .limit(limit)
     )
 
-    result = await db.execute(stmt)
-    candidates = result.all()
+    # 🎲 keyset-random page instead of ORDER BY random()
+    sampler = RandomSampler(User.random_key, cursor)
+    candidates = await sampler.fetch(db, stmt, limit)
+    next_cursor = sampler.cursor_after(candidates[-1]) if len(candidates) == limit else None
 
     # 🔥 Bulk media lookup
     candidate_ids = [str(c.id) for c in candidates]
@@ -266,7 +323,7 @@ async def get_fresh_faces_recommendations(
             )
         )
 
-    return matches
+    return matches, next_cursor
 
 
 def apply_premium_boost(base_score: float, candidate_tier: int, current_tier: int) -> float:
@@ -287,6 +344,7 @@ async def get_boosted_tier_recommendations(
     db: AsyncSession,
     current_user: User,
     limit: int = 20,
+    ef_search: Optional[int] = None,
 ) -> list[MatchResponse]:
     """
     Mode 4 – Boosted Tier
@@ -299,57 +357,61 @@ async def get_boosted_tier_recommendations(
     if not current_profile or current_profile.embedding is None:
         return []
 
-    stmt = (
-        select(
-            User.id,
-            User.full_name,
-            User.age,
-            User.bio,
-            User.gender,
-            User.preference,
-            User.premium_tier,
-            (1 - Profile.embedding.l2_distance(current_profile.embedding)).label("similarity"),
-        )
-        .join(Profile, Profile.user_id == User.id)
-        .where(
-            User.id != current_user.id,
-            User.is_active.is_(True),
-            User.is_profile_hidden.is_(False),
-            Profile.embedding.isnot(None),
+    def build(nn):
+        return (
+            select(
+                User.id,
+                User.full_name,
+                User.age,
+                User.bio,
+                User.gender,
+                User.preference,
+                User.premium_tier,
+                (1 - nn.c.distance).label("similarity"),
+            )
+            .join(nn, nn.c.user_id == User.id)
+            .where(
+                User.id != current_user.id,
+                User.is_active.is_(True),
+                User.is_profile_hidden.is_(False),
+                *candidate_exclusions(current_user.id),
+            )
+            .order_by(nn.c.distance)
+            .limit(limit * 3)
         )
-        .order_by(desc("similarity"))
-        .limit(limit * 3)
+
+    candidates = await ann_search(
+        db, current_profile.embedding, "boosted", limit, build,
+        wanted=limit, ef_search=ef_search,
     )
 
-    result = await db.execute(stmt)
-    candidates = result.all()
-    matches = []
+    pref_score = column(compute_preference_alignment(current_user, c) for c in candidates)
+    embedding_score = clamp01(column(c.similarity for c in candidates))
+    base_score = (embedding_score * 0.7) + (pref_score * 0.3)
 
-    for c in candidates:
-        pref_score = compute_preference_alignment(current_user, c)
-        embedding_score = max(0, min(1, c.similarity))
-        base_score = (embedding_score * 0.7) + (pref_score * 0.3)
-
-        # 🎯 Apply visibility boost
-        boosted_score = apply_premium_boost(
-            base_score,
-            candidate_tier=c.premium_tier or 0,
-            current_tier=current_user.premium_tier or 0,
-        )
+    # 🎯 Apply visibility boost
+    boosted_score = premium_boost(
+        base_score,
+        candidate_tier=column(c.premium_tier for c in candidates),
+        current_tier=current_user.premium_tier,
+    )
+    scores = match_scores(boosted_score)
 
+    matches = []
+    for i in top_k(scores, limit):
+        c = candidates[i]
         matches.append(
             MatchResponse(
                 user_id=str(c.id),
                 full_name=c.full_name or "",
                 age=c.age or 0,
                 bio=c.bio or "",
-                match_score=int(boosted_score * 100),
+                match_score=int(scores[i]),
                 distance_km=None,
             )
         )
 
-    matches.sort(key=lambda x: x.match_score, reverse=True)
-    return matches[:limit]
+    return matches
 
 
 
@@ -360,6 +422,7 @@ async def get_age_filtered_recommendations(
     min_age: int = 18,
     max_age: int = 100,
     gender: Optional[List[str]] = None,
+    ef_search: Optional[int] = None,
 ) -> list[MatchResponse]:
 
     from services.notification_service import fetch_user_media_map
@@ -391,54 +454,58 @@ async def get_age_filtered_recommendations(
         User.is_active.is_(True),
         User.is_profile_hidden.is_(False),
         User.age.between(min_age, max_age),
-        Profile.embedding.isnot(None),
+        *candidate_exclusions(current_user.id),
     ]
 
     if gender:
         normalized = [CANONICAL.get(g.lower(), g.lower()) for g in gender]
         conditions.append(User.gender.in_(normalized))
 
-    stmt = (
-        select(
-            User.id,
-            User.full_name,
-            User.age,
-            User.bio,
-            User.last_active,
-            User.premium_tier,
-            (1 - Profile.embedding.l2_distance(current_profile.embedding)).label("similarity"),
+    # 🔎 Nearest neighbours first, age/gender filters applied on top
+    def build(nn):
+        return (
+            select(
+                User.id,
+                User.full_name,
+                User.age,
+                User.bio,
+                User.last_active,
+                User.premium_tier,
+                (1 - nn.c.distance).label("similarity"),
+            )
+            .join(nn, nn.c.user_id == User.id)
+            .where(*conditions)
+            .order_by(nn.c.distance)
         )
-        .join(Profile, Profile.user_id == User.id)
-        .where(*conditions)
-        .limit(500)
-    )
 
-    result = await db.execute(stmt)
-    candidates = result.all()
+    candidates = await ann_search(
+        db, current_profile.embedding, "filtered", limit, build,
+        wanted=limit, ef_search=ef_search,
+    )
 
     if not candidates:
         return []
 
-    # 🔥 Bulk media lookup
-    candidate_ids = [str(c.id) for c in candidates]
-    media_map = await fetch_user_media_map(db, candidate_ids)
-
-    matches = []
+    # 🧮 Vectorized scoring
     now = datetime.now(timezone.utc)
+    embedding_score = clamp01(column(c.similarity for c in candidates))
+    recency = recency_score(timestamps_us(c.last_active for c in candidates), now)
+
+    base_score = (0.4 * embedding_score) + (0.6 * recency)
+    final_score = premium_boost(
+        base_score,
+        candidate_tier=column(c.premium_tier for c in candidates),
+        current_tier=current_user.premium_tier,
+    )
+    scores = match_scores(final_score)
+    best = top_k(scores, limit)
 
-    for c in candidates:
-
-        embedding_score = max(0, min(1, c.similarity))
-        recency_hours = (now - c.last_active).total_seconds() / 3600
-        recency_score = max(0.5, min(1.0, 1 - recency_hours / 24))
-
-        base_score = (0.4 * embedding_score) + (0.6 * recency_score)
-        final_score = apply_premium_boost(
-            base_score,
-            candidate_tier=c.premium_tier,
-            current_tier=current_user.premium_tier,
-        )
+    # 🔥 Bulk media lookup (winners only)
+    media_map = await fetch_user_media_map(db, [str(candidates[i].id) for i in best], size="gallery")
 
+    matches = []
+    for i in best:
+        c = candidates[i]
         uid = str(c.id)
         photos = media_map.get(uid, [])
 
@@ -448,11 +515,130 @@ async def get_age_filtered_recommendations(
                 full_name=c.full_name or "",
                 age=c.age or 0,
                 bio=c.bio or "",
-                match_score=int(final_score * 100),
+                match_score=int(scores[i]),
                 distance_km=None,
-                photos=photos,
+                photos=photos[:MAX_GALLERY_PHOTOS],
             )
         )
 
-    matches.sort(key=lambda x: x.match_score, reverse=True)
-    return matches[:limit]
\ No newline at end of file
+    return matches
+
+
+# -------------------------------
+# 🔹 Service: Default discovery feed (shuffled)
+# -------------------------------
+class DiscoveryEntry(NamedTuple):
+    match: MatchResponse
+    score: float
+    cursor: str          # resumes the shuffled walk right after this candidate
+
+
+def rank_discovery_page(entries: List[DiscoveryEntry]) -> List[MatchResponse]:
+    """Best first; stable, so ties keep sampled order exactly like top_k."""
+    return [e.match for e in sorted(entries, key=lambda e: e.score, reverse=True)]
+
+
+async def get_discovery_recommendations(
+    db: AsyncSession,
+    current_user: User,
+    filters: MatchFilters,
+) -> Tuple[list[MatchResponse], Optional[str]]:
+    """
+    Shuffled discovery page. Returns (matches, next_cursor).
+    Exclusions run inside the sampled query, so exactly `filters.limit`
+    candidates are loaded per request.
+    """
+    entries = await get_discovery_window(db, current_user, filters)
+
+    # A full page means more eligible users may follow
+    next_cursor = entries[-1].cursor if len(entries) == filters.limit else None
+
+    return rank_discovery_page(entries), next_cursor
+
+
+async def get_discovery_window(
+    db: AsyncSession,
+    current_user: User,
+    filters: MatchFilters,
+) -> List[DiscoveryEntry]:
+    """
+    Up to `filters.limit` scored candidates in sampled (shuffled) order, each
+    with the cursor that resumes after it — the candidate queue slices pages
+    out of one window and still hands out exact cursors.
+    """
+
+    from services.notification_service import fetch_user_media_map
+
+    # 1️⃣ Ensure current user has embedding
+    user_profile = await db.scalar(
+        select(Profile).where(Profile.user_id == current_user.id)
+    )
+    if not user_profile or user_profile.embedding is None:
+        raise HTTPException(
+            status_code=400,
+            detail="User profile not ready. Please complete profile creation first.",
+        )
+
+    # 2️⃣ Sample eligible candidates (not self, hidden, swiped, matched or blocked) in shuffled keyset order
+    candidates_stmt = (
+        select(
+            User.id,
+            User.full_name,
+            User.age,
+            User.bio,
+            User.latitude,
+            User.longitude,
+            (1 - (Profile.embedding.l2_distance(user_profile.embedding))).label(
+                "similarity"
+            ),
+        )
+        .join(Profile, Profile.user_id == User.id)
+        .where(
+            User.id != current_user.id,
+            User.is_profile_hidden.is_(False),
+            User.age >= filters.min_age,
+            User.age <= filters.max_age,
+            Profile.embedding.isnot(None),
+            *candidate_exclusions(current_user.id),
+        )
+    )
+
+    sampler = RandomSampler(User.random_key, filters.cursor)
+    candidates = await sampler.fetch(db, candidates_stmt, filters.limit)
+
+    if not candidates:
+        return []
+
+    candidate_ids = [r.id for r in candidates]
+
+    # 3️⃣ Bulk media lookup: gallery-size variants, at most MAX_GALLERY_PHOTOS each
+    media_map = await fetch_user_media_map(db, [str(i) for i in candidate_ids], size="gallery")
+
+    # 4️⃣ Score the window in one vectorized pass (ranking is left to the page)
+    scores, distance_km = compatibility_scores(
+        column((r.similarity for r in candidates), 0.0),
+        column((r.latitude for r in candidates), float("nan")),
+        column((r.longitude for r in candidates), float("nan")),
+        current_user.latitude,
+        current_user.longitude,
+        filters.max_distance_km,
+    )
+
+    entries: List[DiscoveryEntry] = []
+
+    for i, r in enumerate(candidates):
+        uid = str(r.id)
+        d = float(distance_km[i])
+
+        match = MatchResponse(
+            user_id=uid,
+            full_name=r.full_name or "",
+            age=r.age or 0,
+            bio=r.bio or "",
+            match_score=int(scores[i]),
+            distance_km=round(d, 2) if d == d and d else None,   # NaN → no location
+            photos=media_map.get(uid, [])[:MAX_GALLERY_PHOTOS],  # 🔥 gallery, not just [:1]
+        )
+        entries.append(DiscoveryEntry(match, float(scores[i]), sampler.cursor_after(r)))
+
+    return entries
@@ -0,0 +1,201 @@
+# services/typing_service.py
+
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple
+from sqlalchemy import exists, select
+from db.session import async_session
+from models.message_model import Conversation
+from services.conversation_service import ordered_pair
+from utils.socket_manager import manager
+
+
+TYPING_TTL_SECONDS = 3.0        # no `typing` for this long → stopped, even without `stop_typing`
+TYPING_REFRESH_SECONDS = 2.0    # re-announce while typing continues (clients hide after 2.5s)
+STOP_GRACE_SECONDS = 0.3        # a stop followed quickly by typing again sends nothing
+SWEEP_INTERVAL_SECONDS = 0.25
+
+TYPING_BURST = 5                # frames a sender may emit back to back …
+TYPING_FRAMES_PER_SECOND = 1.0  # … then refilled at this rate, across all receivers
+PAIR_ALLOWED_TTL_SECONDS = 300  # cached "has a conversation" answers
+PAIR_DENIED_TTL_SECONDS = 30    # short, so typing works soon after a first message
+MAX_CACHED_PAIRS = 10_000
+
+
+TypingKey = Tuple[str, str]     # (sender_id, receiver_id)
+
+
+@dataclass
+class _TypingState:
+    expires_at: float
+    announced_at: float
+
+
+@dataclass
+class _Bucket:
+    tokens: float
+    updated_at: float
+
+    def available(self, now: float) -> bool:
+        self.tokens = min(TYPING_BURST, self.tokens + (now - self.updated_at) * TYPING_FRAMES_PER_SECOND)
+        self.updated_at = now
+        return self.tokens >= 1
+
+    def take(self, now: float) -> bool:
+        if not self.available(now):
+            return False
+        self.tokens -= 1
+        return True
+
+
+class TypingAggregator:
+    """
+    Server-side typing state per (sender, receiver).
+
+    Incoming `typing` / `stop_typing` events only update state; frames go out
+    on transitions plus one refresh per TYPING_REFRESH_SECONDS, so a
+    conversation costs at most a frame every couple of seconds however fast
+    the client reports keystrokes. Stale state expires on its own.
+
+    Fan-out is capped per sender too: receivers must share a conversation with
+    the sender, and `typing` frames draw from a per-sender token bucket
+    (TYPING_BURST, refilled at TYPING_FRAMES_PER_SECOND) whatever the receiver.
+    """
+
+    def __init__(self) -> None:
+        self._states: Dict[TypingKey, _TypingState] = {}
+        self._buckets: Dict[str, _Bucket] = {}
+        self._pairs: "OrderedDict[TypingKey, Tuple[bool, float]]" = OrderedDict()   # → (allowed, checked_at)
+        self._tasks: set = set()
+        self._sweeper = None
+        self._counters = {
+            "received": 0, "sent": 0, "coalesced": 0, "dropped": 0, "expired": 0,
+            "rate_limited": 0, "rejected": 0, "pair_lookups": 0,
+        }
+
+    # ───────────── Events ─────────────
+
+    async def typing(self, sender_id: str, receiver_id: str) -> None:
+        self._counters["received"] += 1
+        self._ensure_sweeper()
+
+        key = (str(sender_id), str(receiver_id))
+        now = time.monotonic()
+        state = self._states.get(key)
+
+        if state is None:
+            bucket = self._buckets.setdefault(key[0], _Bucket(TYPING_BURST, now))
+            if not bucket.available(now):          # before any lookup: spraying ids costs nothing
+                self._counters["rate_limited"] += 1
+                return
+            if not await self._allowed(key):
+                self._counters["rejected"] += 1
+                return
+            if key in self._states:                # a concurrent event got there first
+                self._states[key].expires_at = time.monotonic() + TYPING_TTL_SECONDS
+                self._counters["coalesced"] += 1
+                return
+            if not bucket.take(time.monotonic()):
+                self._counters["rate_limited"] += 1
+                return
+            now = time.monotonic()
+            self._states[key] = _TypingState(expires_at=now + TYPING_TTL_SECONDS, announced_at=now)
+            self._emit(key, "typing")
+            return
+
+        state.expires_at = now + TYPING_TTL_SECONDS
+        if now - state.announced_at < TYPING_REFRESH_SECONDS:
+            self._counters["coalesced"] += 1
+        elif self._buckets.setdefault(key[0], _Bucket(TYPING_BURST, now)).take(now):
+            state.announced_at = now
+            self._emit(key, "typing")
+        else:
+            self._counters["rate_limited"] += 1
+
+    def stop_typing(self, sender_id: str, receiver_id: str) -> None:
+        self._counters["received"] += 1
+
+        state = self._states.get((str(sender_id), str(receiver_id)))
+        if state is None:
+            self._counters["dropped"] += 1     # nothing announced, nothing to retract
+            return
+        # let the sweeper send it; typing again within the grace cancels both
+        state.expires_at = min(state.expires_at, time.monotonic() + STOP_GRACE_SECONDS)
+        self._counters["coalesced"] += 1
+
+    def forget_sender(self, sender_id: str) -> None:
+        """Sender disconnected: retract everything they were typing."""
+        sender_id = str(sender_id)
+        self._buckets.pop(sender_id, None)
+        for key in [k for k in self._states if k[0] == sender_id]:
+            self._states.pop(key, None)
+            self._emit(key, "stop_typing")
+
+    # ───────────── Receivers ─────────────
+
+    async def _allowed(self, key: TypingKey) -> bool:
+        """Only receivers the sender already has a conversation with (cached)."""
+        cached = self._pairs.get(key)
+        now = time.monotonic()
+        if cached is not None:
+            allowed, checked_at = cached
+            if now - checked_at < (PAIR_ALLOWED_TTL_SECONDS if allowed else PAIR_DENIED_TTL_SECONDS):
+                self._pairs.move_to_end(key)
+                return allowed
+
+        try:
+            a, b = ordered_pair(*key)
+        except ValueError:
+            return False                           # not a user id at all
+        self._counters["pair_lookups"] += 1
+        try:
+            async with async_session() as db:
+                allowed = bool(await db.scalar(select(exists().where(
+                    Conversation.user_a_id == a, Conversation.user_b_id == b,
+                ))))
+        except Exception as e:
+            print(f"⚠️ Typing receiver check failed for {key[0]}: {e}")
+            return False
+
+        self._pairs[key] = (allowed, now)
+        self._pairs.move_to_end(key)
+        while len(self._pairs) > MAX_CACHED_PAIRS:
+            self._pairs.popitem(last=False)
+        return allowed
+
+    # ───────────── Fan-out ─────────────
+
+    def _emit(self, key: TypingKey, event: str) -> None:
+        self._counters["sent"] += 1
+        sender_id, receiver_id = key
+        task = asyncio.create_task(manager.send_personal_message(receiver_id, {"type": event, "from": sender_id}))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self) -> None:
+        while self._states:
+            await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+            now = time.monotonic()
+            for key in [k for k, s in self._states.items() if s.expires_at <= now]:
+                self._states.pop(key, None)
+                self._counters["expired"] += 1
+                self._emit(key, "stop_typing")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self._counters,
+            "active": len(self._states),
+            "senders": len(self._buckets),
+            "cached_pairs": len(self._pairs),
+            "in_flight": len(self._tasks),
+        }
+
+
+typing_aggregator = TypingAggregator()
@@ -0,0 +1,102 @@
+# test_match_queries.py
+
+
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.session import async_session
+from models.user_model import User, UserMedia
+from models.profile_model import Profile
+from models.match_model import Match
+from models.message_model import Conversation, Message
+from services.match_service import get_user_matches
+
+# get_user_matches must issue the same number of statements however many
+# matches the user has (no per-match lookups). Seeds users, mutual matches,
+# photos, profiles and conversations inside one transaction, counts
+# AsyncSession.execute calls, and rolls everything back.
+#
+#   python test_match_queries.py
+#
+# Needs the usual .env (DATABASE_URL_ASYNC) with migrations applied.
+
+# ===== CONFIGURATION =====
+MATCH_COUNTS = [1, 10, 50]
+EXPECTED_QUERIES = 5
+# =========================
+
+
+def fake_user(tag: str) -> User:
+    uid = uuid.uuid4()
+    return User(id=uid, email=f"qcount-{tag}-{uid}@example.test", hashed_password="x", full_name=tag, age=30)
+
+
+async def seed(db: AsyncSession, n: int) -> uuid.UUID:
+    me = fake_user("me")
+    db.add(me)
+    db.add(Profile(user_id=me.id, preferences={"interests": ["hiking", "jazz"], "values": ["honesty"]}))
+    await db.flush()
+
+    now = datetime.now(timezone.utc)
+    for i in range(n):
+        other = fake_user(f"match{i}")
+        db.add(other)
+        db.add(Profile(user_id=other.id, preferences={"interests": ["jazz"], "values": ["honesty"]}))
+        await db.flush()
+
+        db.add(UserMedia(user_id=other.id, file_path=f"uploads/test/{other.id}.jpg", media_type="image"))
+        db.add(Match(user_id=me.id, target_id=other.id, score=0.8, is_mutual=True, matched_at=now))
+
+        a, b = sorted([me.id, other.id])
+        conv = Conversation(user_a_id=a, user_b_id=b)
+        db.add(conv)
+        await db.flush()
+        msg = Message(sender_id=other.id, receiver_id=me.id, conversation_id=conv.id, content=f"hi {i}")
+        db.add(msg)
+        await db.flush()
+        conv.last_message_id = msg.id
+
+    await db.flush()
+    return me.id
+
+
+async def count_queries(n: int) -> tuple:
+    async with async_session() as db:
+        try:
+            user_id = await seed(db, n)
+
+            calls = []
+            original = db.execute
+
+            async def counting_execute(statement, *args, **kwargs):
+                calls.append(statement)
+                return await original(statement, *args, **kwargs)
+
+            db.execute = counting_execute
+            matches = await get_user_matches(db, user_id)
+            db.execute = original
+            return len(calls), matches
+        finally:
+            await db.rollback()
+
+
+async def check_query_counts():
+    failures = 0
+
+    for n in MATCH_COUNTS:
+        queries, matches = await count_queries(n)
+        previews = sum(1 for m in matches if m["last_message_preview"])
+        ok = queries == EXPECTED_QUERIES and len(matches) == n and previews == n
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {n:>3} matches → {queries} queries, "
+              f"{len(matches)} returned, {previews} with last message")
+
+    if failures:
+        print(f"\n🔥 Test failed: expected {EXPECTED_QUERIES} queries for every match count")
+    else:
+        print(f"\n🎉 get_user_matches stays at {EXPECTED_QUERIES} queries however many matches exist!")
+
+
+if __name__ == "__main__":
+    asyncio.run(check_query_counts())
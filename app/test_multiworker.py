@@ -0,0 +1,97 @@
+# test_multiworker.py
+
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import websockets
+
+# Two app processes sharing the database; users are deliberately split
+# across them so every event has to cross the broker.
+#
+#   python test_multiworker.py
+#
+# Needs the usual .env plus two real user UUIDs.
+
+USER_A = "0073f1db-5306-4b3c-aec5-cd345478064c"
+USER_B = "75a4beac-8df1-4d7c-9d40-2e16eb1b3eda"
+
+PORT_A, PORT_B = 8000, 8001
+WS_URL_A = f"ws://127.0.0.1:{PORT_A}/ws/chat/{USER_A}"
+WS_URL_B = f"ws://127.0.0.1:{PORT_B}/ws/chat/{USER_B}"
+
+
+def start_worker(port: int) -> subprocess.Popen:
+    env = dict(os.environ, MESSAGE_BROKER="postgres")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        env=env,
+    )
+
+
+async def wait_until_up(url: str):
+    for _ in range(100):
+        try:
+            async with websockets.connect(url):
+                return
+        except Exception:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"❌ Worker at {url} never came up")
+
+
+async def expect(ws, name, predicate, timeout=5.0):
+    async def _read():
+        while True:
+            data = json.loads(await ws.recv())
+            print(f"📩 {name} RECEIVED: {data}")
+            if predicate(data):
+                return data
+    return await asyncio.wait_for(_read(), timeout)
+
+
+async def simulate_cross_worker_chat():
+    await wait_until_up(WS_URL_A)
+    await wait_until_up(WS_URL_B)
+
+    async with websockets.connect(WS_URL_A) as ws_a, websockets.connect(WS_URL_B) as ws_b:
+        # presence deltas travel over the broker too
+        await asyncio.sleep(1)
+
+        print(f"\n📤 A (:{PORT_A}) → B (:{PORT_B})")
+        await ws_a.send(json.dumps({
+            "type": "message",
+            "receiver_id": USER_B,
+            "content": "Hello from the other worker 👋",
+        }))
+        msg = await expect(ws_b, "B", lambda d: d.get("type") == "message" and d.get("sender_id") == USER_A)
+        print("✅ B received A's message across workers.")
+
+        # only sent when the remote worker confirmed a socket write
+        await expect(ws_a, "A", lambda d: d.get("type") == "delivery_receipt" and d.get("message_id") == msg["message_id"])
+        print("✅ A got a delivery receipt.")
+
+        print(f"\n📤 B (:{PORT_B}) → A (:{PORT_A}): typing")
+        await ws_b.send(json.dumps({"type": "typing", "receiver_id": USER_A}))
+        await expect(ws_a, "A", lambda d: d.get("type") == "typing")
+        print("✅ Typing crossed workers.")
+
+        await ws_b.send(json.dumps({"type": "read_receipt", "message_ids": [msg["message_id"]]}))
+        await expect(ws_a, "A", lambda d: d.get("type") == "read_receipt")
+        print("✅ Read receipt crossed workers.")
+
+    print("\n🎉 Cross-worker flow completed successfully!")
+
+
+if __name__ == "__main__":
+    workers = [start_worker(PORT_A), start_worker(PORT_B)]
+    try:
+        asyncio.run(simulate_cross_worker_chat())
+    except Exception as e:
+        print(f"\n🔥 Test failed: {e!r}")
+    finally:
+        for proc in workers:
+            proc.terminate()
+        for proc in workers:
+            proc.wait()
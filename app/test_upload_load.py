@@ -0,0 +1,107 @@
+# test_upload_load.py
+
+
+import asyncio
+import json
+import os
+import statistics
+import time
+import httpx
+import websockets
+from utils.config import settings
+from utils.security import create_access_token
+
+# Concurrent 20 MB chat uploads against a running server while A keeps
+# pinging over its realtime socket on the same worker: the round trip should
+# stay flat while the uploads stream to disk. (Ping / pong, not typing:
+# typing is debounced server-side and would not answer every event.)
+#
+#   uvicorn main:app --port 8000      (one worker)
+#   python test_upload_load.py
+#
+# Needs the usual .env plus a real user UUID.
+
+USER_A = "0073f1db-5306-4b3c-aec5-cd345478064c"
+
+API_URL = "http://127.0.0.1:8000/api/v1"
+WS_URL = "ws://127.0.0.1:8000/ws/connect?channels=chat&token={token}"
+
+# ===== CONFIGURATION =====
+UPLOADS = 8                       # concurrent uploads
+UPLOAD_MB = 20
+SAMPLES_BASELINE = 50             # ping round trips before the uploads
+ALLOWED_P95_INCREASE_MS = 50      # pass/fail margin over the baseline p95
+# =========================
+
+
+async def round_trip(ws) -> float:
+    started = time.perf_counter()
+    await ws.send(json.dumps({"type": "ping"}))
+    while True:
+        data = json.loads(await asyncio.wait_for(ws.recv(), 10))
+        if data.get("type") == "pong":
+            return (time.perf_counter() - started) * 1000
+
+
+async def sample_while(ws, running: asyncio.Event) -> list:
+    samples = []
+    while running.is_set():
+        samples.append(await round_trip(ws))
+        await asyncio.sleep(0.02)
+    return samples
+
+
+def summary(samples: list) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[int(len(ordered) * 0.95)]
+    return f"n={len(ordered)} p50={statistics.median(ordered):.1f} ms p95={p95:.1f} ms max={ordered[-1]:.1f} ms"
+
+
+async def upload(client: httpx.AsyncClient, body: bytes, name: str) -> tuple:
+    started = time.perf_counter()
+    r = await client.post("/chat/media/upload", files={"file": (name, body, "application/octet-stream")})
+    return r.status_code, time.perf_counter() - started
+
+
+async def simulate_upload_load():
+    token = create_access_token(data={"user_id": USER_A})
+    headers = {"Authorization": f"Bearer {token}"}
+    body = os.urandom(UPLOAD_MB * 1024 * 1024)
+
+    async with websockets.connect(WS_URL.format(token=token)) as ws, \
+            httpx.AsyncClient(base_url=API_URL, headers=headers, timeout=120) as client:
+        await asyncio.sleep(1)   # subscription ack, replay etc.
+
+        print(f"\n⏱️ Baseline: {SAMPLES_BASELINE} ping round trips")
+        baseline = [await round_trip(ws) for _ in range(SAMPLES_BASELINE)]
+        print(f"   {summary(baseline)}")
+
+        print(f"\n📤 {UPLOADS} × {UPLOAD_MB} MB uploads, round trips continue")
+        running = asyncio.Event()
+        running.set()
+        sampler = asyncio.create_task(sample_while(ws, running))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(upload(client, body, f"load-{i}.bin") for i in range(UPLOADS)))
+        elapsed = time.perf_counter() - started
+        running.clear()
+        loaded = await sampler
+
+        statuses = [status for status, _ in results]
+        print(f"   uploads: {statuses.count(200)}/{UPLOADS} ok in {elapsed:.2f}s "
+              f"({UPLOADS * UPLOAD_MB / elapsed:.0f} MB/s), statuses {sorted(set(statuses))}")
+        print(f"   {summary(loaded)}")
+
+        print(f"\n🚫 Oversized upload ({settings.MAX_UPLOAD_MB + 1} MB) is cut off")
+        status, _ = await upload(client, os.urandom((settings.MAX_UPLOAD_MB + 1) * 1024 * 1024), "too-big.bin")
+        print(f"   status {status}")
+
+    p95_base = sorted(baseline)[int(len(baseline) * 0.95)]
+    p95_load = sorted(loaded)[int(len(loaded) * 0.95)] if loaded else float("inf")
+    if statuses.count(200) == UPLOADS and status == 413 and p95_load <= p95_base + ALLOWED_P95_INCREASE_MS:
+        print("\n🎉 Chat latency stayed flat under upload load!")
+    else:
+        print(f"\n🔥 Test failed: p95 {p95_base:.1f} → {p95_load:.1f} ms, oversized status {status}")
+
+
+if __name__ == "__main__":
+    asyncio.run(simulate_upload_load())
@@ -0,0 +1,306 @@
+# utils/broker.py
+
+
+import asyncio
+import base64
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import orjson
+from utils.config import settings
+from utils.ws_safe import to_safe
+
+
+# Pub/sub between app processes (uvicorn workers, replicas). Every process is a
+# node with its own id; an envelope is addressed to one node or to all of them:
+#
+#   {"src": node_id, "dst": node_id | None, "kind": "...", "data": {...}, "rid": "..."?}
+#
+# Handlers are registered per kind. When the envelope carries a request id the
+# handler's return value travels back to the sender (see `request`).
+#
+# Incoming envelopes run in lanes keyed by (src, kind, data["user_id"]): in
+# order within a lane, concurrently across lanes, so one slow handler (a slow
+# socket in chat.deliver) only holds up events for the same user. Replies are
+# resolved on arrival and never wait behind a handler.
+
+Handler = Callable[[Dict[str, Any], str], Awaitable[Any]]
+
+REQUEST_TIMEOUT_SECONDS = 5.0
+NOTIFY_CHUNK_BYTES = 5000        # pg_notify payloads are capped at 8000 bytes; base64 adds a third
+PARTIAL_TTL_SECONDS = 30         # drop chunked envelopes that never completed
+RECONNECT_BACKOFF_SECONDS = (0.5, 1, 2, 5, 10)
+
+
+def _dumps(envelope: Dict[str, Any]) -> bytes:
+    return orjson.dumps(envelope, default=to_safe, option=orjson.OPT_NON_STR_KEYS)
+
+
+class Broker:
+    """
+    Transport-agnostic part: handler registry, addressing and request/reply.
+    Backends implement `_send(raw)` and feed incoming payloads to `_receive(raw)`.
+    """
+
+    def __init__(self) -> None:
+        self.node_id = uuid.uuid4().hex
+        self._handlers: Dict[str, Handler] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reconnect_hooks: List[Callable[[], Awaitable[None]]] = []
+        self._lanes: Dict[tuple, deque] = {}
+        self._lane_tasks: set = set()
+
+    # ───────────── Registration ─────────────
+
+    def on(self, kind: str, handler: Handler) -> None:
+        """handler(data, src_node_id) → optional reply value."""
+        self._handlers[kind] = handler
+
+    def on_reconnect(self, hook: Callable[[], Awaitable[None]]) -> None:
+        """Called after the transport comes back; anything published meanwhile is lost."""
+        self._reconnect_hooks.append(hook)
+
+    # ───────────── Publishing ─────────────
+
+    async def publish(self, kind: str, data: Dict[str, Any], node: Optional[str] = None) -> bool:
+        """Fire-and-forget to `node`, or to every other node when None. False if the transport is down."""
+        envelope = {"src": self.node_id, "dst": node, "kind": kind, "data": data}
+        try:
+            await self._send(_dumps(envelope))
+            return True
+        except Exception as e:
+            print(f"⚠️ Broker publish failed ({kind}): {e}")
+            return False
+
+    async def request(self, kind: str, data: Dict[str, Any], node: str, timeout: float = REQUEST_TIMEOUT_SECONDS) -> Any:
+        """Publish to one node and wait for its handler's return value (None on timeout)."""
+        rid = uuid.uuid4().hex
+        reply = asyncio.get_running_loop().create_future()
+        self._pending[rid] = reply
+        try:
+            envelope = {"src": self.node_id, "dst": node, "kind": kind, "data": data, "rid": rid}
+            try:
+                await self._send(_dumps(envelope))
+            except Exception as e:
+                print(f"⚠️ Broker request failed ({kind}): {e}")
+                return None
+            return await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pending.pop(rid, None)
+
+    # ───────────── Receiving ─────────────
+
+    async def _receive(self, raw: bytes) -> None:
+        envelope = orjson.loads(raw)
+        if envelope["src"] == self.node_id:
+            return
+        if envelope.get("dst") not in (None, self.node_id):
+            return
+
+        if envelope["kind"] == "_reply":
+            reply = self._pending.get(envelope["data"]["rid"])
+            if reply and not reply.done():
+                reply.set_result(envelope["data"]["result"])
+            return
+
+        if envelope["kind"] not in self._handlers:
+            return
+        data = envelope["data"]
+        key = (envelope["src"], envelope["kind"], data.get("user_id") if isinstance(data, dict) else None)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            task = asyncio.create_task(self._drain(key, lane))
+            self._lane_tasks.add(task)
+            task.add_done_callback(self._lane_tasks.discard)
+        lane.append(envelope)
+
+    async def _drain(self, key: tuple, lane: deque) -> None:
+        try:
+            while lane:
+                await self._handle(lane.popleft())
+        finally:
+            self._lanes.pop(key, None)
+
+    async def _handle(self, envelope: Dict[str, Any]) -> None:
+        handler = self._handlers[envelope["kind"]]
+        try:
+            result = await handler(envelope["data"], envelope["src"])
+        except Exception as e:
+            print(f"⚠️ Broker handler {envelope['kind']} failed: {e}")
+            result = None
+
+        if envelope.get("rid"):
+            await self.publish("_reply", {"rid": envelope["rid"], "result": result}, node=envelope["src"])
+
+    async def _stop_lanes(self) -> None:
+        for task in list(self._lane_tasks):
+            task.cancel()
+        await asyncio.gather(*self._lane_tasks, return_exceptions=True)
+        self._lanes.clear()
+
+    async def _reconnected(self) -> None:
+        for hook in self._reconnect_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                print(f"⚠️ Broker reconnect hook failed: {e}")
+
+    # ───────────── Backend interface ─────────────
+
+    async def _send(self, raw: bytes) -> None:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+
+class InMemoryBroker(Broker):
+    """
+    Single-process backend. Brokers created in the same process share one bus,
+    so several nodes can be exercised without a database; with the usual single
+    instance there is simply nobody else to deliver to.
+    """
+
+    _bus: List["InMemoryBroker"] = []
+
+    async def start(self) -> None:
+        if self not in self._bus:
+            self._bus.append(self)
+
+    async def stop(self) -> None:
+        if self in self._bus:
+            self._bus.remove(self)
+        await self._stop_lanes()
+
+    async def _send(self, raw: bytes) -> None:
+        for peer in list(self._bus):
+            if peer is not self:
+                await peer._receive(raw)     # only routes; handlers run in the peer's lanes
+
+
+class PostgresBroker(Broker):
+    """
+    LISTEN/NOTIFY backend on the app database: no extra service to run.
+
+    One dedicated connection LISTENs; publishes go through a small pool.
+    Envelopes over the NOTIFY size limit are split into base64 chunks sent in
+    one transaction and reassembled on arrival. Notifications are reassembled
+    by a single task in arrival order and then handed to the lanes.
+    """
+
+    def __init__(self, dsn: str, channel: str) -> None:
+        super().__init__()
+        self.dsn = dsn
+        self.channel = channel
+        self._pool = None
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        self._partial: Dict[str, Dict[str, Any]] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        import asyncpg
+
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        connected = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._listen(connected)),
+            asyncio.create_task(self._consume()),
+        ]
+        await connected.wait()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._stop_lanes()
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def _send(self, raw: bytes) -> None:
+        async with self._pool.acquire() as conn:
+            if len(raw) <= NOTIFY_CHUNK_BYTES:
+                await conn.execute("SELECT pg_notify($1, $2)", self.channel, "f|" + raw.decode())
+                return
+
+            pid = uuid.uuid4().hex
+            parts = [raw[i:i + NOTIFY_CHUNK_BYTES] for i in range(0, len(raw), NOTIFY_CHUNK_BYTES)]
+            async with conn.transaction():
+                for i, part in enumerate(parts):
+                    chunk = f"p|{pid}|{i}|{len(parts)}|{base64.b64encode(part).decode()}"
+                    await conn.execute("SELECT pg_notify($1, $2)", self.channel, chunk)
+
+    async def _listen(self, connected: asyncio.Event) -> None:
+        import asyncpg
+
+        attempt = 0
+        while True:
+            lost = asyncio.Event()
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                conn.add_termination_listener(lambda _conn: lost.set())
+                await conn.add_listener(self.channel, self._on_notify)
+                print(f"📡 Broker listening on '{self.channel}' as node {self.node_id}")
+                if connected.is_set():
+                    await self._reconnected()
+                connected.set()
+                attempt = 0
+                await lost.wait()
+                print("⚠️ Broker connection lost, reconnecting")
+            except asyncio.CancelledError:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+                raise
+            except Exception as e:
+                print(f"⚠️ Broker listen failed: {e}")
+            await asyncio.sleep(RECONNECT_BACKOFF_SECONDS[min(attempt, len(RECONNECT_BACKOFF_SECONDS) - 1)])
+            attempt += 1
+
+    def _on_notify(self, _conn, _pid, _channel, payload: str) -> None:
+        self._inbox.put_nowait(payload)
+
+    async def _consume(self) -> None:
+        while True:
+            payload = await self._inbox.get()
+            try:
+                raw = self._assemble(payload)
+                if raw is not None:
+                    await self._receive(raw)
+            except Exception as e:
+                print(f"⚠️ Broker dropped malformed notification: {e}")
+
+    def _assemble(self, payload: str) -> Optional[bytes]:
+        if payload.startswith("f|"):
+            return payload[2:].encode()
+
+        _, pid, index, total, part = payload.split("|", 4)
+        now = time.monotonic()
+        entry = self._partial.setdefault(pid, {"parts": {}, "at": now})
+        entry["parts"][int(index)] = base64.b64decode(part)
+
+        for stale in [k for k, v in self._partial.items() if now - v["at"] > PARTIAL_TTL_SECONDS]:
+            self._partial.pop(stale, None)
+
+        if len(entry["parts"]) < int(total):
+            return None
+        self._partial.pop(pid, None)
+        return b"".join(entry["parts"][i] for i in range(int(total)))
+
+
+def create_broker() -> Broker:
+    if settings.MESSAGE_BROKER == "postgres":
+        dsn = settings.DATABASE_URL_ASYNC.replace("postgresql+asyncpg://", "postgresql://")
+        return PostgresBroker(dsn, settings.BROKER_CHANNEL)
+    return InMemoryBroker()
+
+
+broker = create_broker()
@@ -15,6 +15,15 @@ class Settings(BaseSettings):
     # OpenAI
     OPENAI_API_KEY: str
 
+    # Cross-worker WebSocket routing: "memory" (single process) or "postgres" (LISTEN/NOTIFY)
+    MESSAGE_BROKER: str = "memory"
+    BROKER_CHANNEL: str = "aureole_ws"
+
+    # Media processing (Pillow / ffmpeg) runs in this many worker processes
+    MEDIA_WORKERS: int = 2
+    # Uploads above this are cut off while streaming (413)
+    MAX_UPLOAD_MB: int = 25
+
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -1,15 +1,46 @@
 # utils/location.py
 
 from math import radians, cos, sin, asin, sqrt
+from sqlalchemy import func
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Return distance in kilometers between two points"""
     if None in (lat1, lon1, lat2, lon2):
         return float('inf')
-    R = 6371  # Earth radius in km
+    R = EARTH_RADIUS_KM
     lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     c = 2 * asin(sqrt(a))
-    return R * c
\ No newline at end of file
+    return R * c
+
+# -------------------------------
+# SQL side (cube + earthdistance, GiST index on ll_to_earth(latitude, longitude))
+# -------------------------------
+EARTH_RADIUS_KM = 6371
+
+
+def earth_point(lat, lon):
+    """3-D point on the earth cube; no lat/lon wrap-around, so poles and the antimeridian just work."""
+    return func.ll_to_earth(lat, lon)
+
+
+def earth_distance_km(origin, target):
+    """
+    Great-circle distance in km between two earth points.
+    earth_distance() uses earth() as radius; rescale so results agree with haversine_distance().
+    """
+    return func.earth_distance(origin, target) / func.earth() * EARTH_RADIUS_KM
+
+
+def within_radius(origin, target, radius_km: float) -> list:
+    """
+    Index-friendly radius filter: the earth_box containment is answered by the GiST
+    index, the exact distance check drops the box corners.
+    """
+    radius = func.earth() * (radius_km / EARTH_RADIUS_KM)
+    return [
+        func.earth_box(origin, radius).op("@>")(target),
+        func.earth_distance(origin, target) <= radius,
+    ]
@@ -5,11 +5,10 @@ import math
 import uuid
 import random
 from typing import List
-from models.message_model import Message
 from datetime import datetime, timezone
-from sqlalchemy import select, func, or_
+from sqlalchemy import select, func
 from utils.location import haversine_distance
-from models.message_model import Message
+from services.conversation_service import get_last_message_between
 from models.match_model import Match
 from models.profile_model import Profile
 from models.user_model import Notification, UserMedia, User
@@ -95,18 +94,7 @@ def generate_conversation_starters(mutual_interests: List[str], common_values: L
 
 
 async def get_last_message(db: AsyncSession, user_id: str, target_id: str):
-    q = await db.execute(
-        select(Message)
-        .where(
-            or_(
-                (Message.sender_id == user_id) & (Message.receiver_id == target_id),
-                (Message.sender_id == target_id) & (Message.receiver_id == user_id),
-            )
-        )
-        .order_by(Message.created_at.desc())
-        .limit(1)
-    )
-    return q.scalar_one_or_none()
+    return await get_last_message_between(db, user_id, target_id)
 
 
 async def fetch_mutual_matches(db: AsyncSession, current_user_id: str):
@@ -0,0 +1,129 @@
+# utils/presence.py
+
+
+import asyncio
+import time
+from typing import Dict, List, Set
+from utils.broker import Broker, broker
+
+
+HEARTBEAT_SECONDS = 10     # every node announces itself this often
+NODE_EXPIRY_SECONDS = 30   # a node silent this long is presumed dead, its users offline
+
+
+class Presence:
+    """
+    Which node each connected user lives on, per scope ("chat", "call").
+
+    Local membership is reported by the socket managers. Remote membership is
+    replicated over the broker: join/leave deltas, a snapshot exchange when a
+    node starts or reconnects, and heartbeats so a crashed node's users expire.
+    """
+
+    def __init__(self, broker: Broker) -> None:
+        self.broker = broker
+        self.local: Dict[str, Set[str]] = {}
+        self.remote: Dict[str, Dict[str, Set[str]]] = {}   # scope → user → nodes
+        self._seen: Dict[str, float] = {}                  # node → last heartbeat
+        self._task = None
+
+        broker.on("presence.update", self._on_update)
+        broker.on("presence.sync", self._on_sync)
+        broker.on("presence.snapshot", self._on_snapshot)
+        broker.on("presence.alive", self._on_alive)
+        broker.on("presence.down", self._on_down)
+        broker.on_reconnect(self._resync)
+
+    # ───────────── Lookups ─────────────
+
+    def nodes_for(self, scope: str, user_id: str) -> Set[str]:
+        return set(self.remote.get(scope, {}).get(user_id, ()))
+
+    def is_online(self, scope: str, user_id: str) -> bool:
+        return user_id in self.local.get(scope, ()) or bool(self.remote.get(scope, {}).get(user_id))
+
+    # ───────────── Local changes ─────────────
+
+    async def set_local(self, scope: str, user_id: str, online: bool) -> None:
+        """Called by a manager on a user's first connect / last disconnect on this node."""
+        users = self.local.setdefault(scope, set())
+        if online:
+            users.add(user_id)
+        else:
+            users.discard(user_id)
+        await self.broker.publish("presence.update", {"scope": scope, "user_id": user_id, "online": online})
+
+    # ───────────── Lifecycle ─────────────
+
+    async def start(self) -> None:
+        await self._resync()
+        self._task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        await self.broker.publish("presence.down", {})
+
+    def _snapshot(self) -> Dict[str, List[str]]:
+        return {scope: list(users) for scope, users in self.local.items()}
+
+    async def _resync(self) -> None:
+        # our own snapshot rides along: peers may have missed our deltas meanwhile
+        self.remote.clear()
+        self._seen.clear()
+        await self.broker.publish("presence.sync", self._snapshot())
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await self.broker.publish("presence.alive", {})
+            now = time.monotonic()
+            for node in [n for n, t in self._seen.items() if now - t > NODE_EXPIRY_SECONDS]:
+                print(f"🪦 Node {node} expired, dropping its presence")
+                self._forget_node(node)
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+
+    # ───────────── Remote events ─────────────
+
+    def _forget_node(self, node: str) -> None:
+        self._seen.pop(node, None)
+        for users in self.remote.values():
+            for user_id in [u for u, nodes in users.items() if node in nodes]:
+                users[user_id].discard(node)
+                if not users[user_id]:
+                    users.pop(user_id)
+
+    def _apply(self, scope: str, user_id: str, node: str, online: bool) -> None:
+        users = self.remote.setdefault(scope, {})
+        if online:
+            users.setdefault(user_id, set()).add(node)
+        elif user_id in users:
+            users[user_id].discard(node)
+            if not users[user_id]:
+                users.pop(user_id)
+
+    async def _on_update(self, data, src) -> None:
+        self._seen[src] = time.monotonic()
+        self._apply(data["scope"], data["user_id"], src, data["online"])
+
+    async def _on_sync(self, data: Dict[str, List[str]], src) -> None:
+        await self._on_snapshot(data, src)
+        await self.broker.publish("presence.snapshot", self._snapshot(), node=src)
+
+    async def _on_snapshot(self, data: Dict[str, List[str]], src) -> None:
+        self._forget_node(src)
+        self._seen[src] = time.monotonic()
+        for scope, users in data.items():
+            for user_id in users:
+                self._apply(scope, user_id, src, True)
+
+    async def _on_alive(self, data, src) -> None:
+        if src not in self._seen:
+            # a node we have no snapshot of (started before us, or we missed it)
+            await self.broker.publish("presence.sync", self._snapshot(), node=src)
+        self._seen[src] = time.monotonic()
+
+    async def _on_down(self, data, src) -> None:
+        self._forget_node(src)
+
+
+presence = Presence(broker)
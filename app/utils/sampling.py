@@ -0,0 +1,65 @@
+# utils/sampling.py
+
+
+import base64
+import random
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class RandomSampler:
+    """
+    Keyset-random sampling over an indexed `random_key` column (uniform in [0, 1)).
+
+    A feed starts at a random pivot and walks keys upward, wrapping around to
+    [0, pivot) once the top is reached. Every page is an index range scan with
+    a LIMIT, so cost and memory stay bounded no matter how many users exist.
+    The cursor carries (pivot, last_key), which keeps pagination stable.
+    """
+
+    def __init__(self, key_column, cursor: Optional[str] = None):
+        self.key_column = key_column
+        self.pivot, self.last_key = self._decode(cursor) if cursor else (random.random(), None)
+
+    # ---------- cursor helpers ----------
+    @staticmethod
+    def _decode(cursor: str):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            pivot, last = raw.split(":")
+            return float(pivot), (float(last) if last else None)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    def cursor_after(self, row) -> str:
+        """Opaque cursor that resumes right after `row`."""
+        raw = f"{self.pivot!r}:{row.random_key!r}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    # ---------- paging ----------
+    async def fetch(self, db: AsyncSession, stmt, size: int) -> list:
+        """
+        Return up to `size` rows of `stmt` in shuffled order.
+        Rows get an extra `random_key` attribute used for cursors.
+        """
+        col = self.key_column
+        stmt = stmt.add_columns(col.label("random_key")).order_by(col)
+        rows = []
+
+        # phase 1: [pivot, 1)  — skipped once the cursor has wrapped
+        if self.last_key is None or self.last_key >= self.pivot:
+            lower = col >= self.pivot if self.last_key is None else col > self.last_key
+            rows = (await db.execute(stmt.where(lower).limit(size))).all()
+            if len(rows) >= size:
+                return rows
+            wrapped_from = None
+        else:
+            wrapped_from = self.last_key
+
+        # phase 2: [0, pivot)
+        conds = [col < self.pivot]
+        if wrapped_from is not None:
+            conds.append(col > wrapped_from)
+        rows += (await db.execute(stmt.where(*conds).limit(size - len(rows)))).all()
+        return rows
@@ -0,0 +1,125 @@
+# utils/scoring.py
+
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+import numpy as np
+from utils.location import EARTH_RADIUS_KM
+
+
+# Vectorized counterparts of the per-row scoring in recommend_service and
+# match_logic.compute_compatibility_score. Weights, clamps and the order of
+# floating-point operations follow the scalar code so scores come out the same.
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+# -------------------------------
+# Column helpers
+# -------------------------------
+def column(values: Iterable, fill: float = 0.0) -> np.ndarray:
+    """float64 array from a result column, NULLs replaced by `fill`."""
+    return np.array([fill if v is None else v for v in values], dtype=np.float64)
+
+
+def epoch_us(dt: Optional[datetime]) -> int:
+    """Exact integer microseconds since epoch (0 for NULL → oldest possible)."""
+    return 0 if dt is None else (dt - _EPOCH) // _MICROSECOND
+
+
+def timestamps_us(values: Iterable[Optional[datetime]]) -> np.ndarray:
+    return np.array([epoch_us(v) for v in values], dtype=np.int64)
+
+
+# -------------------------------
+# Score components
+# -------------------------------
+def clamp01(x: np.ndarray) -> np.ndarray:
+    return np.minimum(1.0, np.maximum(0.0, x))
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Same formula as utils.location.haversine_distance, one pass over all candidates."""
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * (2 * np.arcsin(np.sqrt(a)))
+
+
+def proximity_score(distance_km: np.ndarray, radius_km: float) -> np.ndarray:
+    return np.maximum(0.0, 1 - (distance_km / radius_km))
+
+
+def recency_score(last_active_us: np.ndarray, now: datetime) -> np.ndarray:
+    """1.0 for just-active users, decaying linearly over 24h, floored at 0.5."""
+    hours = ((epoch_us(now) - last_active_us) / 1_000_000) / 3600
+    return np.minimum(1.0, np.maximum(0.5, 1 - hours / 24))
+
+
+def premium_boost(base: np.ndarray, candidate_tier: np.ndarray, current_tier: Optional[int]) -> np.ndarray:
+    """Vector form of recommend_service.apply_premium_boost."""
+    candidate_premium = candidate_tier > 0
+    if (current_tier or 0) > 0:
+        return np.where(candidate_premium, np.minimum(1.0, base * 1.15), np.minimum(1.0, base * 1.10))
+    return np.where(candidate_premium, np.minimum(1.0, base * 1.10), base)
+
+
+def match_scores(final: np.ndarray) -> np.ndarray:
+    """0–100 integer score; truncates like int(final * 100)."""
+    return np.trunc(final * 100).astype(np.int64)
+
+
+def compatibility_scores(
+    similarity: np.ndarray,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    lat: Optional[float],
+    lon: Optional[float],
+    max_distance_km: float,
+):
+    """
+    Vector form of match_logic.compute_compatibility_score.
+    Returns (match_score, distance_km) where distance is NaN for rows without a location.
+    """
+    # scalar code treats 0.0 coordinates as missing, keep that
+    if lat and lon:
+        located = (lats != 0) & (lons != 0) & ~np.isnan(lats) & ~np.isnan(lons)
+    else:
+        located = np.zeros(len(similarity), dtype=bool)
+
+    distance = np.full(len(similarity), np.nan)
+    if located.any():
+        distance[located] = haversine_km(lat, lon, lats[located], lons[located])
+
+    proximity = np.full(len(similarity), 0.5)   # neutral fallback
+    proximity[located] = np.where(
+        distance[located] > max_distance_km, 0.0, proximity_score(distance[located], max_distance_km)
+    )
+
+    final = (clamp01(similarity) * 0.7) + (proximity * 0.3)
+    return np.floor(final * 100).astype(np.int64), distance
+
+
+# -------------------------------
+# Ranking
+# -------------------------------
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first. Ties keep input order, matching
+    list.sort(key=..., reverse=True) on the scalar path.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < n:
+        # O(n) selection; the threshold value may be shared by more rows than fit
+        threshold = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > threshold)
+        at = np.flatnonzero(scores == threshold)[: k - len(above)]
+        picked = np.sort(np.concatenate([above, at]))
+    else:
+        picked = np.arange(n)
+
+    return picked[np.argsort(-scores[picked], kind="stable")]
@@ -2,82 +2,291 @@
 
 
 import asyncio
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, List, Optional, Set
 from fastapi import WebSocket
-from utils.ws_safe import safe_payload
+from utils.broker import broker
+from utils.presence import presence
+from utils.ws_codec import Frame, codec_of, negotiate, send_encoded
+
+
+SEND_TIMEOUT_SECONDS = 5.0     # a single frame write slower than this drops the socket
+REMOTE_WAIT_SECONDS = 4.0      # remote delivery answers before the requester's broker timeout
+OUTBOUND_QUEUE_SIZE = 256      # frames buffered per socket before it counts as a slow consumer
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "try again later" – client reconnects and replays
+PRESENCE_SCOPE = "chat"
+
+# Channels served by this manager; call signaling has its own (web/signal/manager.py).
+CHAT = "chat"
+NOTIFICATIONS = "notifications"
+
+
+class _SocketWriter:
+    """
+    Owns the outbound side of one WebSocket: a bounded queue drained by a
+    single writer task. Producers only enqueue, so a slow client never blocks
+    them; a full queue or a timed-out write drops the socket instead.
+    """
+
+    def __init__(self, manager: "ConnectionManager", user_id: str, websocket: WebSocket, channels: Set[str]):
+        self.manager = manager
+        self.user_id = user_id
+        self.websocket = websocket
+        self.channels = set(channels)
+        self.codec = codec_of(websocket)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.closed = False
+        self.task = asyncio.create_task(self._run())
+
+    def offer(self, frame: Frame) -> Optional[asyncio.Future]:
+        """Enqueue a frame; returns a future resolved with the send outcome, or None if dropped."""
+        if self.closed:
+            return None
+        done = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((frame.encode(self.codec), done))
+        except asyncio.QueueFull:
+            print(f"🐢 Dropping slow consumer for {self.user_id} (queue full)")
+            asyncio.create_task(self.manager.drop(self.user_id, self.websocket))
+            return None
+        return done
+
+    async def _run(self):
+        while True:
+            data, done = await self.queue.get()
+            try:
+                await asyncio.wait_for(send_encoded(self.websocket, self.codec, data), SEND_TIMEOUT_SECONDS)
+            except Exception as e:
+                reason = "send timed out" if isinstance(e, asyncio.TimeoutError) else e
+                print(f"⚠️ Removing stale socket for {self.user_id}: {reason}")
+                if not done.done():
+                    done.set_result(False)
+                self._fail_pending()
+                asyncio.create_task(self.manager.drop(self.user_id, self.websocket))
+                return
+            if not done.done():
+                done.set_result(True)
+
+    def _fail_pending(self):
+        self.closed = True
+        while not self.queue.empty():
+            _, done = self.queue.get_nowait()
+            if not done.done():
+                done.set_result(False)
+
+    def stop(self):
+        self._fail_pending()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
+async def _any_sent(
+    futures: List[asyncio.Future],
+    timeout: float,
+    queued: Optional[Callable[[asyncio.Future], bool]] = None,
+) -> bool:
+    """
+    True as soon as one socket confirms the frame; False if all fail.
+    On timeout a frame still `queued` on a live writer counts as sent: the
+    writer will deliver it, and reporting False would make callers replay it.
+    """
+    pending = set(futures)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while pending:
+        done, pending = await asyncio.wait(
+            pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            return queued is not None and any(queued(f) for f in pending)
+        if any(f.result() for f in done):
+            return True
+    return False
 
 
 class ConnectionManager:
+    """
+    Chat / notification sockets of this process. Users connected to another
+    worker are reached through the broker: presence says which node holds them
+    and the frame is delivered there (see `_deliver_remote`).
+    """
+
     def __init__(self):
         self.active_connections: Dict[str, List[WebSocket]] = {}
         self.online_users: set[str] = set()
+        self._writers: Dict[WebSocket, _SocketWriter] = {}
         self._lock = asyncio.Lock()
 
-    async def connect(self, user_id: str, websocket: WebSocket):
-        await websocket.accept()
+        broker.on("chat.deliver", self._deliver_remote)
+        broker.on("chat.broadcast", self._broadcast_remote)
+
+    def is_online(self, user_id: str) -> bool:
+        """Connected to this or any other worker."""
+        return presence.is_online(PRESENCE_SCOPE, str(user_id))
+
+    async def connect(
+        self,
+        user_id: str,
+        websocket: WebSocket,
+        channels: Iterable[str] = (CHAT, NOTIFICATIONS),
+        subprotocol: Optional[str] = None,
+    ):
+        """
+        Accept and register a socket; it only receives events of `channels`,
+        encoded with the codec it negotiated (see utils/ws_codec.py).
+        """
+        subprotocol = negotiate(websocket) or subprotocol
+        await websocket.accept(subprotocol=subprotocol)
         async with self._lock:
+            first = user_id not in self.online_users
             self.active_connections.setdefault(user_id, []).append(websocket)
             self.online_users.add(user_id)
+            self._writers[websocket] = _SocketWriter(self, user_id, websocket, set(channels))
+        if first:
+            await presence.set_local(PRESENCE_SCOPE, user_id, True)
         print(f"🔌 {user_id} connected ({len(self.active_connections[user_id])} sockets)")
 
     async def disconnect(self, user_id: str, websocket: WebSocket):
         print("🔥 BACKEND DISCONNECT FIRED FOR:", user_id)
         async with self._lock:
-            conns = self.active_connections.get(user_id, [])
-            self.active_connections[user_id] = [ws for ws in conns if ws != websocket]
-            if not self.active_connections[user_id]:
-                self.active_connections.pop(user_id, None)
-                self.online_users.discard(user_id) 
+            gone = self._forget(user_id, websocket)
+        if gone:
+            await presence.set_local(PRESENCE_SCOPE, user_id, False)
         print(f"❌ {user_id} disconnected ({len(self.active_connections.get(user_id, []))} remaining)")
 
-    async def send_personal_message(self, user_id: str, message: dict) -> bool:
-        """
-        Send `message` to all active WebSocket connections for the given user.
-        Returns True if at least one send succeeds.
-        Cleans up stale sockets automatically.
-        """
-        websockets = self.active_connections.get(user_id, [])
-        if not websockets:
-            return False
+    def _forget(self, user_id: str, websocket: WebSocket) -> bool:
+        """Unregister one socket; True when it was the user's last one on this node."""
+        writer = self._writers.pop(websocket, None)
+        if writer:
+            writer.stop()
+        conns = self.active_connections.get(user_id, [])
+        self.active_connections[user_id] = [ws for ws in conns if ws != websocket]
+        if not self.active_connections[user_id]:
+            self.active_connections.pop(user_id, None)
+            if user_id in self.online_users:
+                self.online_users.discard(user_id)
+                return True
+        return False
+
+    async def drop(self, user_id: str, websocket: WebSocket):
+        """Unregister a stale or slow socket and close it; its receive loop then ends."""
+        async with self._lock:
+            if websocket not in self._writers:
+                return
+            gone = self._forget(user_id, websocket)
+        if gone:
+            await presence.set_local(PRESENCE_SCOPE, user_id, False)
+        try:
+            await asyncio.wait_for(websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+
+    def subscribe(self, websocket: WebSocket, channels: Iterable[str]) -> None:
+        writer = self._writers.get(websocket)
+        if writer:
+            writer.channels.update(channels)
 
-        stale = []
-        sent = False
+    def unsubscribe(self, websocket: WebSocket, channels: Iterable[str]) -> None:
+        writer = self._writers.get(websocket)
+        if writer:
+            writer.channels.difference_update(channels)
 
+    def _enqueue(
+        self,
+        websockets: Iterable[WebSocket],
+        frame: Frame,
+        channel: str,
+        owners: Optional[Dict[asyncio.Future, _SocketWriter]] = None,
+    ) -> List[asyncio.Future]:
+        futures = []
         for ws in list(websockets):
-            try:
-                await ws.send_json(safe_payload(message))
-                sent = True
-            except Exception as e:
-                print(f"⚠️ Removing stale socket for {user_id}: {e}")
-                stale.append(ws)
+            writer = self._writers.get(ws)
+            if writer is None or channel not in writer.channels:
+                continue
+            done = writer.offer(frame)
+            if done is not None:
+                futures.append(done)
+                if owners is not None:
+                    owners[done] = writer
+        return futures
 
-        # Remove stale connections
-        for ws in stale:
-            try:
-                websockets.remove(ws)
-            except ValueError:
-                pass
+    def _enqueue_all(
+        self,
+        websockets: Iterable[WebSocket],
+        frames: List[Frame],
+        channel: str,
+        owners: Optional[Dict[asyncio.Future, _SocketWriter]] = None,
+    ) -> List[asyncio.Future]:
+        """Queue frames in order; the returned futures are the last frame's."""
+        websockets, futures = list(websockets), []
+        for frame in frames:
+            futures = self._enqueue(websockets, frame, channel, owners)
+        return futures
 
-        # If no active sockets remain, remove user entirely
-        if not websockets:
-            self.active_connections.pop(user_id, None)
-        else:
-            self.active_connections[user_id] = websockets
+    @staticmethod
+    def _on_live_writer(owners: Dict[asyncio.Future, _SocketWriter]) -> Callable[[asyncio.Future], bool]:
+        return lambda f: f in owners and not owners[f].closed
+
+    async def send_personal_message(self, user_id: str, message: dict, channel: str = CHAT) -> bool:
+        """
+        Send `message` to the given user's sockets subscribed to `channel`,
+        on this worker and on any other worker presence knows about.
+        Encoded once per codec in use, written by every socket's writer concurrently.
+        Returns True as soon as at least one send succeeds.
+        Stale and slow sockets are dropped automatically.
+        """
+        return await self.send_personal_messages(user_id, [message], channel)
 
-        return sent
+    async def send_personal_messages(self, user_id: str, messages: List[dict], channel: str = CHAT) -> bool:
+        """
+        Several events for one user in a single round: queued back to back on
+        each socket and one broker request per remote node for all of them.
+        True once some socket has written the last one (writers are FIFO),
+        or when it is still queued on a live socket at the timeout.
+        """
+        user_id = str(user_id)
+        websockets = self.active_connections.get(user_id, [])
+        nodes = presence.nodes_for(PRESENCE_SCOPE, user_id)
+        if not messages or (not websockets and not nodes):
+            return False
 
-    async def broadcast(self, message: dict):
+        frames = [Frame(message, channel) for message in messages]
+        owners: Dict[asyncio.Future, _SocketWriter] = {}
+        futures = self._enqueue_all(websockets, frames, channel, owners)
+        futures += [
+            asyncio.ensure_future(
+                broker.request("chat.deliver", {
+                    "user_id": user_id,
+                    "frames": [frame.json for frame in frames],
+                    "channel": channel,
+                }, node)
+            )
+            for node in nodes
+        ]
+        if not futures:
+            return False
+        return await _any_sent(futures, SEND_TIMEOUT_SECONDS, self._on_live_writer(owners))
+
+    async def broadcast(self, message: dict, channel: str = NOTIFICATIONS):
         """
-        Send message to all connected users.
+        Send message to all connected users, on every worker, without waiting on any of them.
         Removes stale connections as needed.
         """
-        items = list(self.active_connections.items())
-        for user_id, websockets in items:
-            for ws in list(websockets):
-                try:
-                    await ws.send_json(safe_payload(message))
-                except Exception as e:
-                    print(f"⚠️ Broadcast fail for {user_id}: {e}")
-                    await self.disconnect(user_id, ws)
-
-manager = ConnectionManager()
\ No newline at end of file
+        frame = Frame(message, channel)
+        for websockets in list(self.active_connections.values()):
+            self._enqueue(websockets, frame, channel)
+        await broker.publish("chat.broadcast", {"frame": frame.json, "channel": channel})
+
+    # ───────────── Broker handlers ─────────────
+
+    async def _deliver_remote(self, data, src) -> bool:
+        frames = [Frame.from_json(text) for text in data["frames"]]
+        owners: Dict[asyncio.Future, _SocketWriter] = {}
+        futures = self._enqueue_all(self.active_connections.get(data["user_id"], []), frames, data["channel"], owners)
+        return bool(futures) and await _any_sent(futures, REMOTE_WAIT_SECONDS, self._on_live_writer(owners))
+
+    async def _broadcast_remote(self, data, src) -> None:
+        frame = Frame.from_json(data["frame"])
+        for websockets in list(self.active_connections.values()):
+            self._enqueue(websockets, frame, data["channel"])
+
+manager = ConnectionManager()
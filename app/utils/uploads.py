@@ -0,0 +1,354 @@
+# utils/uploads.py
+
+
+import asyncio
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from utils.config import settings
+
+
+# Every upload route reads its body through receive_upload():
+#
+#   request.stream() → multipart parser → 1 MB blocks → write (+ sha256) in a thread
+#                                                    → uploads/tmp/<uuid>.part
+#
+# nothing is spooled to a SpooledTemporaryFile first, the type comes from the
+# file's magic bytes (not the client's header), and the body is cut off with a
+# 413 as soon as it crosses the cap. The caller moves the finished file into
+# place with StoredUpload.commit() – a rename, since uploads/tmp lives on the
+# same filesystem as every destination.
+
+UPLOAD_TMP_DIR = "uploads/tmp"
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+WRITE_BUFFER_BYTES = 1024 * 1024       # request chunks are ~64 KB; write in 1 MB blocks
+MULTIPART_OVERHEAD_BYTES = 64 * 1024   # boundaries + small form fields on top of the file
+MAX_FIELD_BYTES = 16 * 1024            # plain (non-file) form fields
+SNIFF_BYTES = 32
+
+MB = 1024 * 1024
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp",
+    "image/avif": ".avif", "image/heic": ".heic",
+    "video/mp4": ".mp4", "video/quicktime": ".mov", "video/webm": ".webm",
+    "audio/mp4": ".m4a", "audio/mpeg": ".mp3", "audio/ogg": ".ogg", "audio/wav": ".wav",
+    "audio/flac": ".flac", "audio/webm": ".webm", "audio/aac": ".aac",
+    "application/pdf": ".pdf",
+}
+
+# containers that hold audio or video alike – the declared type (with codecs) says which
+_CONTAINERS = {"webm", "mp4", "ogg", "mpeg"}
+
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    """MIME type from the first bytes of a file, None when unknown."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "image/avif"
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "image/heic"
+        if brand in (b"M4A ", b"M4B "):
+            return "audio/mp4"
+        if brand == b"qt  ":
+            return "video/quicktime"
+        return "video/mp4"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if head.startswith(b"OggS"):
+        return "audio/ogg"
+    if head.startswith(b"fLaC"):
+        return "audio/flac"
+    if head.startswith(b"ID3") or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "audio/mpeg"
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    return None
+
+
+def resolve_mime(declared: Optional[str], sniffed: Optional[str]) -> Optional[str]:
+    """
+    The sniffed type wins, except where it can't tell audio from video
+    (webm / mp4 / ogg) or MP3 from AAC: then a matching declared type is
+    kept, codecs parameter included (MediaRecorder voice notes rely on it).
+    """
+    if sniffed is None or not declared:
+        return sniffed
+    base = declared.split(";")[0].strip().lower()
+    if base == sniffed:
+        return declared
+    subtype = base.rsplit("/", 1)[-1]
+    if subtype in _CONTAINERS and subtype == sniffed.rsplit("/", 1)[-1]:
+        return declared
+    if sniffed == "audio/mpeg" and base.startswith("audio/"):
+        return declared     # ADTS AAC shares the MPEG sync word
+    return sniffed
+
+
+def _allowed(mime: Optional[str], allowed: Optional[Iterable[str]]) -> bool:
+    if allowed is None:
+        return True
+    if mime is None:
+        return False
+    base = mime.split(";")[0].strip().lower()
+    return any(base == a or (a.endswith("/") and base.startswith(a)) for a in allowed)
+
+
+@dataclass
+class StoredUpload:
+    path: str                         # under UPLOAD_TMP_DIR until commit()
+    filename: Optional[str]
+    content_type: str                 # sniffed (see resolve_mime)
+    size: int
+    sha256: Optional[str]             # only with receive_upload(digest=True)
+    fields: Dict[str, str] = field(default_factory=dict)   # the other form fields
+
+    @property
+    def mime(self) -> str:
+        """content_type without parameters"""
+        return self.content_type.split(";")[0].strip().lower()
+
+    @property
+    def ext(self) -> str:
+        known = EXTENSIONS.get(self.mime)
+        if known:
+            return known
+        ext = os.path.splitext(self.filename or "")[1].lower()
+        return ext if ext[1:].isalnum() and len(ext) <= 8 else ""
+
+    def commit(self, dest: str) -> str:
+        """Atomically move the upload to `dest` (a rename on the same filesystem)."""
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(self.path, dest)
+        self.path = dest
+        return dest
+
+    def discard(self) -> None:
+        if self.path.startswith(UPLOAD_TMP_DIR) and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Receiver:
+    """python-multipart callbacks: they only collect; flush() hashes and writes off the loop."""
+
+    def __init__(self, field_name: str, max_bytes: int, allowed: Optional[Iterable[str]], digest: bool) -> None:
+        self.field_name = field_name
+        self.max_bytes = max_bytes
+        self.allowed = allowed
+        self.path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}.part")
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.declared: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.size = 0
+        self.found = False
+        self._digest = hashlib.sha256() if digest else None
+        self._head = bytearray()                # first SNIFF_BYTES, for sniff_mime()
+        self._chunks: List[memoryview] = []     # parsed file data not written yet
+        self._pending = 0
+        self._out = None
+
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part: Optional[str] = None        # "file" | "field" | None (skipped)
+        self._part_name = ""
+        self._part_data = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        }
+
+    # ───────────── Parser callbacks (sync) ─────────────
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._part = None
+        self._part_data = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._part_name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in options:
+            self._part = "field"
+        elif self._part_name == self.field_name and not self.found:
+            self._part = "file"
+            self.found = True
+            self.filename = options[b"filename"].decode("utf-8", "replace") or None
+            declared = self._headers.get(b"content-type")
+            self.declared = declared.decode("latin-1") if declared else None
+        # any other file part is skipped
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part == "file":
+            self._accept(memoryview(data)[start:end])     # no copy: each request chunk is its own bytes
+        elif self._part == "field":
+            self._part_data += data[start:end]
+            if len(self._part_data) > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Form field '{self._part_name}' too large")
+
+    def _on_part_end(self) -> None:
+        if self._part == "field":
+            self.fields[self._part_name] = self._part_data.decode("utf-8", "replace")
+        self._part = None
+
+    # ───────────── File part ─────────────
+
+    def _accept(self, chunk: memoryview) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise HTTPException(status_code=413, detail=f"File too large (max {self.max_bytes // MB} MB)")
+        if self.content_type is None:
+            self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        self._chunks.append(chunk)
+        self._pending += len(chunk)
+
+    def _sniff(self) -> None:
+        # rejected before anything touches the disk
+        mime = resolve_mime(self.declared, sniff_mime(bytes(self._head)))
+        if not _allowed(mime, self.allowed):
+            raise HTTPException(status_code=415, detail="Unsupported file type")
+        self.content_type = mime or "application/octet-stream"
+
+    def _write(self, chunks: List[memoryview]) -> None:
+        # worker thread: hashlib drops the GIL on large buffers, so neither
+        # the digest nor the disk write holds up the event loop
+        if self._out is None:
+            self._out = open(self.path, "wb")
+        for chunk in chunks:
+            if self._digest is not None:
+                self._digest.update(chunk)
+            self._out.write(chunk)
+
+    async def flush(self, final: bool = False) -> None:
+        if not self._chunks or self.content_type is None:
+            return
+        if not final and self._pending < WRITE_BUFFER_BYTES:
+            return
+        chunks, self._chunks, self._pending = self._chunks, [], 0
+        await asyncio.to_thread(self._write, chunks)
+
+    async def finish(self) -> StoredUpload:
+        if not self.found:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        if self.size == 0:
+            raise HTTPException(status_code=400, detail="Empty file")
+        if self.content_type is None:
+            self._sniff()       # smaller than SNIFF_BYTES
+        await self.flush(final=True)
+        self._out.close()
+        self._out = None
+        return StoredUpload(
+            path=self.path,
+            filename=self.filename,
+            content_type=self.content_type,
+            size=self.size,
+            sha256=self._digest.hexdigest() if self._digest is not None else None,
+            fields=self.fields,
+        )
+
+    async def abort(self) -> None:
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def receive_upload(
+    request: Request,
+    *,
+    field_name: str = "file",
+    max_bytes: Optional[int] = None,
+    allowed: Optional[Iterable[str]] = None,
+    digest: bool = False,
+) -> StoredUpload:
+    """
+    Stream the multipart body of `request` into a temp file.
+
+    - `allowed`: MIME types ("image/png") or prefixes ("image/") accepted by
+      magic-byte sniffing, 415 otherwise; None accepts anything
+    - `max_bytes` (default settings.MAX_UPLOAD_MB): 413 from Content-Length
+      up front, or the moment the streamed file crosses it
+    - `digest`: sha256 of the file while it streams (StoredUpload.sha256);
+      off by default, it is the most CPU an upload costs
+    - the partial file is removed on any error or disconnect
+
+    The caller owns the returned file: commit() it into place or discard() it.
+    """
+    max_bytes = max_bytes or settings.MAX_UPLOAD_MB * MB
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_bytes // MB} MB)")
+
+    receiver = _Receiver(field_name, max_bytes, allowed, digest)
+    parser = MultipartParser(params[b"boundary"], receiver.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(bytes(chunk))      # no-op for bytes; views below rely on it
+            await receiver.flush()
+        parser.finalize()
+        return await receiver.finish()
+    except MultipartParseError:
+        await receiver.abort()
+        raise HTTPException(status_code=400, detail="Malformed multipart body")
+    except BaseException:
+        await receiver.abort()
+        raise
+
+
+def multipart_body(**fields: str) -> dict:
+    """openapi_extra documenting the form of a route that calls receive_upload()."""
+    properties = {"file": {"type": "string", "format": "binary"}}
+    properties.update({name: {"type": kind} for name, kind in fields.items()})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {"type": "object", "properties": properties, "required": ["file"]},
+                },
+            },
+        },
+    }
@@ -0,0 +1,90 @@
+# utils/vector_search.py
+
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.profile_model import Profile
+
+
+@dataclass(frozen=True)
+class AnnConfig:
+    ef_search: int   # HNSW candidate list size → recall knob (higher = better recall, slower)
+    overfetch: int   # neighbours pulled per requested result, filters are applied afterwards
+
+
+# -------------------------------
+# Per-mode recall knobs
+# -------------------------------
+ANN_MODES = {
+    "compatibility": AnnConfig(ef_search=60, overfetch=3),
+    "boosted": AnnConfig(ef_search=60, overfetch=3),
+    "filtered": AnnConfig(ef_search=400, overfetch=25),   # age/gender filters are selective
+}
+
+MAX_ANN_CANDIDATES = 1000   # pgvector caps hnsw.ef_search at 1000
+WIDEN_FACTOR = 4            # k grows by this much while filters eat the neighbours
+
+
+async def ann_neighbours(
+    db: AsyncSession,
+    embedding,
+    mode: str,
+    limit: int,
+    ef_search: Optional[int] = None,
+    widen: int = 1,
+):
+    """
+    Nearest-neighbour subquery over profiles.embedding served by the HNSW index.
+
+    The inner `ORDER BY distance LIMIT k` is kept free of filters so Postgres can
+    walk idx_profiles_embedding_hnsw; callers join users onto it and post-filter.
+    Returns a subquery with columns (user_id, distance).
+
+    `ef_search` overrides the mode's recall knob, but is clamped to
+    [k, MAX_ANN_CANDIDATES]: HNSW returns at most ef_search rows, so a smaller
+    value would silently cut the LIMIT k short. `widen` multiplies k (see ann_search).
+    """
+    cfg = ANN_MODES[mode]
+    k = min(limit * cfg.overfetch * widen, MAX_ANN_CANDIDATES)
+
+    # HNSW never returns more than ef_search rows, so it must cover k
+    ef = min(max(ef_search or cfg.ef_search, k), MAX_ANN_CANDIDATES)
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef)}"))
+
+    distance = Profile.embedding.l2_distance(embedding)
+    return (
+        select(Profile.user_id, distance.label("distance"))
+        .order_by(distance)
+        .limit(k)
+        .subquery("nn")
+    )
+
+
+async def ann_search(
+    db: AsyncSession,
+    embedding,
+    mode: str,
+    limit: int,
+    build: Callable,
+    wanted: int,
+    ef_search: Optional[int] = None,
+) -> list:
+    """
+    Rows of `build(nn)` — the caller's filtered query over an ann_neighbours
+    subquery — widening k until at least `wanted` rows survive the filters.
+
+    Exclusions (swipes, blocks, matches) and user flags run outside the
+    fixed-k subquery, so a viewer who already went through their nearest
+    neighbours would otherwise get short pages. The first round is the usual
+    single query; k grows by WIDEN_FACTOR up to MAX_ANN_CANDIDATES.
+    """
+    widen = 1
+    while True:
+        nn = await ann_neighbours(db, embedding, mode, limit, ef_search, widen)
+        rows = (await db.execute(build(nn))).all()
+        k = limit * ANN_MODES[mode].overfetch * widen
+        if len(rows) >= wanted or k >= MAX_ANN_CANDIDATES:
+            return rows
+        widen *= WIDEN_FACTOR
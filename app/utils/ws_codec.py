@@ -0,0 +1,167 @@
+# utils/ws_codec.py
+
+
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Union
+import orjson
+from starlette.websockets import WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:   # optional: clients simply can't negotiate it
+    msgpack = None
+
+
+# Wire encoding per socket, picked at connect time:
+#
+#   ?encoding=json|msgpack        or subprotocol "aureole.json" / "aureole.msgpack"
+#
+# JSON (default) is orjson in text frames – UUID, datetime and Enum are encoded
+# natively, so payloads need no safe_payload pass. MessagePack goes out in
+# binary frames. permessage-deflate is negotiated by uvicorn itself (on by
+# default; UVICORN_WS_PER_MESSAGE_DEFLATE=false turns it off).
+
+SUBPROTOCOL_PREFIX = "aureole."
+
+
+def _orjson_default(v):
+    # orjson covers UUID/datetime/Enum; this catches the odd Decimal and friends
+    return str(v)
+
+
+def _msgpack_default(v):
+    if isinstance(v, uuid.UUID):
+        return str(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Enum):
+        return v.value
+    return str(v)
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    binary: bool
+    encode: Callable[[Any], Union[str, bytes]]
+    decode: Callable[[Union[str, bytes]], Any]
+
+
+JSON = Codec(
+    name="json",
+    binary=False,
+    encode=lambda m: orjson.dumps(m, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode(),
+    decode=orjson.loads,
+)
+
+CODECS: Dict[str, Codec] = {"json": JSON}
+
+if msgpack is not None:
+    CODECS["msgpack"] = Codec(
+        name="msgpack",
+        binary=True,
+        encode=lambda m: msgpack.packb(m, default=_msgpack_default, use_bin_type=True),
+        decode=lambda b: msgpack.unpackb(b, raw=False),
+    )
+
+
+# ───────────── Negotiation ─────────────
+
+def negotiate(websocket) -> Optional[str]:
+    """
+    Pick the socket's codec (query flag wins over subprotocol) and remember it
+    on websocket.state. Returns the subprotocol to echo in accept(), if any.
+    """
+    codec, subprotocol = JSON, None
+
+    requested = websocket.query_params.get("encoding")
+    if requested in CODECS:
+        codec = CODECS[requested]
+    else:
+        for offered in websocket.scope.get("subprotocols") or []:
+            name = offered[len(SUBPROTOCOL_PREFIX):] if offered.startswith(SUBPROTOCOL_PREFIX) else None
+            if name in CODECS:
+                codec, subprotocol = CODECS[name], offered
+                break
+
+    websocket.state.codec = codec
+    return subprotocol
+
+
+def codec_of(websocket) -> Codec:
+    return getattr(getattr(websocket, "state", None), "codec", JSON)
+
+
+# ───────────── Frames ─────────────
+
+class Frame:
+    """
+    One outgoing event, encoded at most once per codec however many sockets
+    it fans out to. Can be rebuilt from its JSON text (cross-worker delivery).
+    """
+
+    __slots__ = ("_message", "_encoded")
+
+    def __init__(self, message: Optional[Dict[str, Any]] = None, channel: Optional[str] = None):
+        if message is not None and channel is not None:
+            message = {**message, "channel": channel}
+        self._message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    @classmethod
+    def from_json(cls, text: str) -> "Frame":
+        frame = cls()
+        frame._encoded[JSON.name] = text
+        return frame
+
+    @property
+    def json(self) -> str:
+        return self.encode(JSON)
+
+    def encode(self, codec: Codec) -> Union[str, bytes]:
+        data = self._encoded.get(codec.name)
+        if data is None:
+            if self._message is None:
+                self._message = JSON.decode(self._encoded[JSON.name])
+            data = self._encoded[codec.name] = codec.encode(self._message)
+        return data
+
+
+async def send_encoded(websocket, codec: Codec, data: Union[str, bytes]) -> None:
+    if codec.binary:
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
+
+
+async def send_prepared(websocket, frame: Frame) -> None:
+    """Send an already built Frame (shared across sockets) in this socket's encoding."""
+    websocket = getattr(websocket, "websocket", websocket)   # unwrap channel views
+    codec = codec_of(websocket)
+    await send_encoded(websocket, codec, frame.encode(codec))
+
+
+async def send_frame(websocket, message: Dict[str, Any]) -> None:
+    """
+    Direct reply on one socket in its negotiated encoding. Channel views of a
+    multiplexed socket (anything with .websocket and .channel) get their tag added.
+    """
+    channel = getattr(websocket, "channel", None)
+    if channel is not None:
+        message = {**message, "channel": channel}
+        websocket = websocket.websocket
+    codec = codec_of(websocket)
+    await send_encoded(websocket, codec, codec.encode(message))
+
+
+async def receive_frame(websocket) -> Any:
+    """Next client frame decoded with the socket's codec (text frames are always JSON)."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("bytes") is not None:
+        return codec_of(websocket).decode(message["bytes"])
+    return JSON.decode(message["text"])
@@ -4,10 +4,11 @@ from __future__ import annotations
 
 import asyncio
 import uuid
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
 from enum import Enum
 from typing import Dict, Optional, Tuple
 
+from utils.broker import broker
 from web.signal.manager import call_signal_manager, UserCallState
 from web.signal.schema import (
     CallInviteMessage,
@@ -54,7 +55,8 @@ class CallService:
     """
     In-memory call lifecycle manager.
 
-    - Tracks calls & state transitions.
+    - Tracks calls & state transitions; every save/delete is replicated to
+      the other workers so either participant's worker can act on the call.
     - Talks to CallSignalManager to update user states and push events.
     - Does NOT touch aiortc yet: WebRTC messages are forwarded to peers
       so you can start with P2P. aiortc integration/recording comes next layer.
@@ -66,6 +68,8 @@ class CallService:
         self._lock = asyncio.Lock()
         self._rtc: Dict[Tuple[str, str], RTCConnection] = {}
 
+        broker.on("call.state", self._replicate_remote)
+
 
     # ────────── helpers ──────────
 
@@ -79,10 +83,21 @@ class CallService:
     async def _save_call(self, call: Call) -> None:
         async with self._lock:
             self._calls[call.id] = call
+        await broker.publish("call.state", {"call": asdict(call)})
 
     async def _delete_call(self, call_id: str) -> None:
         async with self._lock:
             self._calls.pop(call_id, None)
+        await broker.publish("call.state", {"deleted": call_id})
+
+    async def _replicate_remote(self, data: dict, src: str) -> None:
+        async with self._lock:
+            if "deleted" in data:
+                self._calls.pop(data["deleted"], None)
+            else:
+                call = Call(**data["call"])
+                call.state = CallState(call.state)
+                self._calls[call.id] = call
 
     # ────────── lifecycle ops ──────────
 
@@ -9,10 +9,14 @@ from typing import Dict, Set, Optional, Any, List
 from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 
-from utils.ws_safe import safe_payload
+from utils.broker import broker
+from utils.presence import presence
+from utils.ws_codec import Frame, send_frame, send_prepared
 
 logger = logging.getLogger(__name__)
 
+PRESENCE_SCOPE = "call"
+
 
 class UserCallState(str, Enum):
     IDLE = "idle"
@@ -30,6 +34,10 @@ class UserSession:
 class CallSignalManager:
     """
     Dedicated manager for call signaling WebSockets.
+
+    Sockets are per process; events for users on another worker go through
+    the broker, and user call states are replicated to every worker so busy
+    checks see calls set up elsewhere.
     """
 
     def __init__(self) -> None:
@@ -45,6 +53,9 @@ class CallSignalManager:
         # Global lock for dict mutations
         self._lock = asyncio.Lock()
 
+        broker.on("call.deliver", self._deliver_remote)
+        broker.on("call.session", self._session_remote)
+
     # ───────────── Connection management ─────────────
 
     async def register_connection(self, user_id: str, websocket: WebSocket) -> None:
@@ -53,13 +64,17 @@ class CallSignalManager:
         Does NOT call websocket.accept() – router is responsible for auth + accept.
         """
         async with self._lock:
-            if user_id not in self._connections:
+            first = user_id not in self._connections
+            if first:
                 self._connections[user_id] = set()
             self._connections[user_id].add(websocket)
 
             if user_id not in self._sessions:
                 self._sessions[user_id] = UserSession(user_id=user_id)
 
+        if first:
+            await presence.set_local(PRESENCE_SCOPE, user_id, True)
+
         logger.info(
             "🔌 Call WS connected: %s (%d active sockets)",
             user_id,
@@ -72,12 +87,17 @@ class CallSignalManager:
         Does NOT alter call state automatically – router/call_service
         should decide what to do on disconnect.
         """
+        gone = False
         async with self._lock:
             conns = self._connections.get(user_id)
             if conns and websocket in conns:
                 conns.remove(websocket)
                 if not conns:
                     self._connections.pop(user_id, None)
+                    gone = True
+
+        if gone:
+            await presence.set_local(PRESENCE_SCOPE, user_id, False)
 
         logger.info(
             "❌ Call WS disconnected: %s (%d remaining sockets)",
@@ -90,8 +110,8 @@ class CallSignalManager:
             return set(self._connections.get(user_id, set()))
 
     async def is_online(self, user_id: str) -> bool:
-        async with self._lock:
-            return bool(self._connections.get(user_id))
+        """Has a call socket on this or any other worker."""
+        return presence.is_online(PRESENCE_SCOPE, user_id)
 
     # ───────────── User call session state ─────────────
 
@@ -112,14 +132,10 @@ class CallSignalManager:
         """
         Set the user's call state and optionally bind/unbind to a call_id.
         """
-        async with self._lock:
-            session = self._sessions.get(user_id)
-            if session is None:
-                session = UserSession(user_id=user_id)
-                self._sessions[user_id] = session
-
-            session.state = state
-            session.current_call_id = call_id
+        await self._apply_session(user_id, state, call_id)
+        await broker.publish(
+            "call.session", {"user_id": user_id, "state": state.value, "call_id": call_id}
+        )
 
         logger.debug(
             "📞 User state updated: %s → %s (call_id=%s)",
@@ -157,8 +173,24 @@ class CallSignalManager:
             session.state = UserCallState.IDLE
             session.current_call_id = None
 
+        await broker.publish(
+            "call.session", {"user_id": user_id, "state": UserCallState.IDLE.value, "call_id": None}
+        )
         logger.info("✅ User %s cleared to IDLE (call_id=%s)", user_id, call_id)
 
+    async def _apply_session(self, user_id: str, state: UserCallState, call_id: Optional[str]) -> None:
+        async with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = UserSession(user_id=user_id)
+                self._sessions[user_id] = session
+
+            session.state = state
+            session.current_call_id = call_id
+
+    async def _session_remote(self, data: Dict[str, Any], src: str) -> None:
+        await self._apply_session(data["user_id"], UserCallState(data["state"]), data["call_id"])
+
     async def is_user_busy(self, user_id: str) -> bool:
         """
         Busy means currently in ringing or in active call.
@@ -190,10 +222,21 @@ class CallSignalManager:
 
     async def send_to_user(self, user_id: str, message: Dict[str, Any]) -> bool:
         """
-        Send `message` to all active WS connections for user.
-        Returns True if at least one send succeeds.
+        Send `message` to all active WS connections for user, including those
+        held by other workers (published, not awaited).
+        Returns True if at least one send succeeds or was handed to the broker.
         Cleans up stale sockets automatically.
         """
+        published = False
+        for node in presence.nodes_for(PRESENCE_SCOPE, user_id):
+            published |= await broker.publish("call.deliver", {"user_id": user_id, "message": message}, node=node)
+
+        return await self._send_local(user_id, message) or published
+
+    async def _deliver_remote(self, data: Dict[str, Any], src: str) -> None:
+        await self._send_local(data["user_id"], data["message"])
+
+    async def _send_local(self, user_id: str, payload: Dict[str, Any]) -> bool:
         async with self._lock:
             websockets = list(self._connections.get(user_id, set()))
 
@@ -202,8 +245,7 @@ class CallSignalManager:
 
         stale: List[WebSocket] = []
         sent_any = False
-
-        payload = safe_payload(message)
+        frame = Frame(payload, PRESENCE_SCOPE)   # "call" channel tag
 
         for ws in websockets:
             if ws.client_state != WebSocketState.CONNECTED:
@@ -211,20 +253,23 @@ class CallSignalManager:
                 continue
 
             try:
-                await ws.send_json(payload)
+                await send_prepared(ws, frame)
                 sent_any = True
             except Exception as e:
                 logger.warning("⚠️ Call WS send failed for %s: %s", user_id, e)
                 stale.append(ws)
 
         if stale:
+            gone = False
             async with self._lock:
                 conns = self._connections.get(user_id, set())
                 for ws in stale:
                     if ws in conns:
                         conns.remove(ws)
-                if not conns:
-                    self._connections.pop(user_id, None)
+                if not conns and self._connections.pop(user_id, None) is not None:
+                    gone = True
+            if gone:
+                await presence.set_local(PRESENCE_SCOPE, user_id, False)
 
         return sent_any
 
@@ -262,7 +307,7 @@ class CallSignalManager:
             payload.update(extra)
 
         try:
-            await websocket.send_json(safe_payload(payload))
+            await send_frame(websocket, payload)
         except Exception as e:
             logger.warning("⚠️ Failed to send error to WS: %s", e)
 
@@ -8,6 +8,7 @@ from sqlalchemy import select
 from db.session import async_session
 from models.user_model import User
 from utils.config import settings
+from utils.ws_codec import negotiate, receive_frame
 from web.signal.manager import call_signal_manager
 from web.signal.schema import (
     parse_call_message,
@@ -30,11 +31,15 @@ SECRET_KEY = settings.SECRET_KEY
 
 
 async def authenticate_websocket(websocket: WebSocket):
-    protocols = websocket.scope.get("subprotocols") or []
-    if not protocols:
-        return None, "Missing authentication token (no subprotocol provided)"
-
-    token = protocols[0].strip()
+    # `?token=` (multiplexed socket) or the first subprotocol (call socket)
+    token = websocket.query_params.get("token")
+    if token is None:
+        protocols = websocket.scope.get("subprotocols") or []
+        if not protocols:
+            return None, "Missing authentication token (no subprotocol provided)"
+        token = protocols[0]
+
+    token = token.strip()
     if not token:
         return None, "Empty authentication token"
 
@@ -60,6 +65,104 @@ async def authenticate_websocket(websocket: WebSocket):
     return user, None
 
 
+async def send_call_init(user_id: str) -> None:
+    await call_signal_manager.send_to_user(
+        user_id,
+        {
+            "type": "call.init",
+            "user_id": user_id,
+            "state": (await call_signal_manager.get_user_state(user_id)).value,
+            "active_call_id": await call_signal_manager.get_user_call_id(user_id),
+        },
+    )
+
+
+async def handle_call_message(websocket: WebSocket, real_user_id: str, raw) -> None:
+    """
+    Validate and dispatch one signaling message. Shared by /ws/call and the
+    `call` channel of /ws/connect; errors go back on `websocket` only.
+    """
+    if not isinstance(raw, dict):
+        await call_signal_manager.send_error(
+            websocket,
+            code="invalid_payload",
+            message="Payload must be an object",
+        )
+        return
+
+    try:
+        msg = parse_call_message(raw)
+    except ValueError as e:
+        await call_signal_manager.send_error(
+            websocket,
+            code="invalid_message",
+            message=str(e),
+        )
+        return
+
+    print(f"📥 CALL {real_user_id} → {msg.type}: {raw}")
+
+    try:
+        # 4) DISPATCH BY MESSAGE TYPE
+        if isinstance(msg, CallInviteMessage):
+            ack = await call_service.invite(real_user_id, msg)
+            await call_signal_manager.send_to_user(real_user_id, ack)
+
+        elif isinstance(msg, CallAnswerMessage):
+            ack = await call_service.answer(real_user_id, msg)
+            await call_signal_manager.send_to_user(real_user_id, ack)
+
+        elif isinstance(msg, CallRejectMessage):
+            ack = await call_service.reject(real_user_id, msg)
+            await call_signal_manager.send_to_user(real_user_id, ack)
+
+        elif isinstance(msg, CallCancelMessage):
+            ack = await call_service.cancel(real_user_id, msg)
+            await call_signal_manager.send_to_user(real_user_id, ack)
+
+        elif isinstance(msg, CallEndMessage):
+            ack = await call_service.end(real_user_id, msg)
+            await call_signal_manager.send_to_user(real_user_id, ack)
+
+        elif isinstance(msg, WebRTCOfferMessage):
+            await call_service.relay_offer(real_user_id, msg)
+
+        elif isinstance(msg, WebRTCAnswerMessage):
+            await call_service.relay_answer(real_user_id, msg)
+
+        elif isinstance(msg, IceCandidateMessage):
+            await call_service.relay_ice(real_user_id, msg)
+
+        elif isinstance(msg, CallHeartbeatMessage):
+            # Keep it simple: just ACK. You could update last-seen here.
+            await call_signal_manager.send_to_user(
+                real_user_id,
+                {"type": "call.heartbeat_ack", "call_id": msg.call_id},
+            )
+
+        else:
+            await call_signal_manager.send_error(
+                websocket,
+                code="unknown_type",
+                message=f"Unhandled message type: {msg.type}",
+            )
+
+    except CallServiceError as e:
+        await call_signal_manager.send_error(
+            websocket,
+            code=e.code,
+            message=e.message,
+        )
+    except Exception as e:
+        # Safety net – never crash the WS loop
+        await call_signal_manager.send_error(
+            websocket,
+            code="internal_error",
+            message="Internal error in call handling",
+        )
+        # You can log e / traceback here.
+
+
 @router.websocket("/ws/call/{user_id}")
 async def websocket_call(websocket: WebSocket, user_id: str):
     # 1) AUTH BEFORE ACCEPT
@@ -76,26 +179,18 @@ async def websocket_call(websocket: WebSocket, user_id: str):
         )
         return
 
-    await websocket.accept()
+    await websocket.accept(subprotocol=negotiate(websocket))
 
     # 2) REGISTER CONNECTION
     await call_signal_manager.register_connection(real_user_id, websocket)
 
-    await call_signal_manager.send_to_user(
-        real_user_id,
-        {
-            "type": "call.init",
-            "user_id": real_user_id,
-            "state": (await call_signal_manager.get_user_state(real_user_id)).value,
-            "active_call_id": await call_signal_manager.get_user_call_id(real_user_id),
-        },
-    )
+    await send_call_init(real_user_id)
 
     try:
         # 3) MAIN LOOP
         while websocket.client_state == WebSocketState.CONNECTED:
             try:
-                raw = await websocket.receive_json()
+                raw = await receive_frame(websocket)
             except WebSocketDisconnect:
                 break
             except Exception:
@@ -106,85 +201,7 @@ async def websocket_call(websocket: WebSocket, user_id: str):
                 )
                 continue
 
-            if not isinstance(raw, dict):
-                await call_signal_manager.send_error(
-                    websocket,
-                    code="invalid_payload",
-                    message="Payload must be an object",
-                )
-                continue
-
-            try:
-                msg = parse_call_message(raw)
-            except ValueError as e:
-                await call_signal_manager.send_error(
-                    websocket,
-                    code="invalid_message",
-                    message=str(e),
-                )
-                continue
-
-            print(f"📥 CALL {real_user_id} → {msg.type}: {raw}")
-
-            try:
-                # 4) DISPATCH BY MESSAGE TYPE
-                if isinstance(msg, CallInviteMessage):
-                    ack = await call_service.invite(real_user_id, msg)
-                    await call_signal_manager.send_to_user(real_user_id, ack)
-
-                elif isinstance(msg, CallAnswerMessage):
-                    ack = await call_service.answer(real_user_id, msg)
-                    await call_signal_manager.send_to_user(real_user_id, ack)
-
-                elif isinstance(msg, CallRejectMessage):
-                    ack = await call_service.reject(real_user_id, msg)
-                    await call_signal_manager.send_to_user(real_user_id, ack)
-
-                elif isinstance(msg, CallCancelMessage):
-                    ack = await call_service.cancel(real_user_id, msg)
-                    await call_signal_manager.send_to_user(real_user_id, ack)
-
-                elif isinstance(msg, CallEndMessage):
-                    ack = await call_service.end(real_user_id, msg)
-                    await call_signal_manager.send_to_user(real_user_id, ack)
-
-                elif isinstance(msg, WebRTCOfferMessage):
-                    await call_service.relay_offer(real_user_id, msg)
-
-                elif isinstance(msg, WebRTCAnswerMessage):
-                    await call_service.relay_answer(real_user_id, msg)
-
-                elif isinstance(msg, IceCandidateMessage):
-                    await call_service.relay_ice(real_user_id, msg)
-
-                elif isinstance(msg, CallHeartbeatMessage):
-                    # Keep it simple: just ACK. You could update last-seen here.
-                    await call_signal_manager.send_to_user(
-                        real_user_id,
-                        {"type": "call.heartbeat_ack", "call_id": msg.call_id},
-                    )
-
-                else:
-                    await call_signal_manager.send_error(
-                        websocket,
-                        code="unknown_type",
-                        message=f"Unhandled message type: {msg.type}",
-                    )
-
-            except CallServiceError as e:
-                await call_signal_manager.send_error(
-                    websocket,
-                    code=e.code,
-                    message=e.message,
-                )
-            except Exception as e:
-                # Safety net – never crash the WS loop
-                await call_signal_manager.send_error(
-                    websocket,
-                    code="internal_error",
-                    message="Internal error in call handling",
-                )
-                # You can log e / traceback here.
+            await handle_call_message(websocket, real_user_id, raw)
 
     finally:
         # 5) CLEANUP: unregister and let service handle any active call
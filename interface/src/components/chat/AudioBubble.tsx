@@ -6,7 +6,13 @@ import { Play, Pause } from "lucide-react";
 
 const BASE = import.meta.env.VITE_API_BASE_URL ?? "http://127.0.0.1:8000";
 
-export default function AudioBubble({ url }: { url: string }) {
+export default function AudioBubble({
+  url,
+  waveform,
+}: {
+  url: string;
+  waveform?: number[] | null;   // peaks 0–100 from the server, no download needed
+}) {
   const finalUrl = url.startsWith("http") ? url : BASE + url;
   const audioRef = useRef<HTMLAudioElement | null>(null);
 
@@ -48,6 +54,12 @@ export default function AudioBubble({ url }: { url: string }) {
     };
   }, []);
 
+  const seek = (fraction: number) => {
+    const audio = audioRef.current;
+    if (!audio || !audio.duration) return;
+    audio.currentTime = fraction * audio.duration;
+  };
+
   const togglePlay = () => {
     const audio = audioRef.current;
     if (!audio) return;
@@ -91,15 +103,30 @@ export default function AudioBubble({ url }: { url: string }) {
 
       {/* Bar + Time */}
       <div className="flex flex-col justify-center w-52">
-        <div className="relative h-[3px] rounded-full bg-white/10 overflow-hidden">
-          <div
-            className="absolute left-0 top-0 h-full bg-gradient-to-r 
-                       from-blue-400 via-indigo-400 to-purple-500
-                       shadow-[0_0_8px_rgba(80,150,255,0.6)]
-                       transition-all duration-100 ease-linear"
-            style={{ width: `${progress}%` }}
-          ></div>
-        </div>
+        {waveform && waveform.length > 0 ? (
+          <div className="flex items-center gap-[2px] h-6 cursor-pointer">
+            {waveform.map((peak, i) => (
+              <div
+                key={i}
+                onClick={() => seek(i / waveform.length)}
+                className={`flex-1 rounded-full transition-colors duration-100 ${
+                  (i / waveform.length) * 100 < progress ? "bg-indigo-400" : "bg-white/20"
+                }`}
+                style={{ height: `${Math.max(peak, 8)}%` }}
+              />
+            ))}
+          </div>
+        ) : (
+          <div className="relative h-[3px] rounded-full bg-white/10 overflow-hidden">
+            <div
+              className="absolute left-0 top-0 h-full bg-gradient-to-r 
+                         from-blue-400 via-indigo-400 to-purple-500
+                         shadow-[0_0_8px_rgba(80,150,255,0.6)]
+                         transition-all duration-100 ease-linear"
+              style={{ width: `${progress}%` }}
+            ></div>
+          </div>
+        )}
 
         <div className="flex justify-between mt-1 text-[11px] text-white/60 font-mono">
           <span>{formatTime(currentTime)}</span>
@@ -181,7 +181,7 @@ const ChatMessageBubble = ({
             )} */}
             {msg.message_type === "audio" && (
                 <div key={msg.id} className={`chat-bubble ${msg.sender}`}>
-                  <AudioBubble url={msg.media_url} />
+                  <AudioBubble url={msg.media_url} waveform={msg.waveform} />
                 </div>
             )}
 
@@ -14,6 +14,7 @@ import {
   setConnected,
   setError,
   updateReaction,
+  updateMedia,
   removeReaction,
 } from "@/redux/slices/chatSlice";
 
@@ -32,6 +33,7 @@ import ChatEmojiDrawer from "@/components/chat/ChatEmojiDrawer";
 import ChatImageZoom from "@/components/chat/ChatImageZoom";
 import { createVoiceRecorder } from "@/utils/voiceRecorder";
 import { sendVoiceMessage } from "@/utils/sendVoiceUpload";
+import { makeAbsoluteUrl } from "@/utils/url";
 
 import { RootState } from "@/redux/store";
 import "@/components/chat/chat.css";
@@ -158,6 +160,8 @@ const Chat = () => {
               media_id: raw.media_id,
               media_url: raw.media_url,
               thumb_url: raw.thumb_url,
+              duration_ms: raw.duration_ms,
+              waveform: raw.waveform,
               reactions: raw.reactions || {},
             })
           );
@@ -308,6 +312,18 @@ const Chat = () => {
           );
           break;
 
+        case "media_processed":
+          dispatch(
+            updateMedia({
+              mediaId: evt.media_id,
+              thumb_url: makeAbsoluteUrl(evt.thumb_url),
+              media_url: evt.media_url,
+              duration_ms: evt.duration_ms,
+              waveform: evt.waveform,
+            })
+          );
+          break;
+
         case "typing":
           if (evt.from === partnerId) {
             setIsTyping(true);
@@ -131,6 +131,8 @@
     media_id?: string | null;
     media_url?: string | null;
     thumb_url?: string | null;
+    duration_ms?: number | null;
+    waveform?: number[] | null;     // voice notes: peaks 0–100
 
     reactions?: Record<string, string>;
   }
@@ -218,6 +220,8 @@
           media_id: p.media_id,
           media_url: p.media_url,
           thumb_url: p.thumb_url,
+          duration_ms: p.duration_ms,
+          waveform: p.waveform,
         
           sender_id: p.sender_id,
           receiver_id: p.receiver_id,
@@ -297,6 +301,26 @@
         }
       },
       
+      updateMedia(state, action: PayloadAction<{
+        mediaId: string;
+        thumb_url?: string | null;
+        media_url?: string | null;
+        duration_ms?: number | null;
+        waveform?: number[] | null;
+      }>) {
+        const { mediaId, thumb_url, media_url, duration_ms, waveform } = action.payload;
+
+        for (const convo of Object.values(state.conversations)) {
+          for (const msg of convo) {
+            if (msg.media_id !== mediaId) continue;
+            if (thumb_url) msg.thumb_url = thumb_url;
+            if (media_url) msg.media_url = media_url;   // voice note was transcoded
+            if (duration_ms) msg.duration_ms = duration_ms;
+            if (waveform) msg.waveform = waveform;
+          }
+        }
+      },
+
       removeReaction(state, action: PayloadAction<{
         messageId: string;
         userId: string;
@@ -324,6 +348,7 @@
     setError,
     clearConversation,
     updateReaction,
+    updateMedia,
     removeReaction,
   } = chatSlice.actions;
 
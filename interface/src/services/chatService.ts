@@ -55,6 +55,23 @@ export type EventMessage =
     message_type?: string;
   }
   
+  // thumbnails / metadata ready after upload (processed in the background)
+  | {
+      type: "media_processed";
+      media_id: string;
+      kind: string;
+      processed: boolean;
+      thumb_url?: string | null;
+      width?: number | null;
+      height?: number | null;
+      duration_ms?: number | null;
+      // voice notes: transcoded file + waveform peaks (0–100)
+      media_url?: string;
+      file_type?: string;
+      waveform?: number[];
+      error?: string;
+    }
+
   // 🔥 ADD THESE — EXACTLY LIKE THIS
   | { type: "typing"; from: string }
   | { type: "stop_typing"; from: string };